@@ -6,7 +6,10 @@ from observicia.core.context_manager import ObservabilityContext
 from observicia.core.policy_engine import PolicyEngine, PolicyResult, Policy
 from observicia.core.tracing_manager import TracingClient
 from observicia.core.token_tracker import TokenTracker
+from observicia.core.budget_engine import Budget, BudgetExceededError
 from observicia.core.patch_manager import PatchManager
+from observicia.utils.token_helpers import (configure_encoder_registry,
+                                            configure_batch_counting)
 from typing import List, Optional, Dict, Any
 import os
 import yaml
@@ -48,15 +51,32 @@ def init() -> None:
             opa_endpoint = config.get("opa_endpoint", None)
             policies = config.get("policies", [])
             logging_config = config.get("logging", default_logging)
+            token_config = config.get("tokens") or {}
+            streaming_config = config.get("streaming")
+            budgets = config.get("budgets", [])
+            opa_config = config.get("opa")
+
+            configure_encoder_registry(
+                max_size=token_config.get("encoder_cache_size"),
+                aliases=token_config.get("encoder_aliases"))
+            configure_batch_counting(
+                threshold=token_config.get("batch_threshold"),
+                num_threads=token_config.get("batch_threads"))
 
             policy_objects = [Policy(**policy)
                               for policy in policies] if policies else None
+            budget_objects = [Budget(**budget)
+                              for budget in budgets] if budgets else None
 
             ObservabilityContext.initialize(service_name=service_name,
                                             otel_endpoint=otel_endpoint,
                                             opa_endpoint=opa_endpoint,
                                             policies=policy_objects,
-                                            logging_config=logging_config)
+                                            logging_config=logging_config,
+                                            token_config=token_config,
+                                            streaming_config=streaming_config,
+                                            budgets=budget_objects,
+                                            opa_config=opa_config)
 
             # Auto-detect and patch installed providers
             patch_manager = PatchManager()
@@ -81,5 +101,6 @@ from observicia.utils.helpers import get_current_span, get_current_context
 
 __all__ = [
     "init", "trace", "trace_rag", "trace_stream", "get_current_span",
-    "get_current_context", "PolicyResult", "__version__"
+    "get_current_context", "PolicyResult", "Budget", "BudgetExceededError",
+    "__version__"
 ]
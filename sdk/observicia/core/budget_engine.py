@@ -0,0 +1,290 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from opentelemetry import baggage
+
+from .token_tracker import USAGE_DIMENSIONS, _BucketRing
+
+# Scopes a budget can be keyed by; "global" shares one budget across all calls
+BUDGET_SCOPES = ("global", "tenant_id") + USAGE_DIMENSIONS
+
+
+@dataclass
+class Budget:
+    """A token limit applied per value of one usage scope."""
+    name: str
+    limit: int  # tokens per window, or bucket capacity for token buckets
+    scope: str = "user_id"
+    window_seconds: int = 60
+    algorithm: str = "sliding_window"  # "sliding_window" or "token_bucket"
+    action: str = "reject"  # "reject" or "delay"
+    max_wait_seconds: float = 5.0
+    match: Dict[str, str] = field(
+        default_factory=dict)  # only apply to matching dimensions
+
+    def __post_init__(self) -> None:
+        if self.scope not in BUDGET_SCOPES:
+            raise ValueError(f"Unknown budget scope: {self.scope}")
+        if self.algorithm not in ("sliding_window", "token_bucket"):
+            raise ValueError(f"Unknown budget algorithm: {self.algorithm}")
+        if self.action not in ("reject", "delay"):
+            raise ValueError(f"Unknown budget action: {self.action}")
+        if self.limit <= 0 or self.window_seconds <= 0:
+            raise ValueError(
+                f"Budget {self.name} needs a positive limit and window")
+
+
+@dataclass
+class BudgetDecision:
+    """Outcome of checking a request against the budgets."""
+    allowed: bool
+    budget: Optional[str] = None  # budget that limited the request
+    wait_seconds: float = 0.0  # time until the request could be admitted
+    remaining: Optional[int] = None  # tokens left in the tightest budget
+    charged_at: Optional[float] = None  # when admitted tokens were charged
+
+
+class BudgetExceededError(ValueError):
+    """Raised when a request would exceed a token budget."""
+
+    def __init__(self, decision: BudgetDecision) -> None:
+        super().__init__(
+            f"Token budget exceeded: {decision.budget} "
+            f"(retry in {decision.wait_seconds:.2f}s)")
+        self.decision = decision
+
+
+class _SlidingWindow:
+    """Token usage over a sliding window, approximated by ten buckets."""
+
+    __slots__ = ("ring", "window")
+
+    def __init__(self, window_seconds: int) -> None:
+        resolution = max(1, window_seconds // 10)
+        self.ring = _BucketRing(resolution, -(-window_seconds // resolution))
+        self.window = window_seconds
+
+    def available(self, limit: int, now: float) -> int:
+        prompt_tokens, completion_tokens = self.ring.sum(now, self.window)
+        return limit - prompt_tokens - completion_tokens
+
+    def wait_seconds(self, tokens: int, now: float) -> float:
+        # Usage only frees up when the oldest bucket leaves the window
+        resolution = self.ring.resolution
+        return resolution - now % resolution
+
+    def charge(self, tokens: int, now: float) -> None:
+        self.ring.add(now, tokens, 0)
+
+    def refund(self, limit: int, tokens: int, charged_at: float) -> None:
+        # Buckets that already left the ring have nothing left to refund
+        self.ring.add(charged_at, -tokens, 0)
+
+
+class _TokenBucket:
+    """Bucket holding up to `limit` tokens, refilled over the window."""
+
+    __slots__ = ("tokens", "updated", "rate")
+
+    def __init__(self, limit: int, window_seconds: int, now: float) -> None:
+        self.tokens = float(limit)
+        self.updated = now
+        self.rate = limit / window_seconds
+
+    def available(self, limit: int, now: float) -> int:
+        self.tokens = min(float(limit),
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return int(self.tokens)
+
+    def wait_seconds(self, tokens: int, now: float) -> float:
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def charge(self, tokens: int, now: float) -> None:
+        # Completion tokens may push the bucket into debt
+        self.tokens -= tokens
+
+    def refund(self, limit: int, tokens: int, charged_at: float) -> None:
+        self.tokens = min(float(limit), self.tokens + tokens)
+
+
+class BudgetEngine:
+    """
+    Local token budget and rate-limit enforcement.
+
+    Requests are admitted against every matching budget using their
+    estimated prompt tokens; completion tokens are charged afterwards via
+    `record_usage`, which is registered as a `TokenTracker` listener.
+    Per-key limiter state is kept for at most `max_keys` scope values.
+    """
+
+    def __init__(self, budgets: List[Budget], max_keys: int = 10000) -> None:
+        """
+        Initialize BudgetEngine with budgets.
+
+        Args:
+            budgets: Budgets to enforce
+            max_keys: Maximum number of (budget, scope value) limiters kept
+        """
+        self.budgets = list(budgets)
+        self._max_keys = max_keys
+        self._limiters: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self,
+                    tokens: int,
+                    dimensions: Dict[str, Optional[str]],
+                    now: Optional[float] = None) -> BudgetDecision:
+        """
+        Admit a request if every matching budget has room for its tokens.
+
+        Tokens are only charged when the request is admitted by all budgets.
+        """
+        now = time.time() if now is None else now
+        dimensions = self._with_tenant(dimensions)
+
+        with self._lock:
+            limiters = self._matching_limiters(dimensions, now)
+            denied: Optional[BudgetDecision] = None
+            tightest: Optional[str] = None
+            remaining: Optional[int] = None
+            for budget, limiter in limiters:
+                available = limiter.available(budget.limit, now)
+                if tokens <= available:
+                    if remaining is None or available - tokens < remaining:
+                        tightest, remaining = budget.name, available - tokens
+                    continue
+
+                # Wait for the budget that takes longest to make room
+                wait = float("inf") if tokens > budget.limit else \
+                    limiter.wait_seconds(tokens, now)
+                if denied is None or wait > denied.wait_seconds:
+                    denied = BudgetDecision(allowed=False,
+                                            budget=budget.name,
+                                            wait_seconds=wait,
+                                            remaining=max(0, available))
+            if denied is not None:
+                return denied
+
+            for _, limiter in limiters:
+                limiter.charge(tokens, now)
+            return BudgetDecision(allowed=True,
+                                  budget=tightest,
+                                  remaining=remaining,
+                                  charged_at=now)
+
+    def acquire(self, tokens: int,
+                dimensions: Dict[str, Optional[str]]) -> Tuple[BudgetDecision,
+                                                               float]:
+        """
+        Admit a request, sleeping while a "delay" budget refills.
+
+        Returns:
+            The final decision and the total time waited in seconds
+
+        Raises:
+            BudgetExceededError: If the request is rejected or would wait
+                longer than the limiting budget allows
+        """
+        waited = 0.0
+        while True:
+            decision = self.try_acquire(tokens, dimensions)
+            if decision.allowed:
+                return decision, waited
+            delay = self._delay(decision, waited)
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(
+            self, tokens: int,
+            dimensions: Dict[str, Optional[str]]) -> Tuple[BudgetDecision,
+                                                           float]:
+        """Admit a request, awaiting while a "delay" budget refills."""
+        waited = 0.0
+        while True:
+            decision = self.try_acquire(tokens, dimensions)
+            if decision.allowed:
+                return decision, waited
+            delay = self._delay(decision, waited)
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def record_usage(self, provider: str, prompt_tokens: int,
+                     completion_tokens: int,
+                     dimensions: Dict[str, Optional[str]]) -> None:
+        """Charge completion tokens to the budgets matching a request."""
+        if completion_tokens <= 0:
+            return
+        now = time.time()
+        dimensions = self._with_tenant({**dimensions, "provider": provider})
+        with self._lock:
+            for _, limiter in self._matching_limiters(dimensions, now):
+                limiter.charge(completion_tokens, now)
+
+    def refund(self, tokens: int, dimensions: Dict[str, Optional[str]],
+               decision: BudgetDecision) -> None:
+        """Give back the tokens of an admitted request that was never sent."""
+        if not decision.allowed or decision.charged_at is None:
+            return
+        dimensions = self._with_tenant(dimensions)
+        with self._lock:
+            for budget, limiter in self._matching_limiters(dimensions,
+                                                           time.time(),
+                                                           create=False):
+                limiter.refund(budget.limit, tokens, decision.charged_at)
+
+    def _delay(self, decision: BudgetDecision, waited: float) -> float:
+        """Get how long to wait before retrying, or raise if not allowed."""
+        budget = next(b for b in self.budgets if b.name == decision.budget)
+        if (budget.action != "delay" or
+                waited + decision.wait_seconds > budget.max_wait_seconds):
+            raise BudgetExceededError(decision)
+        return max(decision.wait_seconds, 0.001)
+
+    def _matching_limiters(self,
+                           dimensions: Dict[str, Optional[str]],
+                           now: float,
+                           create: bool = True) -> List[Tuple[Budget, Any]]:
+        """Get the limiter of every budget applying to the dimensions."""
+        limiters = []
+        for budget in self.budgets:
+            if any(
+                    dimensions.get(name) != value
+                    for name, value in budget.match.items()):
+                continue
+            value = "*" if budget.scope == "global" else dimensions.get(
+                budget.scope)
+            if value is None:
+                continue
+
+            key = (budget.name, value)
+            limiter = self._limiters.get(key)
+            if limiter is None and not create:
+                continue
+            if limiter is None:
+                limiter = _TokenBucket(
+                    budget.limit, budget.window_seconds, now
+                ) if budget.algorithm == "token_bucket" else _SlidingWindow(
+                    budget.window_seconds)
+                self._limiters[key] = limiter
+                if len(self._limiters) > self._max_keys:
+                    self._limiters.popitem(last=False)
+            else:
+                self._limiters.move_to_end(key)
+            limiters.append((budget, limiter))
+        return limiters
+
+    @staticmethod
+    def _with_tenant(
+            dimensions: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        """Add the tenant id carried in OpenTelemetry baggage."""
+        if dimensions.get("tenant_id") is not None:
+            return dimensions
+        tenant_id = baggage.get_baggage("tenant_id")
+        return {
+            **dimensions, "tenant_id": str(tenant_id) if tenant_id else None
+        }
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to one remote endpoint.
+
+    The outcomes of the last `window_size` calls are kept. Once at least
+    `minimum_calls` were made, the circuit opens when the share of failed
+    calls reaches `failure_rate_threshold` or the share of calls slower
+    than `slow_call_seconds` reaches `slow_call_rate_threshold`. An open
+    circuit rejects calls for `open_seconds`, then lets up to
+    `half_open_calls` probe calls through: a successful, fast probe closes
+    the circuit and any failed or slow probe opens it again.
+    """
+
+    def __init__(self,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 2.0,
+                 slow_call_rate_threshold: float = 0.5,
+                 window_size: int = 20,
+                 minimum_calls: int = 10,
+                 open_seconds: float = 30.0,
+                 half_open_calls: int = 1) -> None:
+        """
+        Initialize CircuitBreaker.
+
+        Args:
+            failure_rate_threshold: Share of failed calls that opens the circuit
+            slow_call_seconds: Duration above which a call counts as slow
+            slow_call_rate_threshold: Share of slow calls that opens the circuit
+            window_size: Number of recent calls the rates are computed over
+            minimum_calls: Calls needed in the window before it can open
+            open_seconds: Seconds the circuit stays open before probing
+            half_open_calls: Probe calls allowed while half-open
+        """
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once it may probe."""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Check if a call may be made, claiming a probe when half-open."""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: bool, duration: float) -> None:
+        """Record the outcome of a call that was allowed."""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if success and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open()
+                return
+            if self._state == OPEN:
+                return  # a call that started before the circuit opened
+
+            self._calls.append((not success, slow))
+            if len(self._calls) < self.minimum_calls:
+                return
+            failures = sum(failed for failed, _ in self._calls)
+            slow_calls = sum(slow for _, slow in self._calls)
+            if (failures >= self.failure_rate_threshold * len(self._calls)
+                    or slow_calls >=
+                    self.slow_call_rate_threshold * len(self._calls)):
+                self._open()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the calls in the window and the number of rejected calls."""
+        with self._lock:
+            return {
+                "window_calls": len(self._calls),
+                "window_failures": sum(failed for failed, _ in self._calls),
+                "window_slow_calls": sum(slow for _, slow in self._calls),
+                "rejected": self.rejected
+            }
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+        self._calls.clear()
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
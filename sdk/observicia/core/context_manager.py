@@ -1,3 +1,4 @@
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Set, Literal, Any
 from datetime import datetime
@@ -10,8 +11,14 @@ from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 
 from .policy_engine import PolicyEngine, PolicyResult, Policy
+from .budget_engine import Budget, BudgetEngine
 from ..utils.logging import FileSpanExporter, ObserviciaLogger
 from ..utils.exporter import SQLiteSpanExporter, RedisSpanExporter
+from ..utils.token_helpers import MessageTokenCache
+
+# Transaction started last in the current thread or task
+_current_transaction: ContextVar[Optional[str]] = ContextVar(
+    "observicia_transaction", default=None)
 
 
 @dataclass
@@ -74,7 +81,11 @@ class ContextManager:
                  otel_endpoint: Optional[str] = None,
                  opa_endpoint: Optional[str] = None,
                  policies: Optional[List[Policy]] = None,
-                 logging_config: Optional[Dict] = None):
+                 logging_config: Optional[Dict] = None,
+                 token_config: Optional[Dict] = None,
+                 streaming_config: Optional[Dict] = None,
+                 budgets: Optional[List[Budget]] = None,
+                 opa_config: Optional[Dict] = None):
         """
         Initialize the context manager.
         
@@ -84,16 +95,40 @@ class ContextManager:
             opa_endpoint: OPA server endpoint for policy evaluation
             policies: List of Policy objects defining available policies
             logging_config: Configuration dictionary for logging options
+            token_config: Configuration dictionary for token counting options
+            streaming_config: Configuration dictionary for streaming responses
+            budgets: List of Budget objects limiting token usage
+            opa_config: Connection pool, timeout and retry options for OPA
         """
         self._sessions: Dict[str, TraceContext] = {}
         self._service_name = service_name
         self._current_user_id: Optional[str] = None
         self._active_transactions: Dict[str, Transaction] = {}
-
-        # Initialize policy engine if OPA endpoint is provided
+        # Transaction that was current when each active one started
+        self._enclosing_transactions: Dict[str, Optional[str]] = {}
+
+        # Streaming mode ("full" or "bounded") and bounded-mode buffer sizes
+        self.streaming_config = streaming_config or {"mode": "full"}
+
+        # Per-session/transaction cache of message token counts
+        self._token_config = token_config or {}
+        prompt_cache_config = self._token_config.get("prompt_cache", {})
+        self.token_cache = MessageTokenCache(
+            max_scopes=prompt_cache_config.get("max_scopes", 1024),
+            max_entries_per_scope=prompt_cache_config.get(
+                "max_entries_per_scope", 512)) if prompt_cache_config.get(
+                    "enabled", True) else None
+
+        # Initialize policy engine if OPA endpoint or local policies are provided
+        has_local_policies = any(p.backend == "local"
+                                 for p in policies or [])
         self.policy_engine = PolicyEngine(
             opa_endpoint=opa_endpoint,
-            policies=policies) if opa_endpoint else None
+            policies=policies,
+            **(opa_config or {})) if opa_endpoint or has_local_policies else None
+
+        # Enforce token budgets locally, before requests reach the provider
+        self.budget_engine = BudgetEngine(budgets) if budgets else None
 
         # Use default logging configuration if none provided
         self._logging_config = logging_config or {
@@ -134,10 +169,29 @@ class ContextManager:
             provider.add_span_processor(file_processor)
 
         # Add SQLite exporter if enabled
-        if (self._logging_config.get("sqlite", {}).get("enabled", False)
-                and self._logging_config["sqlite"].get("database", None)):
+        sqlite_config = self._logging_config.get("sqlite", {})
+        if (sqlite_config.get("enabled", False)
+                and sqlite_config.get("database", None)):
             sqlite_processor = BatchSpanProcessor(
-                SQLiteSpanExporter(self._logging_config["sqlite"]["database"]))
+                SQLiteSpanExporter(
+                    sqlite_config["database"],
+                    synchronous=sqlite_config.get("synchronous", "NORMAL"),
+                    cache_size_kib=sqlite_config.get("cache_size_kib",
+                                                     16384),
+                    busy_timeout_ms=sqlite_config.get("busy_timeout_ms",
+                                                      5000),
+                    retention_hours=sqlite_config.get("retention_hours"),
+                    minute_rollup_retention_hours=sqlite_config.get(
+                        "minute_rollup_retention_hours", 7 * 24),
+                    hour_rollup_retention_hours=sqlite_config.get(
+                        "hour_rollup_retention_hours", 90 * 24),
+                    retention_interval_seconds=sqlite_config.get(
+                        "retention_interval_seconds", 300),
+                    retention_chunk_size=sqlite_config.get(
+                        "retention_chunk_size", 5000),
+                    vacuum_pages=sqlite_config.get("vacuum_pages", 1000),
+                    vacuum_interval_hours=sqlite_config.get(
+                        "vacuum_interval_hours")))
             provider.add_span_processor(sqlite_processor)
 
         # Add Redis exporter if enabled
@@ -152,7 +206,11 @@ class ContextManager:
                     password=redis_config.get("password"),
                     key_prefix=redis_config.get("key_prefix",
                                                 "observicia:telemetry:"),
-                    retention_hours=redis_config.get("retention_hours", 24)))
+                    retention_hours=redis_config.get("retention_hours", 24),
+                    max_connections=redis_config.get("max_connections"),
+                    mode=redis_config.get("mode", "hash"),
+                    stream_key=redis_config.get("stream_key"),
+                    stream_maxlen=redis_config.get("stream_maxlen", 100000)))
             provider.add_span_processor(redis_processor)
         trace.set_tracer_provider(provider)
         self._tracer = trace.get_tracer(service_name)
@@ -180,6 +238,9 @@ class ContextManager:
                                   parent_id=parent_id)
 
         self._active_transactions[transaction_id] = transaction
+        self._enclosing_transactions[transaction_id] = \
+            _current_transaction.get()
+        _current_transaction.set(transaction_id)
 
         if hasattr(self, '_logger'):
             # Log to main logger
@@ -256,6 +317,11 @@ class ContextManager:
                     })
 
         del self._active_transactions[transaction_id]
+        enclosing_id = self._enclosing_transactions.pop(transaction_id, None)
+        if _current_transaction.get() == transaction_id:
+            _current_transaction.set(enclosing_id)
+        if self.token_cache is not None:
+            self.token_cache.evict(transaction_id)
 
     def get_transaction(self, transaction_id: str) -> Optional[Transaction]:
         """Get transaction details by ID."""
@@ -265,6 +331,38 @@ class ContextManager:
         """Get all active transactions."""
         return self._active_transactions.copy()
 
+    def get_current_transaction_id(self) -> Optional[str]:
+        """
+        Get the active transaction of the calling thread or task.
+
+        A `transaction_id` in OpenTelemetry baggage takes precedence over
+        the transaction last started in the current context.
+        """
+        transaction_id = baggage.get_baggage(
+            "transaction_id") or _current_transaction.get()
+        if transaction_id and transaction_id in self._active_transactions:
+            return str(transaction_id)
+        return None
+
+    def get_token_cache_scope(self) -> Optional[str]:
+        """Get the transaction or session id that prompt token counts are cached under."""
+        transaction_id = self.get_current_transaction_id()
+        if transaction_id is not None:
+            return transaction_id
+        session_id = baggage.get_baggage("session_id")
+        if session_id and session_id in self._sessions:
+            return str(session_id)
+        return None
+
+    def get_usage_dimensions(self) -> Dict[str, Optional[str]]:
+        """Get the user, session and transaction token usage is attributed to."""
+        session_id = baggage.get_baggage("session_id")
+        return {
+            "user_id": self._current_user_id,
+            "session_id": str(session_id) if session_id else None,
+            "transaction_id": self.get_current_transaction_id()
+        }
+
     async def create_span(
         self,
         name: str,
@@ -298,6 +396,12 @@ class ContextManager:
         self._sessions[session_id] = context
         return context
 
+    def end_session(self, session_id: str) -> None:
+        """End a session context and release its cached state"""
+        self._sessions.pop(session_id, None)
+        if self.token_cache is not None:
+            self.token_cache.evict(session_id)
+
     async def evaluate_policies(
             self,
             context: TraceContext,
@@ -328,14 +432,22 @@ class ObservabilityContext:
                    otel_endpoint: Optional[str] = None,
                    opa_endpoint: Optional[str] = None,
                    policies: Optional[List[Policy]] = None,
-                   logging_config: Optional[Dict] = None) -> None:
+                   logging_config: Optional[Dict] = None,
+                   token_config: Optional[Dict] = None,
+                   streaming_config: Optional[Dict] = None,
+                   budgets: Optional[List[Budget]] = None,
+                   opa_config: Optional[Dict] = None) -> None:
         """Initialize the global context manager."""
         if cls._instance is None:
             cls._instance = ContextManager(service_name,
                                            otel_endpoint=otel_endpoint,
                                            opa_endpoint=opa_endpoint,
                                            policies=policies,
-                                           logging_config=logging_config)
+                                           logging_config=logging_config,
+                                           token_config=token_config,
+                                           streaming_config=streaming_config,
+                                           budgets=budgets,
+                                           opa_config=opa_config)
 
     @classmethod
     def get_current(cls) -> Optional[ContextManager]:
@@ -353,6 +465,13 @@ class ObservabilityContext:
             raise RuntimeError("ObservabilityContext not initialized")
         return cls._instance.create_session(session_id, initial_context)
 
+    @classmethod
+    def end_session(cls, session_id: str) -> None:
+        """End a session context"""
+        if cls._instance is None:
+            raise RuntimeError("ObservabilityContext not initialized")
+        cls._instance.end_session(session_id)
+
     @classmethod
     def set_user_id(cls, user_id: Optional[str]) -> None:
         """Set the user ID for all new traces"""
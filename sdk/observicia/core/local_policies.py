@@ -0,0 +1,115 @@
+import importlib
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+# Rules understood by the local evaluator
+LOCAL_RULES = ("max_prompt_tokens", "max_completion_tokens", "max_total_tokens",
+               "allowed_models", "deny_patterns", "function")
+
+
+class _CompiledRules:
+    """Rules of one policy with patterns compiled and functions imported."""
+
+    __slots__ = ("limits", "allowed_models", "deny_patterns", "function")
+
+    def __init__(self, rules: Dict[str, Any]) -> None:
+        unknown = set(rules) - set(LOCAL_RULES)
+        if unknown:
+            raise ValueError(
+                f"Unknown local policy rules: {', '.join(sorted(unknown))}")
+
+        self.limits: List[Tuple[str, str, int]] = [
+            (rule, attribute, rules[rule])
+            for rule, attribute in (("max_prompt_tokens", "prompt.tokens"),
+                                    ("max_completion_tokens",
+                                     "completion.tokens"),
+                                    ("max_total_tokens", "total.tokens"))
+            if rule in rules
+        ]
+        self.allowed_models = set(
+            rules["allowed_models"]) if "allowed_models" in rules else None
+        self.deny_patterns: List[Pattern] = [
+            re.compile(pattern) for pattern in rules.get("deny_patterns", [])
+        ]
+        self.function: Optional[Callable[[Dict[str, Any]], Any]] = None
+        if "function" in rules:
+            module_name, _, function_name = rules["function"].partition(":")
+            self.function = getattr(importlib.import_module(module_name),
+                                    function_name)
+
+
+class LocalPolicyEvaluator:
+    """
+    In-process evaluator for simple policies that don't need OPA.
+
+    Policies with `backend: local` declare `rules`: token limits checked
+    against the span attributes, a model allowlist, regular expressions
+    denied in the prompt or completion, and an optional Python function
+    (`module:function`) that receives the evaluation input and returns a
+    bool or an OPA-style `{"allow": ..., "violations": [...]}` dict.
+    Results use the same shape as OPA's data API.
+    """
+
+    def __init__(self) -> None:
+        self._compiled: Dict[Tuple[str, str], _CompiledRules] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, policy: Any) -> None:
+        """Compile a policy's rules ahead of evaluation, raising if invalid."""
+        self._rules(policy)
+
+    def evaluate(self, policy: Any, eval_context: Dict[str,
+                                                       Any]) -> Dict[str, Any]:
+        """Evaluate a policy's rules against the evaluation input."""
+        rules = self._rules(policy)
+        attributes = eval_context.get("trace_context",
+                                      {}).get("attributes", {}) or {}
+        violations = []
+
+        for _, attribute, limit in rules.limits:
+            value = attributes.get(attribute)
+            if value is not None and value > limit:
+                violations.append(f"{attribute} {value} exceeds {limit}")
+
+        model = attributes.get("llm.model")
+        if rules.allowed_models is not None and model not in rules.allowed_models:
+            violations.append(f"Model {model} is not allowed")
+
+        for field in ("prompt", "completion"):
+            text = eval_context.get(field)
+            if not isinstance(text, str):
+                continue
+            for pattern in rules.deny_patterns:
+                if pattern.search(text):
+                    violations.append(
+                        f"{field.capitalize()} matches denied pattern "
+                        f"{pattern.pattern}")
+
+        result: Dict[str, Any] = {}
+        if rules.function is not None:
+            outcome = rules.function(eval_context)
+            if isinstance(outcome, dict):
+                result = dict(outcome)
+                violations.extend(result.get("violations", []))
+                if not result.get("allow", True) and not result.get(
+                        "violations"):
+                    violations.append(f"{rules.function.__name__} denied")
+            elif not outcome:
+                violations.append(f"{rules.function.__name__} denied")
+
+        result.update({"allow": not violations, "violations": violations})
+        return {"result": result}
+
+    def _rules(self, policy: Any) -> _CompiledRules:
+        """Get the compiled rules of a policy, compiling them once."""
+        # Keyed on content, so edited or re-created rules are recompiled
+        key = (policy.name,
+               json.dumps(policy.rules or {}, sort_keys=True, default=str))
+        rules = self._compiled.get(key)
+        if rules is None:
+            rules = _CompiledRules(policy.rules or {})
+            with self._lock:
+                self._compiled[key] = rules
+        return rules
@@ -1,10 +1,13 @@
 import asyncio
 from functools import wraps
+from datetime import timedelta
 from typing import Dict, Optional, Any
 from contextlib import contextmanager
 
 from observicia.core.context_manager import ObservabilityContext
-from observicia.core.token_tracker import TokenTracker
+from observicia.core.token_tracker import TokenTracker, UsageBackend
+from observicia.core.token_backends import MmapUsageBackend, RedisUsageBackend
+from observicia.core.budget_engine import BudgetEngine
 from observicia.patchers import DEFAULT_PATCHERS
 
 
@@ -15,11 +18,64 @@ class PatchManager:
 
     def __init__(self) -> None:
         self._context = ObservabilityContext.get_current()
-        self._token_tracker = TokenTracker()
+        self._token_tracker = self._create_token_tracker()
+        budget_engine = getattr(self._context, 'budget_engine', None)
+        if isinstance(budget_engine, BudgetEngine):
+            # Charge completion tokens to budgets once usage is known
+            self._token_tracker.add_listener(budget_engine.record_usage)
         self._active_patches: Dict[str, Any] = {}
         self._original_functions: Dict[str, Any] = {}
         self._log_file = getattr(self._context, '_log_file', None)
 
+    def _create_token_tracker(self) -> TokenTracker:
+        """Create the token tracker from the `tokens.usage` configuration."""
+        token_config = getattr(self._context, '_token_config', None)
+        usage_config = token_config.get("usage") if isinstance(
+            token_config, dict) else None
+        if not usage_config:
+            return TokenTracker()
+
+        kwargs: Dict[str, Any] = {
+            key: usage_config[key]
+            for key in ("max_series", "top_k_dimensions", "top_k_capacity",
+                        "top_k_buckets") if key in usage_config
+        }
+        if "top_k_window_minutes" in usage_config:
+            kwargs["top_k_window"] = timedelta(
+                minutes=usage_config["top_k_window_minutes"])
+        if "series_idle_minutes" in usage_config:
+            kwargs["series_idle_timeout"] = timedelta(
+                minutes=usage_config["series_idle_minutes"])
+        kwargs["backend"] = self._create_usage_backend(usage_config)
+        return TokenTracker(**kwargs)
+
+    def _create_usage_backend(
+            self, usage_config: Dict[str, Any]) -> Optional[UsageBackend]:
+        """Create the backend that shares token usage between workers."""
+        backend = usage_config.get("backend", "memory")
+        if backend == "memory":
+            return None
+        if backend == "mmap":
+            return MmapUsageBackend(
+                usage_config.get("mmap_path", "/dev/shm/observicia-usage"),
+                max_providers=usage_config.get("max_providers", 32))
+        if backend == "redis":
+            # Connect like the Redis span exporter unless overridden
+            logging_config = getattr(self._context, '_logging_config', None)
+            exporter_config = logging_config.get("telemetry", {}).get(
+                "redis", {}) if isinstance(logging_config, dict) else {}
+            redis_config = {**exporter_config, **usage_config.get("redis", {})}
+            return RedisUsageBackend(
+                host=redis_config.get("host", "localhost"),
+                port=redis_config.get("port", 6379),
+                db=redis_config.get("db", 0),
+                password=redis_config.get("password"),
+                key_prefix=usage_config.get("redis", {}).get(
+                    "key_prefix", "observicia:usage:"),
+                flush_interval=redis_config.get("flush_interval", 1.0),
+                flush_threshold=redis_config.get("flush_threshold", 100))
+        raise ValueError(f"Unsupported token usage backend: {backend}")
+
     def patch_provider(self, provider_name: str) -> None:
         """
         Patch a specific LLM provider's SDK.
@@ -0,0 +1,149 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from opentelemetry import trace
+from opentelemetry.trace import Link, SpanContext, TraceFlags
+
+
+class PolicyAuditor:
+    """
+    Evaluates audit-mode policies off the request path.
+
+    Audit requests go onto a bounded queue drained by a small pool of
+    worker threads. Each evaluation is recorded in a "policy_audit" span
+    linked to the LLM span it audits. When the queue is full, new audits
+    are shed and counted instead of delaying the caller.
+    """
+
+    def __init__(self,
+                 evaluate: Callable[[Dict[str, Any], List[Any], Any], Any],
+                 queue_size: int = 1000,
+                 workers: int = 2) -> None:
+        """
+        Initialize PolicyAuditor.
+
+        Args:
+            evaluate: Function evaluating (eval_context, policies, span)
+                and returning a PolicyResult
+            queue_size: Maximum number of audits waiting for a worker
+            workers: Number of worker threads
+        """
+        self._evaluate = evaluate
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(
+            maxsize=queue_size)
+        self._workers_count = workers
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.tracer = trace.get_tracer(__name__)
+
+        self.submitted = 0
+        self.completed = 0
+        self.shed = 0
+
+    def submit(self, eval_context: Dict[str, Any], policies: List[Any]) -> bool:
+        """
+        Queue policies for evaluation without waiting for the result.
+
+        Returns:
+            False if the audit was shed because the queue is full
+        """
+        if not policies:
+            return True
+
+        with self._lock:
+            if self._closed:
+                return False
+            if not self._workers:
+                self._start_workers()
+            try:
+                self._queue.put_nowait((eval_context, policies))
+            except queue.Full:
+                self.shed += 1
+                return False
+            self.submitted += 1
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        """Get queued, submitted, completed and shed audit counts."""
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "shed": self.shed
+        }
+
+    def join(self) -> None:
+        """Block until every queued audit has been evaluated."""
+        self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the workers after they finish the queued audits."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+    def _start_workers(self) -> None:
+        for i in range(self._workers_count):
+            worker = threading.Thread(target=self._run,
+                                      name=f"observicia-policy-audit-{i}",
+                                      daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self) -> None:
+        """Evaluate queued audits until a stop marker arrives."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._audit(*item)
+            except Exception as e:
+                print(f"Error auditing policies: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _audit(self, eval_context: Dict[str, Any],
+               policies: List[Any]) -> None:
+        """Evaluate policies in a span linked to the audited request."""
+        with self.tracer.start_span("policy_audit",
+                                    links=self._links(eval_context)) as span:
+            result = self._evaluate(eval_context, policies, span)
+            span.set_attributes({
+                "policy.mode": "audit",
+                "policy.passed": result.passed,
+                "policy.violations": ";".join(result.violations),
+                "risk_level": result.risk_level,
+                "evaluated_policies": ";".join(p.name for p in policies)
+            })
+        with self._lock:
+            self.completed += 1
+
+    @staticmethod
+    def _links(eval_context: Dict[str, Any]) -> List[Link]:
+        """Link to the span recorded in the evaluation input, if any."""
+        trace_context = eval_context.get("trace_context") or {}
+        try:
+            # Ids are hex strings in policy inputs built by the patchers
+            trace_id, span_id = (
+                int(value, 16) if isinstance(value, str) else value
+                for value in (trace_context.get("trace_id"),
+                              trace_context.get("span_id")))
+        except ValueError:
+            return []
+        if not isinstance(trace_id, int) or not isinstance(span_id, int):
+            return []
+        span_context = SpanContext(trace_id=trace_id,
+                                   span_id=span_id,
+                                   is_remote=False,
+                                   trace_flags=TraceFlags(
+                                       TraceFlags.SAMPLED))
+        return [Link(span_context)] if span_context.is_valid else []
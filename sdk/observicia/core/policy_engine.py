@@ -1,17 +1,107 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from opentelemetry import trace
 
+from ..utils.helpers import exponential_backoff
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .local_policies import LocalPolicyEvaluator
+from .policy_audit import PolicyAuditor
+
+try:
+    import orjson
+except ImportError:  # optional, faster JSON encoding
+    orjson = None
+
+# Responses worth retrying: OPA or a proxy in front of it is overloaded
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+def encode_json(payload: Any) -> bytes:
+    """Encode a payload compactly, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload,
+                                default=str,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson rejects integers wider than 64 bits, json doesn't
+            pass
+    return json.dumps(payload, separators=(",", ":"),
+                      default=str).encode("utf-8")
+
+
+def project_input(eval_context: Dict[str, Any],
+                  fields: List[str]) -> Dict[str, Any]:
+    """
+    Copy only the given dotted fields of an evaluation input.
+
+    Keys may themselves contain dots, as span attributes do, so at each
+    level the longest matching key wins: `trace_context.attributes.llm.model`
+    selects the `llm.model` attribute. Missing fields are left out.
+    """
+    projected: Dict[str, Any] = {}
+    for field_path in fields:
+        _copy_field(eval_context, projected, field_path.split("."))
+    return projected
+
+
+def _copy_field(source: Any, target: Dict[str, Any],
+                segments: List[str]) -> None:
+    if not isinstance(source, dict):
+        return
+    for end in range(len(segments), 0, -1):
+        key = ".".join(segments[:end])
+        if key not in source:
+            continue
+        if end == len(segments):
+            target[key] = source[key]
+        else:
+            child = target.setdefault(key, {})
+            if isinstance(child, dict):
+                _copy_field(source[key], child, segments[end:])
+        return
+
 
 @dataclass
 class Policy:
-    """Represents an OPA policy configuration."""
+    """Represents an OPA or local policy configuration."""
     name: str
-    path: str  # Path part of the URL after /v1/data/
+    path: str = ""  # Path part of the URL after /v1/data/
     description: Optional[str] = None
     required_trace_level: str = "basic"
     risk_level: str = "low"
+    cacheable: bool = False  # only for policies not depending on time or user
+    cache_ttl: Optional[float] = None  # seconds, defaults to the engine's TTL
+    backend: str = "opa"  # "opa" or "local"
+    rules: Optional[Dict[str, Any]] = None  # rules of local policies
+    mode: str = "blocking"  # "blocking" or "audit" (evaluated off the request path)
+    phase: str = "response"  # "response" or "prompt" (before the provider call)
+    failure_mode: str = "closed"  # "closed" fails, "open" allows when OPA is unavailable
+    input_fields: Optional[List[str]] = None  # dotted input fields sent to OPA, None for all
+
+    def __post_init__(self) -> None:
+        if self.backend not in ("opa", "local"):
+            raise ValueError(f"Unknown policy backend: {self.backend}")
+        if self.mode not in ("blocking", "audit"):
+            raise ValueError(f"Unknown policy mode: {self.mode}")
+        if self.phase not in ("prompt", "response"):
+            raise ValueError(f"Unknown policy phase: {self.phase}")
+        if self.failure_mode not in ("open", "closed"):
+            raise ValueError(f"Unknown policy failure mode: {self.failure_mode}")
+        if self.backend == "opa" and not self.path:
+            raise ValueError(f"OPA policy {self.name} needs a path")
 
 
 @dataclass
@@ -24,27 +114,215 @@ class PolicyResult:
     risk_level: str = "low"  # "low", "medium", "high", "critical"
 
 
+class PolicyDecisionCache:
+    """
+    LRU cache of OPA decisions with a time-to-live.
+
+    Entries are keyed by a hash of the policy name and path and the
+    evaluation input, with per-call identifiers such as trace/span ids and
+    response ids and timestamps removed, so repeated prompts and
+    completions reuse earlier decisions. Policies that declare their
+    `input_fields` are keyed on exactly those fields; for the others,
+    span attributes that change per call, like budget state, are dropped.
+    """
+
+    # Top-level response fields and trace context fields that change per call
+    VOLATILE_RESPONSE_KEYS = ("id", "created", "system_fingerprint")
+    VOLATILE_TRACE_KEYS = ("trace_id", "span_id")
+    # Span attributes that change per call
+    VOLATILE_ATTRIBUTE_KEYS = ("trace_id", "parent_id")
+    VOLATILE_ATTRIBUTE_PREFIXES = ("budget.", )
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = \
+            OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, policy: Policy, eval_context: Dict[str, Any]) -> str:
+        """Hash a policy and its normalized input."""
+        normalized = dict(eval_context)
+        if isinstance(normalized.get("response"), dict):
+            normalized["response"] = {
+                k: v
+                for k, v in normalized["response"].items()
+                if k not in self.VOLATILE_RESPONSE_KEYS
+            }
+        if isinstance(normalized.get("trace_context"), dict):
+            trace_context = {
+                k: v
+                for k, v in normalized["trace_context"].items()
+                if k not in self.VOLATILE_TRACE_KEYS
+            }
+            # Attributes a policy declares it reads always count
+            if (policy.input_fields is None
+                    and isinstance(trace_context.get("attributes"), dict)):
+                trace_context["attributes"] = {
+                    k: v
+                    for k, v in trace_context["attributes"].items()
+                    if k not in self.VOLATILE_ATTRIBUTE_KEYS
+                    and not k.startswith(self.VOLATILE_ATTRIBUTE_PREFIXES)
+                }
+            normalized["trace_context"] = trace_context
+        payload = json.dumps([policy.name, policy.path, normalized],
+                             sort_keys=True,
+                             default=str)
+        return hashlib.blake2b(payload.encode("utf-8"),
+                               digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get an unexpired decision, refreshing its LRU position."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self,
+            key: str,
+            result: Dict[str, Any],
+            ttl: Optional[float] = None) -> None:
+        """Store a decision, evicting the least recently used when full."""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def hit_ratio(self) -> float:
+        """Fraction of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """Drop all cached decisions."""
+        with self._lock:
+            self._entries.clear()
+
+
 class PolicyEngine:
     """
     Policy engine that integrates with OPA for policy evaluation.
+
+    Policies with `backend: local` are evaluated in process by a
+    `LocalPolicyEvaluator` without a round trip to OPA. Policies with
+    `mode: audit` never block a request: they are handed to a
+    `PolicyAuditor` and evaluated by background workers.
     """
 
     def __init__(self,
-                 opa_endpoint: str,
-                 policies: Optional[List[Policy]] = None) -> None:
+                 opa_endpoint: Optional[str] = None,
+                 policies: Optional[List[Policy]] = None,
+                 pool_size: int = 10,
+                 connect_timeout: float = 1.0,
+                 read_timeout: float = 5.0,
+                 max_retries: int = 2,
+                 retry_base_delay: float = 0.1,
+                 max_parallel: int = 8,
+                 evaluation_timeout: Optional[float] = 10.0,
+                 bundle: bool = False,
+                 cache_size: int = 1024,
+                 cache_ttl: float = 300.0,
+                 audit_queue_size: int = 1000,
+                 audit_workers: int = 2,
+                 breaker_failure_rate: float = 0.5,
+                 breaker_slow_call_seconds: float = 2.0,
+                 breaker_slow_call_rate: float = 0.5,
+                 breaker_window: int = 20,
+                 breaker_minimum_calls: int = 10,
+                 breaker_open_seconds: float = 30.0,
+                 compress_requests: bool = False,
+                 compress_min_bytes: int = 1024) -> None:
         """
         Initialize PolicyEngine with OPA endpoint and policies.
         
         Args:
-            opa_endpoint: Base URL of the OPA server
+            opa_endpoint: Base URL of the OPA server; optional when all
+                policies are local
             policies: List of Policy objects defining available policies
+            pool_size: Maximum number of keep-alive connections to OPA
+            connect_timeout: Seconds to wait for a connection to OPA
+            read_timeout: Seconds to wait for an OPA response
+            max_retries: Retries for connection errors, timeouts and 5xx
+            retry_base_delay: Base delay in seconds for exponential backoff
+            max_parallel: Maximum number of policies evaluated concurrently
+            evaluation_timeout: Overall deadline in seconds for evaluating
+                all policies of one request; None waits indefinitely
+            bundle: Evaluate all policies of a request in one OPA query
+            cache_size: Maximum number of cached decisions; 0 disables caching
+            cache_ttl: Default seconds a cached decision stays valid
+            audit_queue_size: Maximum number of pending audits before new
+                ones are shed
+            audit_workers: Number of threads evaluating audit-mode policies
+            breaker_failure_rate: Share of failed OPA calls that opens the
+                circuit breaker
+            breaker_slow_call_seconds: Duration above which an OPA call
+                counts as slow
+            breaker_slow_call_rate: Share of slow OPA calls that opens the
+                circuit breaker
+            breaker_window: Number of recent OPA calls the rates cover
+            breaker_minimum_calls: Calls needed before the circuit can open
+            breaker_open_seconds: Seconds OPA calls are skipped once the
+                circuit opens, before a probe call is let through
+            compress_requests: Gzip request bodies sent to OPA
+            compress_min_bytes: Smallest body worth compressing
         """
-        self.opa_endpoint = opa_endpoint.rstrip('/')
+        self.opa_endpoint = opa_endpoint.rstrip('/') if opa_endpoint else None
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
 
-        self.policies: Dict[str, Policy] = {
-            p.name: p
-            for p in (policies or [])
-        }
+        # Pooled keep-alive connections shared by all evaluations
+        self._adapter = HTTPAdapter(pool_connections=1,
+                                    pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self.evaluation_timeout = evaluation_timeout
+        self.bundle = bundle
+        # Decisions of policies marked cacheable
+        self.decision_cache = PolicyDecisionCache(
+            max_size=cache_size, ttl=cache_ttl) if cache_size > 0 else None
+        self._pool_size = pool_size
+        # httpx clients are bound to the event loop they were created on
+        self._async_clients: weakref.WeakKeyDictionary = \
+            weakref.WeakKeyDictionary()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_parallel, thread_name_prefix="observicia-policy")
+
+        # Fail fast instead of piling requests onto an unhealthy OPA
+        self.circuit_breaker = CircuitBreaker(
+            failure_rate_threshold=breaker_failure_rate,
+            slow_call_seconds=breaker_slow_call_seconds,
+            slow_call_rate_threshold=breaker_slow_call_rate,
+            window_size=breaker_window,
+            minimum_calls=breaker_minimum_calls,
+            open_seconds=breaker_open_seconds)
+
+        self.compress_requests = compress_requests
+        self.compress_min_bytes = compress_min_bytes
+
+        self._stats_lock = threading.Lock()
+        self._retries = 0
+        self._failures = 0
+        self._bytes_sent = 0
+
+        self.local_evaluator = LocalPolicyEvaluator()
+        self.auditor = PolicyAuditor(self._evaluate_policies_sync,
+                                     queue_size=audit_queue_size,
+                                     workers=audit_workers)
+        self.policies: Dict[str, Policy] = {}
+        for policy in policies or []:
+            self._register(policy)
         self.active_policies: Set[str] = set(self.policies.keys())
         self.tracer = trace.get_tracer(__name__)
 
@@ -53,7 +331,8 @@ class PolicyEngine:
             eval_context: Dict[str, Any],
             prompt: Optional[str] = None,
             completion: Optional[str] = None,
-            policies: Optional[List[str]] = None) -> PolicyResult:
+            policies: Optional[List[str]] = None,
+            phase: str = "response") -> PolicyResult:
         """
         Evaluate specified policies with given context.
         
@@ -62,11 +341,14 @@ class PolicyEngine:
             prompt: Optional prompt text for prompt compliance check
             completion: Optional completion text for prompt compliance check
             policies: List of policy names to evaluate. If None, use active policies.
+            phase: Phase whose active policies are evaluated when no
+                policy names are given, "response" or "prompt"
         """
         with self.tracer.start_span("policy_evaluation") as span:
             # Use specified policies or fall back to active policies
-            policy_names = policies if policies is not None else list(
-                self.active_policies)
+            policy_names = policies if policies is not None else [
+                policy.name for policy in self.phase_policies(phase)
+            ]
 
             # Filter to only existing policies
             policies_to_evaluate = [
@@ -79,8 +361,10 @@ class PolicyEngine:
                 eval_context["prompt"] = prompt
                 eval_context["completion"] = completion
 
+            policies_to_evaluate = self._submit_audits(
+                policies_to_evaluate, eval_context, span)
             result = await self._evaluate_policies(eval_context,
-                                                   policies_to_evaluate)
+                                                   policies_to_evaluate, span)
 
             span.set_attributes({
                 "policy_count":
@@ -90,31 +374,34 @@ class PolicyEngine:
                 "risk_level":
                 result.risk_level,
                 "evaluated_policies":
-                ";".join(p.name for p in policies_to_evaluate)
+                ";".join(p.name for p in policies_to_evaluate),
+                "policy.phase":
+                phase
             })
+            self._record_connection_stats(span)
 
             return result
 
     def evaluate_sync(self,
                       eval_context: Dict[str, Any],
                       prompt: Optional[str] = None,
-                      completion: Optional[str] = None) -> PolicyResult:
+                      completion: Optional[str] = None,
+                      phase: str = "response") -> PolicyResult:
         """
         Synchronously evaluate policies with given context.
         """
         with self.tracer.start_span("policy_evaluation") as span:
-            policies_to_evaluate = [
-                self.policies[name] for name in self.active_policies
-                if name in self.policies
-            ]
+            policies_to_evaluate = self.phase_policies(phase)
 
             # Add prompt and completion to evaluation context if provided
             if prompt is not None and completion is not None:
                 eval_context["prompt"] = prompt
                 eval_context["completion"] = completion
 
+            policies_to_evaluate = self._submit_audits(
+                policies_to_evaluate, eval_context, span)
             result = self._evaluate_policies_sync(eval_context,
-                                                  policies_to_evaluate)
+                                                  policies_to_evaluate, span)
 
             span.set_attributes({
                 "policy_count":
@@ -124,23 +411,313 @@ class PolicyEngine:
                 "risk_level":
                 result.risk_level,
                 "evaluated_policies":
-                ";".join(p.name for p in policies_to_evaluate)
+                ";".join(p.name for p in policies_to_evaluate),
+                "policy.phase":
+                phase
             })
+            self._record_connection_stats(span)
 
             return result
 
-    def _evaluate_policies_sync(self, eval_context: Dict[str, Any],
-                                policies: List[Policy]) -> PolicyResult:
-        """Evaluate multiple policies synchronously and aggregate results."""
+    def phase_policies(self, phase: str = "response") -> List[Policy]:
+        """Get the active policies evaluated in a phase, in policy order."""
+        return [
+            policy for name, policy in self.policies.items()
+            if name in self.active_policies and policy.phase == phase
+        ]
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Get request, connection reuse, retry, failure and rejected counts for OPA."""
+        requests_sent = new_connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                new_connections += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": max(0, requests_sent - new_connections),
+            "retries": self._retries,
+            "failures": self._failures,
+            "bytes_sent": self._bytes_sent,
+            "circuit_rejected": self.circuit_breaker.rejected
+        }
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        """Increment a retry, failure or byte counter."""
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def required_inputs(self, phase: str = "response") -> Optional[Set[str]]:
+        """
+        Get the top-level input fields the active policies of a phase need.
+
+        Returns:
+            The field names, or None if any policy needs the whole input
+        """
+        fields: Set[str] = set()
+        for policy in self.phase_policies(phase):
+            if policy.input_fields is None or policy.backend == "local":
+                return None
+            fields.update(f.split(".", 1)[0] for f in policy.input_fields)
+        return fields
+
+    @staticmethod
+    def _policy_input(policy: Policy,
+                      eval_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Project the evaluation input to the fields a policy declares."""
+        if policy.input_fields is None:
+            return eval_context
+        return project_input(eval_context, policy.input_fields)
+
+    def close(self) -> None:
+        """Stop evaluation workers and close pooled connections to OPA."""
+        self.auditor.close()
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """Close the async connection pool of the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _submit_audits(self, policies: List[Policy],
+                       eval_context: Dict[str, Any],
+                       span: Any) -> List[Policy]:
+        """Queue audit-mode policies and return the blocking ones."""
+        audited = [p for p in policies if p.mode == "audit"]
+        if not audited:
+            return policies
+
+        # Workers may run after the caller mutates its input
+        queued = self.auditor.submit(dict(eval_context), audited)
+        span.set_attributes({
+            "policy.audit.queued": queued,
+            "policy.audit.policies": ";".join(p.name for p in audited),
+            "policy.audit.shed": self.auditor.shed
+        })
+        return [p for p in policies if p.mode != "audit"]
+
+    def _record_connection_stats(self, span: Any) -> None:
+        """Record cumulative OPA connection reuse on a span."""
+        stats = self.connection_stats()
+        span.set_attributes({
+            "opa.requests": stats["requests"],
+            "opa.connections.new": stats["new_connections"],
+            "opa.connections.reused": stats["reused_connections"],
+            "opa.retries": stats["retries"],
+            "opa.bytes_sent": stats["bytes_sent"],
+            "opa.circuit.state": self.circuit_breaker.state,
+            "opa.circuit.rejected": stats["circuit_rejected"]
+        })
+
+    def _evaluate_policies_sync(self,
+                                eval_context: Dict[str, Any],
+                                policies: List[Policy],
+                                span: Optional[Any] = None) -> PolicyResult:
+        """Evaluate policies, reusing cached decisions, and aggregate results."""
+        raw_results, keys = self._cached_results(policies, eval_context, span)
+        misses = [i for i, raw in enumerate(raw_results) if raw is None]
+        if misses:
+            evaluated = self._evaluate_raw_sync(
+                eval_context, [policies[i] for i in misses])
+            self._store_results(policies, keys, misses, evaluated,
+                                raw_results)
+        return self._aggregate_results(policies, raw_results)
+
+    async def _evaluate_policies(self,
+                                 eval_context: Dict[str, Any],
+                                 policies: List[Policy],
+                                 span: Optional[Any] = None) -> PolicyResult:
+        """Evaluate policies asynchronously, reusing cached decisions."""
+        raw_results, keys = self._cached_results(policies, eval_context, span)
+        misses = [i for i, raw in enumerate(raw_results) if raw is None]
+        if misses:
+            evaluated = await self._evaluate_raw(
+                eval_context, [policies[i] for i in misses])
+            self._store_results(policies, keys, misses, evaluated,
+                                raw_results)
+        return self._aggregate_results(policies, raw_results)
+
+    def _evaluate_raw_sync(
+            self, eval_context: Dict[str, Any],
+            policies: List[Policy]) -> List[Dict[str, Any]]:
+        """Evaluate local policies in process and the rest with OPA."""
+        return self._route(
+            eval_context, policies,
+            lambda opa_policies: self._evaluate_opa_sync(
+                eval_context, opa_policies))
+
+    async def _evaluate_raw(self, eval_context: Dict[str, Any],
+                            policies: List[Policy]) -> List[Dict[str, Any]]:
+        """Evaluate local policies in process and the rest with OPA."""
+        opa_policies = [p for p in policies if p.backend == "opa"]
+        opa_results = await self._evaluate_opa(
+            eval_context,
+            opa_policies) if opa_policies and self.opa_endpoint else []
+        return self._route(eval_context, policies, lambda _: opa_results)
+
+    def _route(self, eval_context: Dict[str, Any], policies: List[Policy],
+               evaluate_opa: Callable[[List[Policy]], List[Dict[str, Any]]]
+               ) -> List[Dict[str, Any]]:
+        """Merge local and OPA results back into policy order."""
+        opa_policies = [p for p in policies if p.backend == "opa"]
+        if opa_policies and self.opa_endpoint is None:
+            opa_results = [
+                self._error_result("No OPA endpoint configured")
+                for _ in opa_policies
+            ]
+        else:
+            opa_results = evaluate_opa(opa_policies) if opa_policies else []
+
+        opa_iter = iter(opa_results)
+        return [
+            self._evaluate_local(policy, eval_context)
+            if policy.backend == "local" else next(opa_iter)
+            for policy in policies
+        ]
+
+    def _evaluate_local(self, policy: Policy,
+                        eval_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Evaluate a local policy, failing it if its rules raise."""
+        try:
+            return self.local_evaluator.evaluate(policy, eval_context)
+        except Exception as e:
+            return self._error_result(f"Local policy evaluation error: {e}")
+
+    def _evaluate_opa_sync(
+            self, eval_context: Dict[str, Any],
+            policies: List[Policy]) -> List[Dict[str, Any]]:
+        """Evaluate policies concurrently and return raw OPA results."""
+        # Running requests can't be cancelled, so each one is bounded by
+        # the time left before the deadline and returns its worker in time
+        deadline = None if self.evaluation_timeout is None else \
+            time.monotonic() + self.evaluation_timeout
+        if self.bundle and len(policies) > 1:
+            return self._evaluate_bundle_sync(policies, eval_context,
+                                              deadline)
+
+        if len(policies) <= 1:
+            return [
+                self._evaluate_single_policy_sync(policy, eval_context,
+                                                  deadline)
+                for policy in policies
+            ]
+
+        futures = [
+            self._executor.submit(self._evaluate_single_policy_sync, policy,
+                                  eval_context, deadline)
+            for policy in policies
+        ]
+        wait(futures, timeout=self.evaluation_timeout)
+
+        raw_results = []
+        for future in futures:
+            if future.done():
+                raw_results.append(future.result())
+            else:
+                future.cancel()
+                raw_results.append(self._timeout_result())
+        return raw_results
+
+    async def _evaluate_opa(self, eval_context: Dict[str, Any],
+                            policies: List[Policy]) -> List[Dict[str, Any]]:
+        """Evaluate policies concurrently on the event loop."""
+        if self.bundle and len(policies) > 1:
+            return await self._evaluate_bundle(policies, eval_context)
+
+        tasks = [
+            asyncio.ensure_future(
+                self._evaluate_single_policy(policy, eval_context))
+            for policy in policies
+        ]
+        if not tasks:
+            return []
+
+        await asyncio.wait(tasks, timeout=self.evaluation_timeout)
+
+        raw_results = []
+        for task in tasks:
+            if task.done():
+                raw_results.append(task.result())
+            else:
+                task.cancel()
+                raw_results.append(self._timeout_result())
+        return raw_results
+
+    def _cached_results(
+        self, policies: List[Policy], eval_context: Dict[str, Any],
+        span: Optional[Any]
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[Optional[str]]]:
+        """Look up cached decisions of cacheable policies."""
+        raw_results: List[Optional[Dict[str, Any]]] = [None] * len(policies)
+        keys: List[Optional[str]] = [None] * len(policies)
+        if self.decision_cache is None:
+            return raw_results, keys
+
+        hits = lookups = 0
+        for i, policy in enumerate(policies):
+            if not policy.cacheable:
+                continue
+            keys[i] = self.decision_cache.key(
+                policy, self._policy_input(policy, eval_context))
+            raw_results[i] = self.decision_cache.get(keys[i])
+            lookups += 1
+            hits += raw_results[i] is not None
+
+        if span is not None and lookups:
+            span.set_attributes({
+                "policy.cache.hits": hits,
+                "policy.cache.misses": lookups - hits,
+                "policy.cache.hit_ratio": self.decision_cache.hit_ratio()
+            })
+        return raw_results, keys
+
+    def _store_results(self, policies: List[Policy], keys: List[Optional[str]],
+                       indexes: List[int], evaluated: List[Dict[str, Any]],
+                       raw_results: List[Optional[Dict[str, Any]]]) -> None:
+        """Fill in evaluated results and cache successful decisions."""
+        for i, raw_result in zip(indexes, evaluated):
+            raw_results[i] = raw_result
+            # Only cache real OPA decisions, never errors or timeouts
+            if (keys[i] is not None and "result" in raw_result
+                    and "error" not in raw_result):
+                self.decision_cache.put(keys[i], raw_result,
+                                        policies[i].cache_ttl)
+
+    def _timeout_result(self) -> Dict[str, Any]:
+        """Result for a policy that missed the evaluation deadline."""
+        return self._error_result(
+            f"Policy evaluation timed out after {self.evaluation_timeout}s")
+
+    def _error_result(self, message: str) -> Dict[str, Any]:
+        """Result for a policy that could not be evaluated."""
+        self._count("_failures")
+        return {
+            "result": {
+                "allow": False,
+                "violations": [message],
+                "risk_level": "high"
+            },
+            "error": message
+        }
+
+    def _aggregate_results(self, policies: List[Policy],
+                           raw_results: List[Dict[str, Any]]) -> PolicyResult:
+        """Combine per-policy OPA results, in policy order, into one result."""
         violations = []
         metadata = {}
         max_trace_level = "basic"
         max_risk_level = "low"
 
-        for policy in policies:
-            raw_result = self._evaluate_single_policy_sync(
-                policy, eval_context)
-            # print(f'Policy: {policy.name}, Result: {raw_result}')
+        for policy, raw_result in zip(policies, raw_results):
+            if "error" in raw_result and policy.failure_mode == "open":
+                # Unavailable policies marked fail-open don't block requests
+                metadata[policy.name] = {"failed_open": raw_result["error"]}
+                continue
 
             # Extract the nested result
             result = raw_result.get('result', {})
@@ -189,29 +766,234 @@ class PolicyEngine:
                             risk_level=max_risk_level)
 
     def _evaluate_single_policy_sync(
+            self,
+            policy: Policy,
+            eval_context: Dict[str, Any],
+            deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Evaluate a single policy synchronously using OPA."""
+        url = f"{self.opa_endpoint}/v1/data/{policy.path}"
+        try:
+            response = self._post(
+                url, {"input": self._policy_input(policy, eval_context)},
+                deadline=deadline)
+            if response.status_code == 200:
+                return response.json()
+            return self._error_result(
+                f"Policy evaluation failed: HTTP {response.status_code}")
+        except requests.Timeout as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                return self._timeout_result()
+            return self._error_result(f"Policy evaluation error: {str(e)}")
+        except Exception as e:
+            return self._error_result(f"Policy evaluation error: {str(e)}")
+
+    async def _evaluate_single_policy(
             self, policy: Policy, eval_context: Dict[str,
                                                      Any]) -> Dict[str, Any]:
-        """Evaluate a single policy synchronously using OPA."""
+        """Evaluate a single policy asynchronously using OPA."""
         url = f"{self.opa_endpoint}/v1/data/{policy.path}"
         try:
-            response = requests.post(url, json={"input": eval_context})
+            response = await self._post_async(
+                url, {"input": self._policy_input(policy, eval_context)})
             if response.status_code == 200:
                 return response.json()
-            else:
-                return {
-                    "allow":
-                    False,
-                    "violations":
-                    [f"Policy evaluation failed: HTTP {response.status_code}"],
-                    "risk_level":
-                    "high"
-                }
+            return self._error_result(
+                f"Policy evaluation failed: HTTP {response.status_code}")
         except Exception as e:
-            return {
-                "allow": False,
-                "violations": [f"Policy evaluation error: {str(e)}"],
-                "risk_level": "high"
-            }
+            return self._error_result(f"Policy evaluation error: {str(e)}")
+
+    def _evaluate_bundle_sync(
+            self,
+            policies: List[Policy],
+            eval_context: Dict[str, Any],
+            deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Evaluate all policies in one OPA query, within the deadline."""
+        try:
+            response = self._post(f"{self.opa_endpoint}/v1/query",
+                                  self._bundle_payload(policies, eval_context),
+                                  deadline=deadline)
+            if response.status_code == 200:
+                return self._split_bundle_result(policies, response.json())
+            message = f"Policy evaluation failed: HTTP {response.status_code}"
+        except requests.Timeout as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                return [self._timeout_result() for _ in policies]
+            message = f"Policy evaluation error: {str(e)}"
+        except Exception as e:
+            message = f"Policy evaluation error: {str(e)}"
+        return [self._error_result(message) for _ in policies]
+
+    async def _evaluate_bundle(
+            self, policies: List[Policy],
+            eval_context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Evaluate all policies in one async OPA query, within the deadline."""
+        try:
+            response = await asyncio.wait_for(
+                self._post_async(f"{self.opa_endpoint}/v1/query",
+                                 self._bundle_payload(policies, eval_context)),
+                self.evaluation_timeout)
+            if response.status_code == 200:
+                return self._split_bundle_result(policies, response.json())
+            message = f"Policy evaluation failed: HTTP {response.status_code}"
+        except asyncio.TimeoutError:
+            return [self._timeout_result() for _ in policies]
+        except Exception as e:
+            message = f"Policy evaluation error: {str(e)}"
+        return [self._error_result(message) for _ in policies]
+
+    def _bundle_payload(self, policies: List[Policy],
+                        eval_context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build an ad-hoc query binding each policy's document to `p<index>`.
+
+        Each document is wrapped in a comprehension so an undefined policy
+        yields an empty list instead of making the whole query undefined.
+        """
+        query = "; ".join(
+            f"p{index} := [x | x := {self._data_ref(policy.path)}]"
+            for index, policy in enumerate(policies))
+        if any(policy.input_fields is None for policy in policies):
+            bundle_input = eval_context
+        else:
+            bundle_input = project_input(
+                eval_context,
+                [f for policy in policies for f in policy.input_fields])
+        return {"query": query, "input": bundle_input}
+
+    @staticmethod
+    def _data_ref(path: str) -> str:
+        """Convert a policy path like `policies/pii` to a quoted data reference."""
+        return "data" + "".join(f"[{json.dumps(segment)}]"
+                                for segment in path.strip("/").split("/")
+                                if segment)
+
+    @staticmethod
+    def _split_bundle_result(policies: List[Policy],
+                             body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Map the bindings of a bundled query back to per-policy results."""
+        bindings = (body.get("result") or [{}])[0]
+        results = []
+        for index, _ in enumerate(policies):
+            values = bindings.get(f"p{index}") or []
+            # Same shape as /v1/data; undefined documents have no result
+            results.append({"result": values[0]} if values else {})
+        return results
+
+    def _post(self,
+              url: str,
+              payload: Dict[str, Any],
+              deadline: Optional[float] = None) -> requests.Response:
+        """
+        POST to OPA over the pooled session, retrying transient failures.
+
+        With a deadline, the timeouts of each attempt and the backoff
+        between attempts are capped by the time left, and `requests.Timeout`
+        is raised once it has passed.
+        """
+        # Encode first so a bad payload never takes a half-open probe slot
+        body, headers = self._encode_body(payload)
+        self._attempt_timeout(deadline)  # don't probe OPA after the deadline
+        self._check_circuit()
+        start = time.monotonic()
+        success = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                timeout = self._attempt_timeout(deadline)
+                self._count("_bytes_sent", len(body))
+                try:
+                    response = self.session.post(url,
+                                                 data=body,
+                                                 headers=headers,
+                                                 timeout=timeout)
+                    if (response.status_code not in RETRY_STATUS_CODES
+                            or attempt == self.max_retries):
+                        success = response.status_code < 500
+                        return response
+                    # Hand the connection back to the pool before retrying
+                    response.close()
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                delay = exponential_backoff(attempt, self.retry_base_delay)
+                if deadline is not None:
+                    delay = min(delay, max(0.0, deadline - time.monotonic()))
+                self._count("_retries")
+                time.sleep(delay)
+        finally:
+            self.circuit_breaker.record(success, time.monotonic() - start)
+
+    def _attempt_timeout(self,
+                         deadline: Optional[float]) -> Tuple[float, float]:
+        """Get the connect and read timeouts of one attempt to call OPA."""
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout(
+                f"Policy evaluation deadline of {self.evaluation_timeout}s "
+                "passed")
+        connect_timeout, read_timeout = self.timeout
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    async def _post_async(self, url: str,
+                          payload: Dict[str, Any]) -> httpx.Response:
+        """POST to OPA over the loop's pooled client, retrying transient failures."""
+        body, headers = self._encode_body(payload)
+        self._check_circuit()
+        client = self._async_client()
+        start = time.monotonic()
+        success = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._count("_bytes_sent", len(body))
+                try:
+                    response = await client.post(url,
+                                                 content=body,
+                                                 headers=headers)
+                    if (response.status_code not in RETRY_STATUS_CODES
+                            or attempt == self.max_retries):
+                        success = response.status_code < 500
+                        return response
+                    await response.aclose()
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                self._count("_retries")
+                await asyncio.sleep(
+                    exponential_backoff(attempt, self.retry_base_delay))
+        finally:
+            # Also runs when the deadline cancels the call
+            self.circuit_breaker.record(success, time.monotonic() - start)
+
+    def _encode_body(self,
+                     payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        """Serialize a request body once, gzipping it if configured."""
+        body = encode_json(payload)
+        headers = {"Content-Type": "application/json"}
+        if self.compress_requests and len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def _check_circuit(self) -> None:
+        """Reject the call right away while the circuit breaker is open."""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError(
+                f"OPA circuit breaker is {self.circuit_breaker.state}")
+
+    def _async_client(self) -> httpx.AsyncClient:
+        """Get the pooled async client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            connect_timeout, read_timeout = self.timeout
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self._pool_size,
+                    max_keepalive_connections=self._pool_size),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+            self._async_clients[loop] = client
+        return client
 
     def _compare_risk_levels(self, level1: str, level2: str) -> int:
         """Compare two risk levels. Returns positive if level1 > level2."""
@@ -220,9 +1002,15 @@ class PolicyEngine:
 
     def add_policy(self, policy: Policy) -> None:
         """Add a policy to the available policies."""
-        self.policies[policy.name] = policy
+        self._register(policy)
         self.active_policies.add(policy.name)
 
+    def _register(self, policy: Policy) -> None:
+        """Register a policy, compiling the rules of local policies."""
+        if policy.backend == "local":
+            self.local_evaluator.compile(policy)
+        self.policies[policy.name] = policy
+
     def remove_policy(self, policy_name: str) -> None:
         """Remove a policy from the available and active policies."""
         if policy_name in self.policies:
@@ -0,0 +1,352 @@
+import atexit
+import mmap
+import os
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from ..utils.redis_helpers import get_redis_client
+from .token_tracker import UsageBackend, _BucketRing
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+
+def _retention_hours(retention_period: timedelta) -> int:
+    """Whole hours needed to cover the retention period."""
+    return max(1, -(-int(retention_period.total_seconds()) // HOUR))
+
+
+class MmapUsageBackend(UsageBackend):
+    """
+    Token usage shared by processes on one host through a memory-mapped file.
+
+    The file holds a fixed number of provider slots, each with a
+    minute-resolution ring for the last day and an hour-resolution ring
+    for the retention period. Writers take an exclusive `flock` on the
+    file, so updates from all workers are atomic; pointing `path` at
+    /dev/shm keeps the file in memory.
+    """
+
+    _MAGIC = 0x4f4253555347  # "OBSUSG"
+    _VERSION = 1
+    _HEADER_WORDS = 8
+    _NAME_WORDS = 8  # 64-byte provider name
+
+    def __init__(self,
+                 path: str,
+                 retention_period: timedelta = timedelta(days=7),
+                 max_providers: int = 32) -> None:
+        """
+        Open or create the counter file.
+
+        Args:
+            path: Path of the counter file shared by all workers
+            retention_period: How long hourly usage is kept
+            max_providers: Number of provider slots in a new file
+        """
+        if fcntl is None:
+            raise RuntimeError("mmap usage backend requires fcntl (POSIX)")
+
+        self.path = path
+        self._minute_slots = DAY // MINUTE
+        self._hour_slots = _retention_hours(retention_period)
+        self._capacity = max_providers
+        self._slot_words = (self._NAME_WORDS +
+                            3 * (self._minute_slots + self._hour_slots))
+        size = (self._HEADER_WORDS + self._capacity * self._slot_words) * 8
+
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                self._map = mmap.mmap(self._fd, size)
+                self._words = memoryview(self._map).cast('q')
+                self._format()
+            else:
+                self._map = mmap.mmap(self._fd, 0)
+                self._words = memoryview(self._map).cast('q')
+                self._check_header()
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._rings: Dict[str, Tuple[_BucketRing, _BucketRing]] = {}
+
+    def add(self, provider: str, prompt_tokens: int, completion_tokens: int,
+            now: float) -> None:
+        """Record token counts in the provider's minute and hour rings."""
+        with self._locked(fcntl.LOCK_EX):
+            for ring in self._provider_rings(provider, create=True):
+                ring.add(now, prompt_tokens, completion_tokens)
+
+    def sum(self, provider: str, now: float,
+            window: timedelta) -> Tuple[int, int]:
+        """Sum usage from the finest ring covering the window."""
+        with self._locked(fcntl.LOCK_SH):
+            rings = self._provider_rings(provider, create=False)
+            if rings is None:
+                return 0, 0
+            minutes, hours = rings
+            seconds = window.total_seconds()
+            ring = minutes if seconds <= minutes.span_seconds else hours
+            return ring.sum(now, seconds)
+
+    def providers(self) -> List[str]:
+        """Get providers registered in the file by any process."""
+        with self._locked(fcntl.LOCK_SH):
+            return sorted(
+                name
+                for name in (self._slot_name(slot)
+                             for slot in range(self._capacity)) if name)
+
+    def close(self) -> None:
+        """Unmap and close the counter file."""
+        with self._lock:
+            if self._fd < 0:
+                return
+            self._rings.clear()
+            self._words.release()
+            self._map.close()
+            os.close(self._fd)
+            self._fd = -1
+
+    @contextmanager
+    def _locked(self, operation: int):
+        """Hold the in-process lock and a file lock on the counters."""
+        with self._lock:
+            fcntl.flock(self._fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _format(self) -> None:
+        """Write the header and mark every bucket empty."""
+        self._words[0:5] = array('q', [
+            self._MAGIC, self._VERSION, self._capacity, self._minute_slots,
+            self._hour_slots
+        ])
+        for slot in range(self._capacity):
+            offset = self._slot_offset(slot) + self._NAME_WORDS
+            self._words[offset:offset + self._minute_slots] = array(
+                'q', [-1]) * self._minute_slots
+            offset += 3 * self._minute_slots
+            self._words[offset:offset + self._hour_slots] = array(
+                'q', [-1]) * self._hour_slots
+        self._map.flush()
+
+    def _check_header(self) -> None:
+        """Make sure an existing file has the layout this process expects."""
+        magic, version, capacity, minute_slots, hour_slots = self._words[0:5]
+        if magic != self._MAGIC or version != self._VERSION:
+            raise ValueError(f"{self.path} is not a token usage file")
+        if (minute_slots, hour_slots) != (self._minute_slots,
+                                          self._hour_slots):
+            raise ValueError(
+                f"{self.path} was created with a different retention period")
+        self._capacity = capacity
+
+    def _slot_offset(self, slot: int) -> int:
+        return self._HEADER_WORDS + slot * self._slot_words
+
+    def _slot_name(self, slot: int) -> str:
+        offset = self._slot_offset(slot) * 8
+        raw = bytes(self._map[offset:offset + self._NAME_WORDS * 8])
+        return raw.rstrip(b'\0').decode('utf-8')
+
+    def _provider_rings(
+            self, provider: str,
+            create: bool) -> Optional[Tuple[_BucketRing, _BucketRing]]:
+        """Get the rings of a provider's slot, claiming a free slot if asked."""
+        rings = self._rings.get(provider)
+        if rings is not None:
+            return rings
+
+        name = provider.encode('utf-8')[:self._NAME_WORDS * 8]
+        stored_name = name.decode('utf-8', 'ignore')
+        free_slot = None
+        for slot in range(self._capacity):
+            slot_name = self._slot_name(slot)
+            if slot_name == stored_name:
+                break
+            if not slot_name and free_slot is None:
+                free_slot = slot
+        else:
+            if not create:
+                return None
+            if free_slot is None:
+                raise RuntimeError(f"No free provider slots in {self.path}")
+            slot = free_slot
+            offset = self._slot_offset(slot) * 8
+            self._map[offset:offset + len(name)] = name
+
+        offset = self._slot_offset(slot) + self._NAME_WORDS
+        rings = []
+        for resolution, size in ((MINUTE, self._minute_slots),
+                                 (HOUR, self._hour_slots)):
+            storage = tuple(self._words[offset + i * size:offset +
+                                        (i + 1) * size] for i in range(3))
+            rings.append(_BucketRing(resolution, size, storage))
+            offset += 3 * size
+        self._rings[provider] = (rings[0], rings[1])
+        return self._rings[provider]
+
+
+class RedisUsageBackend(UsageBackend):
+    """
+    Token usage shared across hosts through Redis.
+
+    Usage is batched locally and flushed every `flush_interval` seconds, or
+    after `flush_threshold` updates, as `HINCRBY` calls on per-minute and
+    per-hour bucket hashes inside one MULTI/EXEC transaction. Reads add
+    the local batch not yet flushed.
+    """
+
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int = 6379,
+                 db: int = 0,
+                 password: Optional[str] = None,
+                 key_prefix: str = "observicia:usage:",
+                 retention_period: timedelta = timedelta(days=7),
+                 flush_interval: float = 1.0,
+                 flush_threshold: int = 100,
+                 client: Optional[redis.Redis] = None) -> None:
+        """
+        Initialize Redis usage backend.
+
+        Args:
+            host: Redis host
+            port: Redis port
+            db: Redis database number
+            password: Redis password
+            key_prefix: Prefix for Redis keys
+            retention_period: How long hourly usage is kept
+            flush_interval: Seconds between background flushes
+            flush_threshold: Number of updates that triggers a flush
+            client: Existing Redis client to use instead of connecting
+        """
+        self.redis_client = client or get_redis_client(
+            host, port, db, password)
+        self.key_prefix = key_prefix
+        self._ttls = {
+            MINUTE: DAY + MINUTE,
+            HOUR: _retention_hours(retention_period) * HOUR + HOUR
+        }
+        self._flush_threshold = flush_threshold
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int, int], List[int]] = {}
+        self._pending_updates = 0
+
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically,
+                                         args=(flush_interval, ),
+                                         name="observicia-usage-flush",
+                                         daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def add(self, provider: str, prompt_tokens: int, completion_tokens: int,
+            now: float) -> None:
+        """Add token counts to the local batch."""
+        with self._lock:
+            for resolution in self._ttls:
+                key = (provider, resolution, int(now // resolution))
+                counts = self._pending.setdefault(key, [0, 0])
+                counts[0] += prompt_tokens
+                counts[1] += completion_tokens
+            self._pending_updates += 1
+            flush = self._pending_updates >= self._flush_threshold
+        if flush:
+            self.flush()
+
+    def sum(self, provider: str, now: float,
+            window: timedelta) -> Tuple[int, int]:
+        """Sum flushed and pending usage of the buckets within the window."""
+        seconds = window.total_seconds()
+        resolution = MINUTE if seconds <= DAY else HOUR
+        epochs = range(int((now - seconds) // resolution),
+                       int(now // resolution) + 1)
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for epoch in epochs:
+            pipeline.hmget(self._bucket_key(provider, resolution, epoch),
+                           "prompt", "completion")
+        prompt_tokens = completion_tokens = 0
+        for prompt, completion in pipeline.execute():
+            prompt_tokens += int(prompt or 0)
+            completion_tokens += int(completion or 0)
+
+        with self._lock:
+            for epoch in epochs:
+                counts = self._pending.get((provider, resolution, epoch))
+                if counts is not None:
+                    prompt_tokens += counts[0]
+                    completion_tokens += counts[1]
+        return prompt_tokens, completion_tokens
+
+    def providers(self) -> List[str]:
+        """Get providers recorded by any process."""
+        providers = set(
+            self.redis_client.smembers(f"{self.key_prefix}providers"))
+        with self._lock:
+            providers.update(provider for provider, _, _ in self._pending)
+        return sorted(providers)
+
+    def flush(self) -> None:
+        """Write the local batch to Redis atomically."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_updates = 0
+        if not pending:
+            return
+
+        try:
+            pipeline = self.redis_client.pipeline(transaction=True)
+            for (provider, resolution,
+                 epoch), (prompt_tokens, completion_tokens) in pending.items():
+                key = self._bucket_key(provider, resolution, epoch)
+                pipeline.hincrby(key, "prompt", prompt_tokens)
+                pipeline.hincrby(key, "completion", completion_tokens)
+                pipeline.expire(key, self._ttls[resolution])
+            pipeline.sadd(f"{self.key_prefix}providers",
+                          *{provider
+                            for provider, _, _ in pending})
+            pipeline.execute()
+        except Exception as e:
+            print(f"Error flushing token usage to Redis: {e}")
+            # Keep the batch so it is retried on the next flush
+            with self._lock:
+                for key, (prompt_tokens, completion_tokens) in pending.items():
+                    counts = self._pending.setdefault(key, [0, 0])
+                    counts[0] += prompt_tokens
+                    counts[1] += completion_tokens
+
+    def close(self) -> None:
+        """Stop the background flusher and flush remaining usage."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    def _flush_periodically(self, interval: float) -> None:
+        """Flush the local batch until the backend is closed."""
+        while not self._stopped.wait(interval):
+            self.flush()
+
+    def _bucket_key(self, provider: str, resolution: int, epoch: int) -> str:
+        return f"{self.key_prefix}{provider}:{resolution}:{epoch}"
@@ -1,9 +1,20 @@
+import itertools
 import threading
-from collections import defaultdict
+import time
+from array import array
+from collections import OrderedDict
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import (Callable, Dict, Iterable, List, MutableSequence, Optional,
+                    Sequence, Tuple)
+
+# Dimensions usage can be broken down by, in series key order
+USAGE_DIMENSIONS = ("provider", "model", "user_id", "session_id",
+                    "transaction_id")
+
+# Stands in for high-cardinality dimension values once series are capped
+OVERFLOW_VALUE = "__other__"
 
 
 @dataclass
@@ -15,36 +26,305 @@ class TokenUsage:
     timestamp: datetime = field(default_factory=datetime.utcnow)
 
 
+class _BucketRing:
+    """
+    Fixed-resolution ring of token counters.
+
+    Each slot holds the counts of one `resolution`-second bucket and is
+    reset lazily when the ring wraps around, so updates are O(1) and
+    memory is fixed at `size` slots. `storage` may supply the epoch,
+    prompt and completion arrays, e.g. views into shared memory.
+    """
+
+    __slots__ = ("resolution", "size", "_epochs", "_prompt", "_completion")
+
+    def __init__(self,
+                 resolution: int,
+                 size: int,
+                 storage: Optional[Tuple[MutableSequence[int],
+                                         MutableSequence[int],
+                                         MutableSequence[int]]] = None) -> None:
+        self.resolution = resolution
+        self.size = size
+        if storage is None:
+            storage = (array('q', [-1]) * size, array('q', [0]) * size,
+                       array('q', [0]) * size)
+        self._epochs, self._prompt, self._completion = storage
+
+    @property
+    def span_seconds(self) -> int:
+        """Length of time covered by the ring."""
+        return self.resolution * self.size
+
+    def add(self, now: float, prompt_tokens: int,
+            completion_tokens: int) -> None:
+        """Add token counts to the bucket containing `now`."""
+        epoch = int(now // self.resolution)
+        slot = epoch % self.size
+        if self._epochs[slot] > epoch:
+            return  # older than the ring covers
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._prompt[slot] = 0
+            self._completion[slot] = 0
+        self._prompt[slot] += prompt_tokens
+        self._completion[slot] += completion_tokens
+
+    def sum(self,
+            now: float,
+            window: Optional[float] = None) -> Tuple[int, int]:
+        """Sum (prompt, completion) tokens of buckets within the window."""
+        current = int(now // self.resolution)
+        oldest = current - self.size + 1
+        if window is not None:
+            oldest = max(oldest, int((now - window) // self.resolution))
+
+        prompt_tokens = completion_tokens = 0
+        for slot in range(self.size):
+            if oldest <= self._epochs[slot] <= current:
+                prompt_tokens += self._prompt[slot]
+                completion_tokens += self._completion[slot]
+        return prompt_tokens, completion_tokens
+
+
+class _ProviderUsage:
+    """Per-second, per-minute and per-hour rollups for one provider."""
+
+    __slots__ = ("rings", )
+
+    def __init__(self, retention_period: timedelta) -> None:
+        retention_hours = max(
+            1, -(-int(retention_period.total_seconds()) // 3600))
+        self.rings = (
+            _BucketRing(1, 3600),  # last hour at second resolution
+            _BucketRing(60, 1440),  # last day at minute resolution
+            _BucketRing(3600, retention_hours),  # retention at hour resolution
+        )
+
+    def add(self, now: float, prompt_tokens: int,
+            completion_tokens: int) -> None:
+        """Record token counts in every rollup."""
+        for ring in self.rings:
+            ring.add(now, prompt_tokens, completion_tokens)
+
+    def sum(self,
+            now: float,
+            window: Optional[timedelta] = None) -> Tuple[int, int]:
+        """Sum token counts using the finest rollup covering the window."""
+        if window is None:
+            return self.rings[-1].sum(now)
+
+        seconds = window.total_seconds()
+        for ring in self.rings[:-1]:
+            if seconds <= ring.span_seconds:
+                return ring.sum(now, seconds)
+        return self.rings[-1].sum(now, seconds)
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the heaviest keys in a weighted stream.
+
+    Keeps at most `capacity` counters. When a new key arrives at capacity
+    it replaces the smallest counter and inherits its count, so counts
+    overestimate by at most the replaced count and any key heavier than
+    1/capacity of the total weight is guaranteed to be present.
+    """
+
+    __slots__ = ("capacity", "counts")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+
+    def add(self, key: str, weight: int) -> None:
+        """Add weight to a key, evicting the lightest key when full."""
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+        else:
+            lightest = min(self.counts, key=self.counts.__getitem__)
+            self.counts[key] = self.counts.pop(lightest) + weight
+
+    def clear(self) -> None:
+        """Drop all counters."""
+        self.counts.clear()
+
+
+class _TopKRing:
+    """Ring of Space-Saving summaries, one per `resolution`-second bucket."""
+
+    __slots__ = ("resolution", "size", "_epochs", "_summaries")
+
+    def __init__(self, resolution: int, size: int, capacity: int) -> None:
+        self.resolution = resolution
+        self.size = size
+        self._epochs = array('q', [-1]) * size
+        self._summaries = [SpaceSaving(capacity) for _ in range(size)]
+
+    @property
+    def span_seconds(self) -> int:
+        """Length of time covered by the ring."""
+        return self.resolution * self.size
+
+    def add(self, now: float, key: str, weight: int) -> None:
+        """Add weight to a key in the bucket containing `now`."""
+        epoch = int(now // self.resolution)
+        slot = epoch % self.size
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._summaries[slot].clear()
+        self._summaries[slot].add(key, weight)
+
+    def merge_into(self, totals: Dict[str, int], now: float,
+                   window: float) -> None:
+        """Add the counts of buckets within the window to `totals`."""
+        current = int(now // self.resolution)
+        oldest = max(current - self.size + 1,
+                     int((now - window) // self.resolution))
+        for slot in range(self.size):
+            if oldest <= self._epochs[slot] <= current:
+                for key, count in self._summaries[slot].counts.items():
+                    totals[key] = totals.get(key, 0) + count
+
+
+class _TrackerShard:
+    """A lock, per-provider rollups and usage series owned by a subset of threads."""
+
+    __slots__ = ("lock", "usage_by_provider", "series", "overflow", "top_k")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.usage_by_provider: Dict[str, _ProviderUsage] = {}
+        # Dimension tuple -> [prompt tokens, completion tokens, requests,
+        # last update], least recently updated first
+        self.series: "OrderedDict[Tuple[Optional[str], ...], List[int]]" = \
+            OrderedDict()
+        # Overflow series per provider and model, never expired
+        self.overflow: Dict[Tuple[Optional[str], ...], List[int]] = {}
+        self.top_k: Dict[str, _TopKRing] = {}
+
+
+class UsageBackend:
+    """
+    Shared store for per-provider token usage.
+
+    Lets processes on a host or across hosts see the same totals. Backends
+    keep at least minute-resolution buckets, so windows shorter than a
+    minute are rounded up to whole buckets.
+    """
+
+    def add(self, provider: str, prompt_tokens: int, completion_tokens: int,
+            now: float) -> None:
+        """Record token counts at a point in time."""
+        raise NotImplementedError
+
+    def sum(self, provider: str, now: float,
+            window: timedelta) -> Tuple[int, int]:
+        """Sum (prompt, completion) tokens of a provider within the window."""
+        raise NotImplementedError
+
+    def providers(self) -> List[str]:
+        """Get all providers with recorded usage."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Flush pending usage and release resources."""
+
+
 class TokenTracker:
-    """token tracker for multiple LLM providers."""
+    """
+    token tracker for multiple LLM providers.
+
+    Updates are spread over `shards` independently locked shards, with
+    each thread pinned to one shard, so concurrent workers rarely contend.
+    Reads merge the counters of all shards.
+
+    Besides per-provider totals, usage is kept per combination of
+    `USAGE_DIMENSIONS` (provider, model, user, session and transaction).
+    At most `max_series` combinations are tracked. To make room for new
+    ones, combinations not updated for `series_idle_timeout` are folded
+    into the overflow series of their provider and model, whose user,
+    session and transaction are `OVERFLOW_VALUE`; while none are idle, new
+    combinations are counted in the overflow series. The heaviest values of `top_k_dimensions` over the
+    last `top_k_window` are tracked with Space-Saving summaries of
+    `top_k_capacity` keys, so top-K queries use constant memory.
+
+    With a `backend`, per-provider totals and windows are also written to
+    and read from a store shared by all worker processes; dimension
+    series and top-K summaries stay local to the process.
+    """
+
+    def __init__(self,
+                 retention_period: timedelta = timedelta(days=7),
+                 shards: int = 16,
+                 max_series: int = 10000,
+                 top_k_dimensions: Sequence[str] = ("model", "user_id",
+                                                    "session_id"),
+                 top_k_capacity: int = 64,
+                 top_k_window: timedelta = timedelta(hours=1),
+                 top_k_buckets: int = 12,
+                 series_idle_timeout: timedelta = timedelta(hours=1),
+                 backend: Optional[UsageBackend] = None):
+        unknown = set(top_k_dimensions) - set(USAGE_DIMENSIONS)
+        if unknown:
+            raise ValueError(
+                f"Unknown usage dimensions: {', '.join(sorted(unknown))}")
 
-    def __init__(self, retention_period: timedelta = timedelta(days=7)):
         self._lock = threading.Lock()
         self._retention_period = retention_period
-        self._usage_by_provider: Dict[str,
-                                      List[TokenUsage]] = defaultdict(list)
+        self._shards = tuple(_TrackerShard() for _ in range(max(1, shards)))
+        self._shard_counter = itertools.count()
+        self._thread_local = threading.local()
         self._stream_usage: Dict[str, TokenUsage] = {}
+        self._backend = backend
+        self._listeners: List[Callable[[str, int, int, Dict[str, Optional[str]]],
+                                       None]] = []
 
-    def update(self, provider: str, prompt_tokens: int,
-               completion_tokens: int) -> None:
-        """Update token usage for a provider."""
-        usage = TokenUsage(prompt_tokens=prompt_tokens,
-                           completion_tokens=completion_tokens,
-                           total_tokens=prompt_tokens + completion_tokens)
+        self._max_series_per_shard = max(1, max_series // len(self._shards))
+        self._series_idle_seconds = series_idle_timeout.total_seconds()
+        self._top_k_dimensions = tuple(top_k_dimensions)
+        self._top_k_capacity = top_k_capacity
+        self._top_k_buckets = max(1, top_k_buckets)
+        self._top_k_resolution = max(
+            1, int(top_k_window.total_seconds()) // self._top_k_buckets)
 
-        with self._lock:
-            self._usage_by_provider[provider].append(usage)
-            self._cleanup_old_data(provider)
+    def update(self,
+               provider: str,
+               prompt_tokens: int,
+               completion_tokens: int,
+               model: Optional[str] = None,
+               user_id: Optional[str] = None,
+               session_id: Optional[str] = None,
+               transaction_id: Optional[str] = None) -> None:
+        """Update token usage for a provider and the given dimensions."""
+        self._record(provider, prompt_tokens, completion_tokens, time.time(),
+                     (provider, model, user_id, session_id, transaction_id))
+        if self._listeners:
+            dimensions = {
+                "model": model,
+                "user_id": user_id,
+                "session_id": session_id,
+                "transaction_id": transaction_id
+            }
+            for listener in self._listeners:
+                listener(provider, prompt_tokens, completion_tokens,
+                         dimensions)
+
+    def add_listener(
+        self, listener: Callable[[str, int, int, Dict[str, Optional[str]]],
+                                 None]
+    ) -> None:
+        """Call `listener(provider, prompt, completion, dimensions)` on every update."""
+        self._listeners.append(listener)
 
     def get_totals(self, provider: str) -> TokenUsage:
         """Retrieve total token usage for a provider."""
-        with self._lock:
-            total_usage = TokenUsage()
-            for usage in self._usage_by_provider.get(provider, []):
-                total_usage.prompt_tokens += usage.prompt_tokens
-                total_usage.completion_tokens += usage.completion_tokens
-                total_usage.total_tokens += usage.total_tokens
-            return total_usage
+        prompt_tokens, completion_tokens = self._sum(provider, time.time())
+        return TokenUsage(prompt_tokens=prompt_tokens,
+                          completion_tokens=completion_tokens,
+                          total_tokens=prompt_tokens + completion_tokens)
 
     @contextmanager
     def stream_context(self, provider: str, session_id: str):
@@ -55,50 +335,230 @@ class TokenTracker:
             yield self._stream_usage[session_id]
         finally:
             with self._lock:
-                if session_id in self._stream_usage:
-                    final_usage = self._stream_usage[session_id]
-                    usage = TokenUsage(
-                        prompt_tokens=final_usage.prompt_tokens,
-                        completion_tokens=final_usage.completion_tokens,
-                        total_tokens=final_usage.prompt_tokens +
-                        final_usage.completion_tokens)
-                    self._usage_by_provider[provider].append(usage)
-                    self._cleanup_old_data(provider)
-                    del self._stream_usage[session_id]
+                final_usage = self._stream_usage.pop(session_id, None)
+            if final_usage is not None:
+                self._record(provider, final_usage.prompt_tokens,
+                             final_usage.completion_tokens, time.time())
 
     def get_usage(self,
                   provider: str,
                   window: Optional[timedelta] = None) -> Dict[str, int]:
         """Get token usage statistics for a provider."""
-        with self._lock:
-            usages = self._usage_by_provider[provider]
-            if window:
-                cutoff = datetime.utcnow() - window
-                usages = [u for u in usages if u.timestamp >= cutoff]
-
-            return {
-                "prompt_tokens": sum(u.prompt_tokens for u in usages),
-                "completion_tokens": sum(u.completion_tokens for u in usages),
-                "total_tokens": sum(u.total_tokens for u in usages)
-            }
+        prompt_tokens, completion_tokens = self._sum(provider, time.time(),
+                                                     window)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
 
     def get_usage_all_providers(
             self,
             window: Optional[timedelta] = None) -> Dict[str, Dict[str, int]]:
         """Get token usage statistics for all providers."""
-        with self._lock:
-            return {
-                provider: self.get_usage(provider, window)
-                for provider in self._usage_by_provider.keys()
+        return {
+            provider: self.get_usage(provider, window)
+            for provider in self.providers()
+        }
+
+    def get_usage_by(self,
+                     group_by: Sequence[str] = ("provider", "model"),
+                     **filters: Optional[str]
+                     ) -> Dict[Tuple[Optional[str], ...], Dict[str, int]]:
+        """
+        Get cumulative usage grouped by one or more dimensions.
+
+        Args:
+            group_by: Dimensions from `USAGE_DIMENSIONS` to group by
+            **filters: Dimension values usage must match, e.g. model="gpt-4"
+
+        Returns:
+            Usage statistics keyed by tuples of the grouped dimension values
+        """
+        indexes = self._dimension_indexes(group_by)
+        filter_items = list(
+            zip(self._dimension_indexes(filters), filters.values()))
+
+        grouped: Dict[Tuple[Optional[str], ...], List[int]] = {}
+        for shard in self._shards:
+            with shard.lock:
+                for key, counts in itertools.chain(shard.series.items(),
+                                                   shard.overflow.items()):
+                    if any(key[index] != value
+                           for index, value in filter_items):
+                        continue
+                    group = tuple(key[index] for index in indexes)
+                    totals = grouped.setdefault(group, [0, 0, 0])
+                    for i in range(3):
+                        totals[i] += counts[i]
+
+        return {
+            group: {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "requests": requests
             }
+            for group, (prompt_tokens, completion_tokens,
+                        requests) in grouped.items()
+        }
+
+    def top_k(self,
+              dimension: str,
+              n: int = 20,
+              window: Optional[timedelta] = None) -> List[Tuple[str, int]]:
+        """
+        Get the heaviest values of a dimension by total tokens.
+
+        Counts are Space-Saving estimates and may overstate light keys.
+
+        Args:
+            dimension: One of the tracker's `top_k_dimensions`
+            n: Number of values to return
+            window: Time window to rank over, capped at the top-K window
+
+        Returns:
+            (value, total tokens) pairs, heaviest first
+        """
+        if dimension not in self._top_k_dimensions:
+            raise ValueError(f"Dimension not tracked for top-K: {dimension}")
+
+        span_seconds = self._top_k_resolution * self._top_k_buckets
+        seconds = span_seconds if window is None else min(
+            window.total_seconds(), span_seconds)
+        now = time.time()
+
+        totals: Dict[str, int] = {}
+        for shard in self._shards:
+            with shard.lock:
+                ring = shard.top_k.get(dimension)
+                if ring is not None:
+                    ring.merge_into(totals, now, seconds)
+
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def providers(self) -> List[str]:
+        """Get all providers with recorded usage."""
+        if self._backend is not None:
+            return self._backend.providers()
+
+        providers = set()
+        for shard in self._shards:
+            with shard.lock:
+                providers.update(shard.usage_by_provider.keys())
+        return sorted(providers)
+
+    def close(self) -> None:
+        """Flush and close the shared usage backend, if any."""
+        if self._backend is not None:
+            self._backend.close()
+
+    def _local_shard(self) -> _TrackerShard:
+        """Get the shard the calling thread is pinned to."""
+        shard = getattr(self._thread_local, "shard", None)
+        if shard is None:
+            shard = self._shards[next(self._shard_counter) %
+                                 len(self._shards)]
+            self._thread_local.shard = shard
+        return shard
+
+    def _record(
+            self,
+            provider: str,
+            prompt_tokens: int,
+            completion_tokens: int,
+            now: float,
+            dimensions: Optional[Tuple[Optional[str], ...]] = None) -> None:
+        """Record usage at a point in time in the calling thread's shard."""
+        if dimensions is None:
+            dimensions = (provider, None, None, None, None)
+
+        shard = self._local_shard()
+        with shard.lock:
+            usage = shard.usage_by_provider.get(provider)
+            if usage is None:
+                usage = _ProviderUsage(self._retention_period)
+                shard.usage_by_provider[provider] = usage
+            usage.add(now, prompt_tokens, completion_tokens)
+
+            counts = shard.series.get(dimensions)
+            if counts is not None:
+                shard.series.move_to_end(dimensions)
+            else:
+                if len(shard.series) >= self._max_series_per_shard:
+                    self._expire_series(shard, now)
+                if len(shard.series) < self._max_series_per_shard:
+                    counts = shard.series[dimensions] = [0, 0, 0, 0]
+                else:
+                    counts = shard.overflow.setdefault(
+                        dimensions[:2] + (OVERFLOW_VALUE, ) * 3, [0, 0, 0, 0])
+            counts[0] += prompt_tokens
+            counts[1] += completion_tokens
+            counts[2] += 1
+            counts[3] = max(counts[3], int(now))
+
+            # Heavy hitters see the real values even once series overflow
+            total_tokens = prompt_tokens + completion_tokens
+            for dimension in self._top_k_dimensions:
+                value = dimensions[USAGE_DIMENSIONS.index(dimension)]
+                if value is None:
+                    continue
+                ring = shard.top_k.get(dimension)
+                if ring is None:
+                    ring = _TopKRing(self._top_k_resolution,
+                                     self._top_k_buckets,
+                                     self._top_k_capacity)
+                    shard.top_k[dimension] = ring
+                ring.add(now, value, total_tokens)
+
+        if self._backend is not None:
+            try:
+                self._backend.add(provider, prompt_tokens, completion_tokens,
+                                  now)
+            except Exception as e:
+                print(f"Error recording token usage in backend: {e}")
+
+    def _expire_series(self, shard: _TrackerShard, now: float) -> None:
+        """Fold series idle for longer than the idle timeout into overflow."""
+        cutoff = now - self._series_idle_seconds
+        while shard.series:
+            key, counts = next(iter(shard.series.items()))
+            if counts[3] > cutoff:
+                return
+            del shard.series[key]
+            overflow = shard.overflow.setdefault(
+                key[:2] + (OVERFLOW_VALUE, ) * 3, [0, 0, 0, 0])
+            for i in range(3):
+                overflow[i] += counts[i]
+            overflow[3] = max(overflow[3], counts[3])
+
+    @staticmethod
+    def _dimension_indexes(dimensions: Iterable[str]) -> List[int]:
+        """Map dimension names to their position in series keys."""
+        indexes = []
+        for dimension in dimensions:
+            if dimension not in USAGE_DIMENSIONS:
+                raise ValueError(f"Unknown usage dimension: {dimension}")
+            indexes.append(USAGE_DIMENSIONS.index(dimension))
+        return indexes
 
-    def _cleanup_old_data(self, provider: str) -> None:
-        """Remove data older than the retention period."""
-        if provider not in self._usage_by_provider:
-            return
+    def _sum(self,
+             provider: str,
+             now: float,
+             window: Optional[timedelta] = None) -> Tuple[int, int]:
+        """Sum usage for a provider across all shards."""
+        if window is None or window > self._retention_period:
+            window = self._retention_period
+        if self._backend is not None:
+            return self._backend.sum(provider, now, window)
 
-        cutoff = datetime.utcnow() - self._retention_period
-        self._usage_by_provider[provider] = [
-            usage for usage in self._usage_by_provider[provider]
-            if usage.timestamp >= cutoff
-        ]
+        prompt_tokens = completion_tokens = 0
+        for shard in self._shards:
+            with shard.lock:
+                usage = shard.usage_by_provider.get(provider)
+                if usage is None:
+                    continue
+                shard_prompt, shard_completion = usage.sum(now, window)
+            prompt_tokens += shard_prompt
+            completion_tokens += shard_completion
+        return prompt_tokens, completion_tokens
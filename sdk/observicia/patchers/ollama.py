@@ -5,8 +5,14 @@ from inspect import getfullargspec
 from ..core.context_manager import ObservabilityContext
 from ..core.token_tracker import TokenTracker, TokenUsage
 from ..utils.tracing_helpers import start_llm_span
-from ..utils.token_helpers import count_text_tokens, update_token_usage
-from ..utils.policy_helpers import enforce_policies
+from ..utils.token_helpers import (count_message_tokens, count_text_tokens,
+                                   count_text_tokens_batch,
+                                   update_token_usage, usage_dimensions)
+from ..utils.policy_helpers import (enforce_policies, enforce_policies_async,
+                                    run_with_prompt_gate,
+                                    run_with_prompt_gate_async)
+from ..utils.budget_helpers import (enforce_budget, enforce_budget_async,
+                                     refund_on_error)
 from ..utils.stream_helpers import handle_stream, handle_async_stream
 
 
@@ -154,20 +160,29 @@ class OllamaPatcher:
                     model = actual_kwargs.get('model', '')
                     prompt_tokens = count_text_tokens(prompt, model)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = enforce_budget(self._context, span, "ollama",
+                                            model, prompt_tokens)
                     print(f"Prompt tokens: {prompt_tokens}")
 
                     if actual_kwargs.get('stream', False):
-                        return handle_stream(func,
-                                             None,
-                                             span,
-                                             prompt_tokens,
-                                             self._token_tracker,
-                                             self._context,
-                                             prompt=prompt,
-                                             *args,
-                                             **kwargs)
-
-                    response = func(*args, **kwargs)
+                        with refund_on_error(refund):
+                            return run_with_prompt_gate(
+                                self._context, span, prompt,
+                                lambda: handle_stream(func,
+                                                      None,
+                                                      span,
+                                                      prompt_tokens,
+                                                      self._token_tracker,
+                                                      self._context,
+                                                      prompt=prompt,
+                                                      provider="ollama",
+                                                      *args,
+                                                      **kwargs))
+
+                    with refund_on_error(refund):
+                        response = run_with_prompt_gate(
+                            self._context, span, prompt,
+                            lambda: func(*args, **kwargs))
                     completion = response.get('response', '')
                     completion_tokens = count_text_tokens(completion, model)
 
@@ -182,7 +197,11 @@ class OllamaPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "ollama", usage)
+                    update_token_usage(self._token_tracker,
+                                       "ollama",
+                                       usage,
+                                       model=model,
+                                       context=self._context)
 
                     if self._context and self._context.policy_engine:
                         enforce_policies(self._context,
@@ -225,23 +244,31 @@ class OllamaPatcher:
                     model = actual_kwargs.get('model', '')
                     prompt = messages[-1].get('content',
                                               '') if messages else ''
-                    prompt_tokens = sum(
-                        count_text_tokens(msg.get('content', ''), model)
-                        for msg in messages or [])
+                    prompt_tokens = count_message_tokens(
+                        messages or [], model, context=self._context)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = enforce_budget(self._context, span, "ollama",
+                                            model, prompt_tokens)
 
                     if actual_kwargs.get('stream', False):
-                        return handle_stream(func,
-                                             None,
-                                             span,
-                                             prompt_tokens,
-                                             self._token_tracker,
-                                             self._context,
-                                             prompt=prompt,
-                                             *args,
-                                             **kwargs)
-
-                    response = func(*args, **kwargs)
+                        with refund_on_error(refund):
+                            return run_with_prompt_gate(
+                                self._context, span, prompt,
+                                lambda: handle_stream(func,
+                                                      None,
+                                                      span,
+                                                      prompt_tokens,
+                                                      self._token_tracker,
+                                                      self._context,
+                                                      prompt=prompt,
+                                                      provider="ollama",
+                                                      *args,
+                                                      **kwargs))
+
+                    with refund_on_error(refund):
+                        response = run_with_prompt_gate(
+                            self._context, span, prompt,
+                            lambda: func(*args, **kwargs))
                     completion = response.get('message', {}).get('content', '')
                     completion_tokens = count_text_tokens(completion, model)
 
@@ -256,7 +283,11 @@ class OllamaPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "ollama", usage)
+                    update_token_usage(self._token_tracker,
+                                       "ollama",
+                                       usage,
+                                       model=model,
+                                       context=self._context)
 
                     if self._context and self._context.policy_engine:
                         enforce_policies(self._context,
@@ -287,22 +318,32 @@ class OllamaPatcher:
                 try:
                     prompt_tokens = count_text_tokens(prompt, model)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "ollama", model,
+                                                        prompt_tokens)
 
                     if kwargs.get('stream', False):
-                        return await handle_async_stream(func,
-                                                         client_self,
-                                                         span,
-                                                         prompt_tokens,
-                                                         self._token_tracker,
-                                                         self._context,
-                                                         prompt=prompt,
-                                                         model=model,
-                                                         **kwargs)
-
-                    response = await func(client_self,
-                                          model=model,
-                                          prompt=prompt,
-                                          **kwargs)
+                        with refund_on_error(refund):
+                            return await run_with_prompt_gate_async(
+                                self._context, span, prompt,
+                                lambda: handle_async_stream(func,
+                                                            client_self,
+                                                            span,
+                                                            prompt_tokens,
+                                                            self._token_tracker,
+                                                            self._context,
+                                                            prompt=prompt,
+                                                            provider="ollama",
+                                                            model=model,
+                                                            **kwargs))
+
+                    with refund_on_error(refund):
+                        response = await run_with_prompt_gate_async(
+                            self._context, span, prompt,
+                            lambda: func(client_self,
+                                         model=model,
+                                         prompt=prompt,
+                                         **kwargs))
                     completion = response.get('response', '')
                     completion_tokens = count_text_tokens(completion, model)
 
@@ -317,14 +358,18 @@ class OllamaPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "ollama", usage)
+                    update_token_usage(self._token_tracker,
+                                       "ollama",
+                                       usage,
+                                       model=model,
+                                       context=self._context)
 
                     if self._context and self._context.policy_engine:
-                        enforce_policies(self._context,
-                                         span,
-                                         response,
-                                         prompt=prompt,
-                                         completion=completion)
+                        await enforce_policies_async(self._context,
+                                                     span,
+                                                     response,
+                                                     prompt=prompt,
+                                                     completion=completion)
 
                     return response
 
@@ -348,26 +393,35 @@ class OllamaPatcher:
                 try:
                     prompt = messages[-1].get('content',
                                               '') if messages else ''
-                    prompt_tokens = sum(
-                        count_text_tokens(msg.get('content', ''), model)
-                        for msg in messages or [])
+                    prompt_tokens = count_message_tokens(
+                        messages or [], model, context=self._context)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "ollama", model,
+                                                        prompt_tokens)
 
                     if kwargs.get('stream', False):
-                        return await handle_async_stream(func,
-                                                         client_self,
-                                                         span,
-                                                         prompt_tokens,
-                                                         self._token_tracker,
-                                                         self._context,
-                                                         prompt=prompt,
-                                                         model=model,
-                                                         **kwargs)
-
-                    response = await func(client_self,
-                                          model=model,
-                                          messages=messages,
-                                          **kwargs)
+                        with refund_on_error(refund):
+                            return await run_with_prompt_gate_async(
+                                self._context, span, prompt,
+                                lambda: handle_async_stream(func,
+                                                            client_self,
+                                                            span,
+                                                            prompt_tokens,
+                                                            self._token_tracker,
+                                                            self._context,
+                                                            prompt=prompt,
+                                                            provider="ollama",
+                                                            model=model,
+                                                            **kwargs))
+
+                    with refund_on_error(refund):
+                        response = await run_with_prompt_gate_async(
+                            self._context, span, prompt,
+                            lambda: func(client_self,
+                                         model=model,
+                                         messages=messages,
+                                         **kwargs))
                     completion = response.get('message', {}).get('content', '')
                     completion_tokens = count_text_tokens(completion, model)
 
@@ -382,14 +436,18 @@ class OllamaPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "ollama", usage)
+                    update_token_usage(self._token_tracker,
+                                       "ollama",
+                                       usage,
+                                       model=model,
+                                       context=self._context)
 
                     if self._context and self._context.policy_engine:
-                        enforce_policies(self._context,
-                                         span,
-                                         response,
-                                         prompt=prompt,
-                                         completion=completion)
+                        await enforce_policies_async(self._context,
+                                                     span,
+                                                     response,
+                                                     prompt=prompt,
+                                                     completion=completion)
 
                     return response
 
@@ -409,13 +467,17 @@ class OllamaPatcher:
                     **kwargs: Any) -> Any:
             with start_llm_span("ollama.embed", kwargs) as span:
                 try:
-                    input_tokens = count_text_tokens(input, model)
+                    input_tokens = count_text_tokens(input, model) if isinstance(input, str) else \
+                                 sum(count_text_tokens_batch(input, model))
                     span.set_attribute("prompt.tokens", input_tokens)
-
-                    response = func(client_self,
-                                    model=model,
-                                    input=input,
-                                    **kwargs)
+                    refund = enforce_budget(self._context, span, "ollama",
+                                            model, input_tokens)
+
+                    with refund_on_error(refund):
+                        response = func(client_self,
+                                        model=model,
+                                        input=input,
+                                        **kwargs)
                     span.set_attributes({
                         "embedding_dim":
                         len(response.get('embeddings', [[]])[0]),
@@ -423,9 +485,11 @@ class OllamaPatcher:
                         model
                     })
 
-                    self._token_tracker.update("ollama",
-                                               prompt_tokens=input_tokens,
-                                               completion_tokens=0)
+                    self._token_tracker.update(
+                        "ollama",
+                        prompt_tokens=input_tokens,
+                        completion_tokens=0,
+                        **usage_dimensions(self._context, model))
 
                     return response
 
@@ -445,13 +509,18 @@ class OllamaPatcher:
                           **kwargs: Any) -> Any:
             with start_llm_span("ollama.embed.async", kwargs) as span:
                 try:
-                    input_tokens = count_text_tokens(input, model)
+                    input_tokens = count_text_tokens(input, model) if isinstance(input, str) else \
+                                 sum(count_text_tokens_batch(input, model))
                     span.set_attribute("prompt.tokens", input_tokens)
-
-                    response = await func(client_self,
-                                          model=model,
-                                          input=input,
-                                          **kwargs)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "ollama", model,
+                                                        input_tokens)
+
+                    with refund_on_error(refund):
+                        response = await func(client_self,
+                                              model=model,
+                                              input=input,
+                                              **kwargs)
                     span.set_attributes({
                         "embedding_dim":
                         len(response.get('embeddings', [[]])[0]),
@@ -459,9 +528,11 @@ class OllamaPatcher:
                         model
                     })
 
-                    self._token_tracker.update("ollama",
-                                               prompt_tokens=input_tokens,
-                                               completion_tokens=0)
+                    self._token_tracker.update(
+                        "ollama",
+                        prompt_tokens=input_tokens,
+                        completion_tokens=0,
+                        **usage_dimensions(self._context, model))
 
                     return response
 
@@ -14,8 +14,14 @@ from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from ..core.token_tracker import TokenTracker
 from ..core.context_manager import ObservabilityContext
 from ..utils.tracing_helpers import start_llm_span, record_token_usage
-from ..utils.token_helpers import count_prompt_tokens, count_text_tokens, update_token_usage
-from ..utils.policy_helpers import enforce_policies
+from ..utils.token_helpers import (count_prompt_tokens, count_text_tokens,
+                                   count_text_tokens_batch,
+                                   update_token_usage)
+from ..utils.policy_helpers import (enforce_policies, enforce_policies_async,
+                                    run_with_prompt_gate,
+                                    run_with_prompt_gate_async)
+from ..utils.budget_helpers import (enforce_budget, enforce_budget_async,
+                                     refund_on_error)
 from ..utils.stream_helpers import handle_async_stream, handle_stream
 from ..utils.logging import ObserviciaLogger
 
@@ -146,23 +152,33 @@ class OpenAIPatcher:
                 try:
                     messages = kwargs.get('messages', [])
                     model = kwargs.get('model', 'gpt-3.5-turbo')
-                    prompt_tokens = count_prompt_tokens(messages, model)
+                    prompt_tokens = count_prompt_tokens(messages,
+                                                        model,
+                                                        context=self._context)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = enforce_budget(self._context, span, "openai",
+                                            model, prompt_tokens)
                     prompt = messages[-1]['content'] if messages else ""
 
                     if kwargs.get('stream', False):
-                        return handle_stream(func,
-                                             client_self,
-                                             span,
-                                             prompt_tokens,
-                                             self._token_tracker,
-                                             self._context,
-                                             prompt=prompt,
-                                             is_chat=True,
-                                             *args,
-                                             **kwargs)
-
-                    response = func(client_self, *args, **kwargs)
+                        with refund_on_error(refund):
+                            return run_with_prompt_gate(
+                                self._context, span, prompt,
+                                lambda: handle_stream(func,
+                                                      client_self,
+                                                      span,
+                                                      prompt_tokens,
+                                                      self._token_tracker,
+                                                      self._context,
+                                                      prompt=prompt,
+                                                      is_chat=True,
+                                                      *args,
+                                                      **kwargs))
+
+                    with refund_on_error(refund):
+                        response = run_with_prompt_gate(
+                            self._context, span, prompt,
+                            lambda: func(client_self, *args, **kwargs))
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else 0
                     completion_tokens = response.usage.completion_tokens if hasattr(
@@ -172,8 +188,11 @@ class OpenAIPatcher:
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
 
                     completion = response.choices[
                         0].message.content if response.choices else ""
@@ -205,23 +224,34 @@ class OpenAIPatcher:
                 try:
                     messages = kwargs.get('messages', [])
                     model = kwargs.get('model', 'gpt-3.5-turbo')
-                    prompt_tokens = count_prompt_tokens(messages, model)
+                    prompt_tokens = count_prompt_tokens(messages,
+                                                        model,
+                                                        context=self._context)
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "openai", model,
+                                                        prompt_tokens)
                     prompt = messages[-1]['content'] if messages else ""
 
                     if kwargs.get('stream', False):
-                        return await handle_async_stream(func,
-                                                         client_self,
-                                                         span,
-                                                         prompt_tokens,
-                                                         self._token_tracker,
-                                                         self._context,
-                                                         prompt=prompt,
-                                                         is_chat=True,
-                                                         *args,
-                                                         **kwargs)
-
-                    response = await func(client_self, *args, **kwargs)
+                        with refund_on_error(refund):
+                            return await run_with_prompt_gate_async(
+                                self._context, span, prompt,
+                                lambda: handle_async_stream(func,
+                                                            client_self,
+                                                            span,
+                                                            prompt_tokens,
+                                                            self._token_tracker,
+                                                            self._context,
+                                                            prompt=prompt,
+                                                            is_chat=True,
+                                                            *args,
+                                                            **kwargs))
+
+                    with refund_on_error(refund):
+                        response = await run_with_prompt_gate_async(
+                            self._context, span, prompt,
+                            lambda: func(client_self, *args, **kwargs))
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else 0
                     completion_tokens = response.usage.completion_tokens if hasattr(
@@ -231,17 +261,20 @@ class OpenAIPatcher:
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
 
                     completion = response.choices[
                         0].message.content if response.choices else ""
 
-                    enforce_policies(self._context,
-                                     span,
-                                     response,
-                                     prompt=prompt,
-                                     completion=completion)
+                    await enforce_policies_async(self._context,
+                                                 span,
+                                                 response,
+                                                 prompt=prompt,
+                                                 completion=completion)
                     return response
 
                 except Exception as e:
@@ -263,23 +296,31 @@ class OpenAIPatcher:
                     prompt = kwargs.get('prompt', '')
                     model = kwargs.get('model', 'gpt-3.5-turbo')
                     prompt_tokens = count_text_tokens(prompt, model) if isinstance(prompt, str) else \
-                                  sum(count_text_tokens(p, model) for p in prompt)
+                                  sum(count_text_tokens_batch(prompt, model))
 
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = enforce_budget(self._context, span, "openai",
+                                            model, prompt_tokens)
 
                     if kwargs.get('stream', False):
-                        return handle_stream(func,
-                                             client_self,
-                                             span,
-                                             prompt_tokens,
-                                             self._token_tracker,
-                                             self._context,
-                                             prompt=prompt,
-                                             is_chat=False,
-                                             *args,
-                                             **kwargs)
-
-                    response = func(client_self, *args, **kwargs)
+                        with refund_on_error(refund):
+                            return run_with_prompt_gate(
+                                self._context, span, prompt,
+                                lambda: handle_stream(func,
+                                                      client_self,
+                                                      span,
+                                                      prompt_tokens,
+                                                      self._token_tracker,
+                                                      self._context,
+                                                      prompt=prompt,
+                                                      is_chat=False,
+                                                      *args,
+                                                      **kwargs))
+
+                    with refund_on_error(refund):
+                        response = run_with_prompt_gate(
+                            self._context, span, prompt,
+                            lambda: func(client_self, *args, **kwargs))
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else 0
                     completion_tokens = response.usage.completion_tokens if hasattr(
@@ -289,8 +330,11 @@ class OpenAIPatcher:
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
 
                     completion = response.choices[
                         0].text if response.choices else ""
@@ -322,22 +366,31 @@ class OpenAIPatcher:
                     prompt = kwargs.get('prompt', '')
                     model = kwargs.get('model', 'gpt-3.5-turbo')
                     prompt_tokens = count_text_tokens(prompt, model) if isinstance(prompt, str) else \
-                                  sum(count_text_tokens(p, model) for p in prompt)
+                                  sum(count_text_tokens_batch(prompt, model))
 
                     span.set_attribute("prompt.tokens", prompt_tokens)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "openai", model,
+                                                        prompt_tokens)
 
                     if kwargs.get('stream', False):
-                        return await handle_async_stream(func,
-                                                         client_self,
-                                                         span,
-                                                         prompt_tokens,
-                                                         self._token_tracker,
-                                                         self._context,
-                                                         is_chat=False,
-                                                         *args,
-                                                         **kwargs)
-
-                    response = await func(client_self, *args, **kwargs)
+                        with refund_on_error(refund):
+                            return await run_with_prompt_gate_async(
+                                self._context, span, prompt,
+                                lambda: handle_async_stream(func,
+                                                            client_self,
+                                                            span,
+                                                            prompt_tokens,
+                                                            self._token_tracker,
+                                                            self._context,
+                                                            is_chat=False,
+                                                            *args,
+                                                            **kwargs))
+
+                    with refund_on_error(refund):
+                        response = await run_with_prompt_gate_async(
+                            self._context, span, prompt,
+                            lambda: func(client_self, *args, **kwargs))
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else 0
                     completion_tokens = response.usage.completion_tokens if hasattr(
@@ -347,12 +400,15 @@ class OpenAIPatcher:
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
 
                     completion = response.choices[
                         0].text if response.choices else ""
-                    enforce_policies(
+                    await enforce_policies_async(
                         self._context,
                         span,
                         response,
@@ -377,18 +433,24 @@ class OpenAIPatcher:
                     input_text = kwargs.get('input', '')
                     model = kwargs.get('model', 'text-embedding-ada-002')
                     input_tokens = count_text_tokens(input_text, model) if isinstance(input_text, str) else \
-                                 sum(count_text_tokens(text, model) for text in input_text)
+                                 sum(count_text_tokens_batch(input_text, model))
 
                     span.set_attribute("input.tokens", input_tokens)
-                    response = func(client_self, *args, **kwargs)
+                    refund = enforce_budget(self._context, span, "openai",
+                                            model, input_tokens)
+                    with refund_on_error(refund):
+                        response = func(client_self, *args, **kwargs)
 
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else input_tokens
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
                     return response
 
                 except Exception as e:
@@ -408,18 +470,25 @@ class OpenAIPatcher:
                     input_text = kwargs.get('input', '')
                     model = kwargs.get('model', 'text-embedding-ada-002')
                     input_tokens = count_text_tokens(input_text, model) if isinstance(input_text, str) else \
-                                 sum(count_text_tokens(text, model) for text in input_text)
+                                 sum(count_text_tokens_batch(input_text, model))
 
                     span.set_attribute("input.tokens", input_tokens)
-                    response = await func(client_self, *args, **kwargs)
+                    refund = await enforce_budget_async(self._context, span,
+                                                        "openai", model,
+                                                        input_tokens)
+                    with refund_on_error(refund):
+                        response = await func(client_self, *args, **kwargs)
 
                     total_tokens = response.usage.total_tokens if hasattr(
                         response, 'usage') else input_tokens
                     span.set_attribute("total.tokens", total_tokens)
 
                     if hasattr(response, 'usage'):
-                        update_token_usage(self._token_tracker, "openai",
-                                           response.usage)
+                        update_token_usage(self._token_tracker,
+                                           "openai",
+                                           response.usage,
+                                           model=model,
+                                           context=self._context)
                     return response
 
                 except Exception as e:
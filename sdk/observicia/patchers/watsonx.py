@@ -9,6 +9,7 @@ from ..core.token_tracker import TokenTracker, TokenUsage
 from ..core.context_manager import ObservabilityContext
 from ..utils.tracing_helpers import start_llm_span, record_token_usage
 from ..utils.token_helpers import count_prompt_tokens, count_text_tokens, update_token_usage
+from ..utils.policy_helpers import run_with_prompt_gate
 from ..utils.logging import ObserviciaLogger
 
 
@@ -53,10 +54,12 @@ class WatsonxPatcher:
                     if isinstance(prompt, str):
                         span.set_attribute("prompt", prompt)
 
-                    response = func(model_self, prompt, params, guardrails,
-                                    guardrails_hap_params,
-                                    guardrails_pii_params, concurrency_limit,
-                                    async_mode, validate_prompt_variables)
+                    response = run_with_prompt_gate(
+                        self._context, span, prompt,
+                        lambda: func(model_self, prompt, params, guardrails,
+                                     guardrails_hap_params,
+                                     guardrails_pii_params, concurrency_limit,
+                                     async_mode, validate_prompt_variables))
 
                     # Extract and record token usage from response
                     if isinstance(response, dict) and "results" in response:
@@ -75,7 +78,11 @@ class WatsonxPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "watsonx", usage)
+                    update_token_usage(self._token_tracker,
+                                       "watsonx",
+                                       usage,
+                                       model=model_self.model_id,
+                                       context=self._context)
 
                     return response
 
@@ -112,10 +119,12 @@ class WatsonxPatcher:
                     if isinstance(prompt, str):
                         span.set_attribute("prompt", prompt)
 
-                    response = func(model_self, prompt, params, raw_response,
-                                    guardrails, guardrails_hap_params,
-                                    guardrails_pii_params, concurrency_limit,
-                                    validate_prompt_variables)
+                    response = run_with_prompt_gate(
+                        self._context, span, prompt,
+                        lambda: func(model_self, prompt, params, raw_response,
+                                     guardrails, guardrails_hap_params,
+                                     guardrails_pii_params, concurrency_limit,
+                                     validate_prompt_variables))
 
                     # Handle token tracking if raw_response is True
                     if raw_response and isinstance(
@@ -135,7 +144,11 @@ class WatsonxPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "watsonx", usage)
+                    update_token_usage(self._token_tracker,
+                                       "watsonx",
+                                       usage,
+                                       model=model_self.model_id,
+                                       context=self._context)
 
                     return response
 
@@ -168,8 +181,12 @@ class WatsonxPatcher:
                 try:
                     span.set_attribute("messages", str(messages))
 
-                    response = func(model_self, messages, params, tools,
-                                    tool_choice, tool_choice_option)
+                    prompt = messages[-1].get("content",
+                                              "") if messages else ""
+                    response = run_with_prompt_gate(
+                        self._context, span, prompt,
+                        lambda: func(model_self, messages, params, tools,
+                                     tool_choice, tool_choice_option))
 
                     # Extract and record token usage
                     if "choices" in response:
@@ -191,7 +208,11 @@ class WatsonxPatcher:
                                        total_tokens=prompt_tokens +
                                        completion_tokens)
 
-                    update_token_usage(self._token_tracker, "watsonx", usage)
+                    update_token_usage(self._token_tracker,
+                                       "watsonx",
+                                       usage,
+                                       model=model_self.model_id,
+                                       context=self._context)
 
                     return response
 
@@ -0,0 +1,103 @@
+"""Utility functions for token budget enforcement"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from opentelemetry.trace import Span
+from observicia.core.budget_engine import (BudgetDecision, BudgetEngine,
+                                           BudgetExceededError)
+from .token_helpers import usage_dimensions
+
+
+def _record_decision(span: Span, decision: BudgetDecision,
+                     waited: float) -> None:
+    """Record a budget decision on the request span."""
+    attributes = {
+        "budget.decision":
+        "rejected" if not decision.allowed else
+        "delayed" if waited > 0 else "allowed",
+        "budget.wait_ms": int(waited * 1000)
+    }
+    if decision.budget is not None:
+        attributes["budget.name"] = decision.budget
+    if decision.remaining is not None:
+        attributes["budget.remaining"] = decision.remaining
+    span.set_attributes(attributes)
+
+
+def _budget_request(context: Any, provider: str, model: Optional[str]):
+    """Get the context's budget engine and the request's dimensions."""
+    engine = getattr(context, 'budget_engine', None)
+    if not isinstance(engine, BudgetEngine):
+        return None, None
+    return engine, {"provider": provider, **usage_dimensions(context, model)}
+
+
+def _refund(engine: BudgetEngine, span: Span, prompt_tokens: int,
+            dimensions: Dict[str, Optional[str]],
+            decision: BudgetDecision) -> Callable[[], None]:
+    """Get a callable giving back the tokens of an admitted request once."""
+    refunded = False
+
+    def refund() -> None:
+        nonlocal refunded
+        if refunded:
+            return
+        refunded = True
+        engine.refund(prompt_tokens, dimensions, decision)
+        span.set_attribute("budget.refunded_tokens", prompt_tokens)
+
+    return refund
+
+
+@contextmanager
+def refund_on_error(refund: Optional[Callable[[], None]]) -> Iterator[None]:
+    """
+    Refund admitted tokens if the guarded provider call raises.
+
+    Covers requests blocked by the prompt gate as well as provider errors
+    such as rate limits and timeouts, so retries don't drain the budget.
+    """
+    try:
+        yield
+    except BaseException:
+        if refund is not None:
+            refund()
+        raise
+
+
+def enforce_budget(context: Any, span: Span, provider: str,
+                   model: Optional[str],
+                   prompt_tokens: int) -> Optional[Callable[[], None]]:
+    """
+    Admit a request against the token budgets, waiting if allowed.
+
+    Returns:
+        A callable refunding the admitted tokens if the request is never
+        sent, or None when no budgets are configured
+    """
+    engine, dimensions = _budget_request(context, provider, model)
+    if engine is None:
+        return None
+    try:
+        decision, waited = engine.acquire(prompt_tokens, dimensions)
+    except BudgetExceededError as e:
+        _record_decision(span, e.decision, 0.0)
+        raise
+    _record_decision(span, decision, waited)
+    return _refund(engine, span, prompt_tokens, dimensions, decision)
+
+
+async def enforce_budget_async(
+        context: Any, span: Span, provider: str, model: Optional[str],
+        prompt_tokens: int) -> Optional[Callable[[], None]]:
+    """Admit a request against the token budgets without blocking the loop."""
+    engine, dimensions = _budget_request(context, provider, model)
+    if engine is None:
+        return None
+    try:
+        decision, waited = await engine.acquire_async(prompt_tokens,
+                                                      dimensions)
+    except BudgetExceededError as e:
+        _record_decision(span, e.decision, 0.0)
+        raise
+    _record_decision(span, decision, waited)
+    return _refund(engine, span, prompt_tokens, dimensions, decision)
@@ -1,44 +1,117 @@
 import sqlite3
+import threading
+import time
 import redis
-from typing import Dict, Any, Optional, Sequence
+from typing import Dict, Any, List, Optional, Sequence
 from datetime import datetime
 from opentelemetry.sdk.trace import ReadableSpan
-from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 from opentelemetry.trace import SpanContext
 
+from .redis_helpers import get_redis_client
+from .sqlite_schema import (NS_PER_SECOND, ROLLUP_UPSERT, aggregate_rollups,
+                            migrate)
+
 
 class SQLiteSpanExporter(SpanExporter):
-    """SpanExporter that writes spans to a SQLite database."""
+    """
+    SpanExporter that writes spans to a SQLite database.
+
+    One connection is kept open for the exporter's lifetime. The database
+    runs in WAL mode so dashboards can read while spans are written, and
+    every batch is inserted with a single `executemany` in one transaction.
+    Each batch is also summed into the per-minute and per-hour rollup
+    tables that dashboards query instead of the raw `telemetry` rows.
+
+    With `retention_hours` set, a background thread deletes expired raw
+    rows, and later expired rollups, in small chunks so exports are never
+    blocked for long, then returns free pages to the file system.
+    """
+
+    def __init__(self,
+                 database_path: str,
+                 synchronous: str = "NORMAL",
+                 cache_size_kib: int = 16384,
+                 busy_timeout_ms: int = 5000,
+                 retention_hours: Optional[float] = None,
+                 minute_rollup_retention_hours: float = 7 * 24,
+                 hour_rollup_retention_hours: float = 90 * 24,
+                 retention_interval_seconds: float = 300,
+                 retention_chunk_size: int = 5000,
+                 vacuum_pages: int = 1000,
+                 vacuum_interval_hours: Optional[float] = None):
+        """
+        Initialize SQLite exporter with database path.
+
+        Args:
+            database_path: Path of the SQLite database file
+            synchronous: SQLite `synchronous` pragma; NORMAL is durable
+                across application crashes in WAL mode
+            cache_size_kib: Page cache size in KiB
+            busy_timeout_ms: How long to wait for locks held by readers
+            retention_hours: How long raw spans are kept; None keeps
+                everything and disables the retention thread
+            minute_rollup_retention_hours: How long per-minute rollups are kept
+            hour_rollup_retention_hours: How long per-hour rollups are kept
+            retention_interval_seconds: Seconds between retention passes
+            retention_chunk_size: Rows deleted per transaction
+            vacuum_pages: Free pages released per pass with
+                `incremental_vacuum`
+            vacuum_interval_hours: Hours between full `VACUUM`s for
+                databases created without incremental auto-vacuum
+        """
+        if retention_hours is not None and min(
+                minute_rollup_retention_hours,
+                hour_rollup_retention_hours) < retention_hours:
+            raise ValueError(
+                "Rollups must be kept at least as long as raw spans")
 
-    def __init__(self, database_path: str):
-        """Initialize SQLite exporter with database path."""
         self.database_path = database_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            database_path,
+            check_same_thread=False,
+            timeout=busy_timeout_ms / 1000)
+        self._configure_connection(synchronous, cache_size_kib,
+                                   busy_timeout_ms)
         self._initialize_database()
 
+        self.retention_hours = retention_hours
+        self._retention = (("telemetry", "timestamp_ns", retention_hours),
+                           ("telemetry_rollup_minute", "bucket_ns",
+                            minute_rollup_retention_hours),
+                           ("telemetry_rollup_hour", "bucket_ns",
+                            hour_rollup_retention_hours))
+        self.retention_chunk_size = retention_chunk_size
+        self.vacuum_pages = vacuum_pages
+        self.vacuum_interval_hours = vacuum_interval_hours
+        self._last_vacuum = time.monotonic()
+
+        self._stopped = threading.Event()
+        self._retention_thread: Optional[threading.Thread] = None
+        if retention_hours is not None:
+            self._retention_thread = threading.Thread(
+                target=self._retain_periodically,
+                args=(retention_interval_seconds, ),
+                name="observicia-sqlite-retention",
+                daemon=True)
+            self._retention_thread.start()
+
+    def _configure_connection(self, synchronous: str, cache_size_kib: int,
+                              busy_timeout_ms: int) -> None:
+        """Enable WAL and tune the connection for many small inserts."""
+        # Only takes effect on new databases, before any table exists
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.execute(f"PRAGMA cache_size={-int(cache_size_kib)}")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+
     def _initialize_database(self) -> None:
-        """Create the database schema if it doesn't exist."""
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS telemetry (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    transaction_id TEXT,
-                    user_id TEXT,
-                    model TEXT,
-                    provider TEXT,
-                    request_type TEXT,
-                    prompt_tokens INTEGER,
-                    completion_tokens INTEGER,
-                    total_tokens INTEGER,
-                    duration_ms REAL,
-                    success BOOLEAN,
-                    trace_id TEXT,
-                    span_id TEXT,
-                    parent_span_id TEXT
-                )
-            ''')
-            conn.commit()
+        """Create or upgrade the database schema."""
+        with self._lock:
+            migrate(self._conn)
 
     def _extract_span_data(self, span: ReadableSpan) -> Dict[str, Any]:
         """Extract relevant data from a span for database insertion."""
@@ -50,8 +123,8 @@ class SQLiteSpanExporter(SpanExporter):
                        ) / 1_000_000  # Convert nanoseconds to milliseconds
 
         return {
-            'timestamp':
-            datetime.utcfromtimestamp(span.start_time / 1e9).isoformat(),
+            'timestamp_ns':
+            span.start_time,
             'transaction_id':
             attributes.get('transaction_id', ''),
             'user_id':
@@ -80,49 +153,158 @@ class SQLiteSpanExporter(SpanExporter):
             format(span.parent.span_id, '016x') if span.parent else ''
         }
 
-    def export(self, spans: list[ReadableSpan]) -> None:
-        """Export the spans to SQLite database."""
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        """Export the spans to SQLite database in one transaction."""
+        # Only process completion spans with token data
+        rows = [
+            self._extract_span_data(span) for span in spans
+            if span.attributes and 'prompt.tokens' in span.attributes
+        ]
+        if not rows:
+            return SpanExportResult.SUCCESS
+
         try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-
-                for span in spans:
-                    # Only process completion spans with token data
-                    if 'prompt.tokens' in span.attributes:
-                        span_data = self._extract_span_data(span)
-
-                        cursor.execute(
-                            '''
-                            INSERT INTO telemetry (
-                                timestamp, transaction_id, user_id, model, provider,
-                                request_type, prompt_tokens, completion_tokens,
-                                total_tokens, duration_ms, success, trace_id,
-                                span_id, parent_span_id
-                            ) VALUES (
-                                :timestamp, :transaction_id, :user_id, :model, :provider,
-                                :request_type, :prompt_tokens, :completion_tokens,
-                                :total_tokens, :duration_ms, :success, :trace_id,
-                                :span_id, :parent_span_id
-                            )
-                        ''', span_data)
-
-                conn.commit()
-            return None
+            with self._lock:
+                if self._conn is None:
+                    return SpanExportResult.FAILURE
+                with self._conn:
+                    self._conn.executemany(
+                        '''
+                        INSERT INTO telemetry (
+                            timestamp_ns, transaction_id, user_id, model,
+                            provider, request_type, prompt_tokens,
+                            completion_tokens, total_tokens, duration_ms,
+                            success, trace_id, span_id, parent_span_id
+                        ) VALUES (
+                            :timestamp_ns, :transaction_id, :user_id, :model,
+                            :provider, :request_type, :prompt_tokens,
+                            :completion_tokens, :total_tokens, :duration_ms,
+                            :success, :trace_id, :span_id, :parent_span_id
+                        )
+                    ''', rows)
+                    # Roll the batch up on the way in, in the same transaction
+                    for table, rollup_rows in aggregate_rollups(rows).items():
+                        self._conn.executemany(
+                            ROLLUP_UPSERT.format(table=table), rollup_rows)
+            return SpanExportResult.SUCCESS
         except Exception as e:
             print(f"Error exporting spans to SQLite: {e}")
-            return None
+            return SpanExportResult.FAILURE
 
     def force_flush(self, timeout_millis: float = 30000) -> bool:
-        """Force flush the exporter."""
-        return True
+        """Checkpoint the write-ahead log; exported batches are committed."""
+        with self._lock:
+            if self._conn is None:
+                return False
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                return True
+            except sqlite3.Error as e:
+                print(f"Error flushing SQLite exporter: {e}")
+                return False
+
+    def enforce_retention(self,
+                          now_ns: Optional[int] = None) -> Dict[str, int]:
+        """
+        Delete expired raw spans and rollups, then release free pages.
+
+        Rows are deleted oldest first in chunks of `retention_chunk_size`,
+        each in its own short transaction, so exports interleave with a
+        large cleanup instead of waiting for it.
+
+        Returns:
+            The number of rows deleted per table
+        """
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        deleted = {}
+        for table, time_column, hours in self._retention:
+            if hours is None:
+                continue
+            cutoff = now_ns - int(hours * 3600 * NS_PER_SECOND)
+            deleted[table] = 0
+            while not self._stopped.is_set():
+                count = self._delete_chunk(table, time_column, cutoff)
+                deleted[table] += count
+                if count < self.retention_chunk_size:
+                    break
+        self._vacuum()
+        return deleted
+
+    def _delete_chunk(self, table: str, time_column: str, cutoff: int) -> int:
+        """Delete up to one chunk of rows older than the cutoff."""
+        key = "id" if table == "telemetry" else \
+            "(bucket_ns, model, provider, user_id)"
+        with self._lock:
+            if self._conn is None:
+                return 0
+            with self._conn:
+                return self._conn.execute(
+                    f'''
+                    DELETE FROM {table} WHERE {key} IN (
+                        SELECT {key.strip("()")} FROM {table}
+                        WHERE {time_column} < ?
+                        ORDER BY {time_column}
+                        LIMIT ?
+                    )
+                ''', (cutoff, self.retention_chunk_size)).rowcount
+
+    def _vacuum(self) -> None:
+        """Return free pages to the file system."""
+        with self._lock:
+            if self._conn is None:
+                return
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                self._conn.execute(
+                    f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})"
+                ).fetchall()
+            elif (self.vacuum_interval_hours is not None
+                  and time.monotonic() - self._last_vacuum
+                  >= self.vacuum_interval_hours * 3600):
+                # Rewrites the whole file; opt-in for older databases
+                self._conn.execute("VACUUM")
+                self._last_vacuum = time.monotonic()
+
+    def _retain_periodically(self, interval: float) -> None:
+        """Enforce retention until the exporter shuts down."""
+        while not self._stopped.wait(interval):
+            try:
+                self.enforce_retention()
+            except Exception as e:
+                print(f"Error enforcing SQLite retention: {e}")
 
     def shutdown(self) -> None:
-        """Shutdown the exporter."""
-        pass
+        """Stop retention, checkpoint the write-ahead log and close the connection."""
+        self._stopped.set()
+        if self._retention_thread is not None:
+            self._retention_thread.join(timeout=5)
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                print(f"Error checkpointing SQLite exporter: {e}")
+            finally:
+                self._conn.close()
+                self._conn = None
 
 
 class RedisSpanExporter(SpanExporter):
-    """Redis exporter for Observicia telemetry data."""
+    """
+    Redis exporter for Observicia telemetry data.
+
+    Each span is stored as a hash under `{key_prefix}span:{trace_id}:{span_id}`
+    and indexed by start time (epoch milliseconds) in sorted sets: one for
+    all spans and one per model and per user, so time ranges are read with
+    `ZRANGEBYSCORE` instead of scanning keys. A batch is written with one
+    non-transactional pipeline, a single round trip. Clients share one
+    connection pool per server.
+
+    In `stream` mode, compact span records are instead appended with
+    `XADD` to one stream, trimmed to about `stream_maxlen` entries, for
+    live consumers reading through a consumer group (see
+    `util/redis_stream_consumer.py`).
+    """
 
     def __init__(self,
                  host: str = "localhost",
@@ -130,7 +312,12 @@ class RedisSpanExporter(SpanExporter):
                  db: int = 0,
                  password: Optional[str] = None,
                  key_prefix: str = "observicia:telemetry:",
-                 retention_hours: int = 24):
+                 retention_hours: int = 24,
+                 max_connections: Optional[int] = None,
+                 client: Optional[redis.Redis] = None,
+                 mode: str = "hash",
+                 stream_key: Optional[str] = None,
+                 stream_maxlen: int = 100000):
         """
         Initialize Redis exporter.
         
@@ -141,14 +328,33 @@ class RedisSpanExporter(SpanExporter):
             password: Redis password
             key_prefix: Prefix for Redis keys
             retention_hours: Data retention period in hours
+            max_connections: Size limit of the shared connection pool
+            client: Existing Redis client to use instead of connecting
+            mode: "hash" to store indexed hashes, "stream" to append to
+                a Redis Stream
+            stream_key: Stream key, by default `{key_prefix}stream`
+            stream_maxlen: Approximate number of entries the stream keeps
         """
-        self.redis_client = redis.Redis(host=host,
-                                        port=port,
-                                        db=db,
-                                        password=password,
-                                        decode_responses=True)
+        if mode not in ("hash", "stream"):
+            raise ValueError(f"Unsupported Redis exporter mode: {mode}")
+        self.redis_client = client or get_redis_client(
+            host, port, db, password, max_connections)
         self.key_prefix = key_prefix
         self.retention_hours = retention_hours
+        self.mode = mode
+        self.stream_key = stream_key or f"{key_prefix}stream"
+        self.stream_maxlen = stream_maxlen
+
+    def span_key(self, trace_id: int, span_id: int) -> str:
+        """Get the key of a span's hash."""
+        return f"{self.key_prefix}span:{trace_id:032x}:{span_id:016x}"
+
+    def index_key(self, dimension: Optional[str] = None,
+                  value: Optional[str] = None) -> str:
+        """Get the key of the time index of all spans, or of one model or user."""
+        if dimension is None:
+            return f"{self.key_prefix}index:time"
+        return f"{self.key_prefix}index:{dimension}:{value}"
 
     def _extract_span_data(self, span: ReadableSpan) -> Dict[str, Any]:
         """Extract telemetry data from span in CSV-compatible format."""
@@ -170,15 +376,45 @@ class RedisSpanExporter(SpanExporter):
             "completion_tokens": str(int(attrs.get("completion.tokens", 0))),
             "total_tokens": str(int(attrs.get("total.tokens", 0))),
             "duration_ms": str(float(duration_ms)),
-            "success": str(attrs.get("policy.passed", True))
+            "success": str(attrs.get("policy.passed", True)),
+            "trace_id": format(span.context.trace_id, "032x"),
+            "span_id": format(span.context.span_id, "016x")
         }
 
         return data
 
-    def export(self, spans: Sequence[ReadableSpan]) -> None:
-        """Export spans to Redis."""
+    def _stream_record(self, span: ReadableSpan) -> Dict[str, str]:
+        """Get a compact stream record of a span, leaving out empty fields."""
+        data = self._extract_span_data(span)
+        del data["timestamp"]
+        data["timestamp_ns"] = str(span.start_time)
+        return {key: value for key, value in data.items() if value}
+
+    def _export_stream(self, spans: Sequence[ReadableSpan]) -> None:
+        """Append span records to the stream in one pipelined round trip."""
+        pipeline = self.redis_client.pipeline(transaction=False)
+        records = 0
+        for span in spans:
+            if 'completion' in span.name:
+                # "~" trimming only drops whole macro nodes, which is cheap
+                pipeline.xadd(self.stream_key,
+                              self._stream_record(span),
+                              maxlen=self.stream_maxlen,
+                              approximate=True)
+                records += 1
+        if records:
+            pipeline.execute()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        """Export spans to Redis in one pipelined round trip."""
         try:
-            pipeline = self.redis_client.pipeline()
+            if self.mode == "stream":
+                self._export_stream(spans)
+                return SpanExportResult.SUCCESS
+
+            ttl = int(self.retention_hours * 3600)
+            pipeline = self.redis_client.pipeline(transaction=False)
+            indexes: Dict[str, Dict[str, int]] = {}
 
             for span in spans:
                 # Only process completion spans
@@ -186,27 +422,68 @@ class RedisSpanExporter(SpanExporter):
                     continue
 
                 span_data = self._extract_span_data(span)
-
-                # Create a unique key for this span
-                span_key = f"{self.key_prefix}{span.start_time}"
-
-                # Store span data as hash
+                span_key = self.span_key(span.context.trace_id,
+                                         span.context.span_id)
                 pipeline.hset(span_key, mapping=span_data)
+                pipeline.expire(span_key, ttl)
 
-                # Set expiry
-                pipeline.expire(span_key, self.retention_hours * 3600)
+                score = span.start_time // 1_000_000
+                for index in (self.index_key(),
+                              self.index_key("model", span_data["model"]),
+                              self.index_key("user", span_data["user_id"])):
+                    indexes.setdefault(index, {})[span_key] = score
 
-            pipeline.execute()
-            return None
+            # Drop index entries whose hashes have expired
+            cutoff = time.time_ns() // 1_000_000 - ttl * 1000
+            for index, members in indexes.items():
+                pipeline.zadd(index, members)
+                pipeline.zremrangebyscore(index, "-inf", f"({cutoff}")
+                pipeline.expire(index, ttl)
+
+            if indexes:
+                pipeline.execute()
+            return SpanExportResult.SUCCESS
 
         except Exception as e:
             print(f"Error exporting spans to Redis: {e}")
-            return None
+            return SpanExportResult.FAILURE
+
+    def get_spans(self,
+                  start_time_ns: int,
+                  end_time_ns: int,
+                  model: Optional[str] = None,
+                  user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the spans that started in a time range, oldest first.
+
+        Args:
+            start_time_ns: Start of the range in epoch nanoseconds
+            end_time_ns: End of the range in epoch nanoseconds, inclusive
+            model: Only return spans of this model
+            user_id: Only return spans of this user; ignored if model is set
+        """
+        if model is not None:
+            index = self.index_key("model", model)
+        elif user_id is not None:
+            index = self.index_key("user", user_id)
+        else:
+            index = self.index_key()
+        span_keys = self.redis_client.zrangebyscore(
+            index, start_time_ns // 1_000_000, end_time_ns // 1_000_000)
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for span_key in span_keys:
+            pipeline.hgetall(span_key)
+        spans = [span for span in pipeline.execute() if span] \
+            if span_keys else []
+        if model is not None and user_id is not None:
+            spans = [span for span in spans if span["user_id"] == user_id]
+        return spans
 
     def force_flush(self, timeout_millis: float = 30000) -> bool:
         """Force flush the exporter."""
         return True
 
     def shutdown(self) -> None:
-        """Shutdown the exporter."""
+        """Shutdown the exporter, leaving the shared pool to other clients."""
         self.redis_client.close()
@@ -3,6 +3,7 @@ Utility functions and helpers for the Observicia SDK.
 Provides common functionality used across the SDK components.
 """
 
+import inspect
 import json
 import re
 import tiktoken
@@ -15,6 +16,8 @@ from opentelemetry.trace import get_current_span as otel_get_current_span
 from opentelemetry.trace import Span, SpanContext
 from opentelemetry.baggage import get_all as get_baggage
 
+from .token_helpers import get_encoder
+
 # Type alias for trace attributes
 TraceAttributes = Dict[str, Union[str, int, float, bool]]
 
@@ -69,11 +72,10 @@ def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
         int: Number of tokens in the text
     """
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except KeyError:
-        # Fallback to cl100k_base for unknown models
-        encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = get_encoder(model)
+        if encoding is None:
+            # Fallback to cl100k_base for unknown models
+            encoding = tiktoken.get_encoding("cl100k_base")
         return len(encoding.encode(text))
     except Exception as e:
         # Log error and return approximate token count
@@ -255,6 +257,28 @@ def exponential_backoff(attempt: int, base_delay: float = 1.0) -> float:
     return min(base_delay * (2**attempt), 30.0)  # Cap at 30 seconds
 
 
+async def aclose_quietly(resource: Any) -> None:
+    """
+    Close a stream or response that will not be handed to the caller.
+
+    Uses `aclose()` or else `close()`, awaiting the result when needed,
+    and ignores objects without either and errors while closing.
+
+    Args:
+        resource (Any): Async generator, stream or HTTP response
+    """
+    close = getattr(resource, "aclose", None) or getattr(
+        resource, "close", None)
+    if not callable(close):
+        return
+    try:
+        closed = close()
+        if inspect.isawaitable(closed):
+            await closed
+    except Exception:
+        pass
+
+
 # Global context for thread-local storage
 _thread_local = ContextVar("observicia_context", default={})
 
@@ -1,57 +1,195 @@
 """Utility functions for policy enforcement"""
-from typing import Any, Optional
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
 from opentelemetry.trace import Span
 from observicia.core.context_manager import ObservabilityContext
+from observicia.core.policy_engine import PolicyEngine, PolicyResult
+from .helpers import aclose_quietly, format_span_id, format_trace_id
 from .serialization_helpers import serialize_llm_response
 
+T = TypeVar("T")
+
+
+def log_chat(context: Optional[ObservabilityContext],
+             span: Span,
+             interaction_type: str,
+             content: str,
+             metadata: Optional[Dict[str, Any]] = None) -> None:
+    """Write a prompt or completion to the chat log with span metadata."""
+    if not content or not hasattr(context, '_logger'):
+        return
+
+    attributes = span.attributes or {}
+    context._logger.log_chat_interaction(
+        interaction_type=interaction_type,
+        content=content,
+        metadata={
+            "model": attributes.get("llm.model", "unknown"),
+            "provider": attributes.get("llm.provider", "unknown"),
+            "request_type": attributes.get("llm.request.type", "unknown"),
+            **(metadata or {})
+        })
+
+
+def _policy_eval_context(context: ObservabilityContext, span: Span,
+                         response: Any) -> Dict[str, Any]:
+    """Build the OPA input for a response and the span it belongs to."""
+    eval_context = {
+        "trace_context": {
+            # Hex ids, as OTel tooling shows them; 128-bit integers
+            # don't fit fast JSON encoders
+            "trace_id": format_trace_id(span.get_span_context().trace_id),
+            "span_id": format_span_id(span.get_span_context().span_id),
+            "attributes": dict(span.attributes)
+        }
+    }
+    # Skip serializing the response when no policy reads it
+    policy_engine = context.policy_engine
+    fields = policy_engine.required_inputs() if isinstance(
+        policy_engine, PolicyEngine) else None
+    if fields is None or "response" in fields:
+        eval_context["response"] = serialize_llm_response(response)
+    return eval_context
+
+
+def _apply_policy_result(span: Span, result: PolicyResult) -> None:
+    """Record a policy result on the span and raise on violations."""
+    span.set_attributes({
+        "policy.passed": result.passed,
+        "policy.violations": ";".join(result.violations)
+    })
+
+    if not result.passed:
+        raise ValueError(f"Policy violations: {result.violations}")
+
 
 def enforce_policies(context: Optional[ObservabilityContext],
                      span: Span,
                      response: Any,
                      prompt: Optional[str] = None,
-                     completion: Optional[str] = None) -> None:
+                     completion: Optional[str] = None,
+                     log_chat_messages: bool = True) -> None:
     """Synchronously enforce policies on response."""
     if not context or not context.policy_engine:
         return
 
-    user_id = context.get_user_id()
-    if hasattr(context, '_logger'):
-        metadata = {
-            "model": span.attributes.get("llm.model", "unknown"),
-            "provider": span.attributes.get("llm.provider", "unknown"),
-            "request_type": span.attributes.get("llm.request.type", "unknown")
-        }
+    if log_chat_messages:
+        log_chat(context, span, 'prompt', prompt)
+        log_chat(context, span, 'completion', completion)
+
+    result = context.policy_engine.evaluate_sync(_policy_eval_context(
+        context, span, response),
+                                                 prompt=prompt,
+                                                 completion=completion)
+    _apply_policy_result(span, result)
+
 
-        if prompt:
-            context._logger.log_chat_interaction(interaction_type='prompt',
-                                                 content=prompt,
-                                                 metadata=metadata)
-
-        if completion:
-            context._logger.log_chat_interaction(interaction_type='completion',
-                                                 content=completion,
-                                                 metadata=metadata)
-
-    # Serialize the response before evaluation
-    serialized_response = serialize_llm_response(response)
-
-    # Use synchronous evaluation
-    result = context.policy_engine.evaluate_sync(
-        {
-            "response": serialized_response,
-            "trace_context": {
-                "trace_id": span.get_span_context().trace_id,
-                "span_id": span.get_span_context().span_id,
-                "attributes": dict(span.attributes)
-            }
-        },
+async def enforce_policies_async(context: Optional[ObservabilityContext],
+                                 span: Span,
+                                 response: Any,
+                                 prompt: Optional[str] = None,
+                                 completion: Optional[str] = None,
+                                 log_chat_messages: bool = True) -> None:
+    """Enforce policies on response without blocking the event loop."""
+    if not context or not context.policy_engine:
+        return
+
+    if log_chat_messages:
+        log_chat(context, span, 'prompt', prompt)
+        log_chat(context, span, 'completion', completion)
+
+    result = await context.policy_engine.evaluate_with_context(
+        _policy_eval_context(context, span, response),
         prompt=prompt,
         completion=completion)
+    _apply_policy_result(span, result)
+
 
+def _prompt_eval_context(span: Span, prompt: Optional[str]) -> Dict[str, Any]:
+    """Build the OPA input for a prompt before the provider is called."""
+    return {
+        "prompt": prompt,
+        "trace_context": {
+            "trace_id": format_trace_id(span.get_span_context().trace_id),
+            "span_id": format_span_id(span.get_span_context().span_id),
+            "attributes": dict(span.attributes or {})
+        }
+    }
+
+
+def _apply_prompt_policy_result(span: Span, result: PolicyResult) -> None:
+    """Record a prompt-phase result on the span and raise on violations."""
     span.set_attributes({
-        "policy.passed": result.passed,
-        "policy.violations": ";".join(result.violations)
+        "policy.prompt.passed": result.passed,
+        "policy.prompt.violations": ";".join(result.violations)
     })
 
     if not result.passed:
-        raise ValueError(f"Policy violations: {result.violations}")
+        raise ValueError(f"Prompt policy violations: {result.violations}")
+
+
+def _has_prompt_policies(context: Optional[ObservabilityContext]) -> bool:
+    """Check if the context's policy engine gates prompts."""
+    policy_engine = getattr(context, "policy_engine", None)
+    return isinstance(policy_engine, PolicyEngine) and bool(
+        policy_engine.phase_policies("prompt"))
+
+
+def run_with_prompt_gate(
+        context: Optional[ObservabilityContext],
+        span: Span,
+        prompt: Optional[str],
+        call: Callable[[], T],
+        on_blocked: Optional[Callable[[], None]] = None) -> T:
+    """
+    Evaluate prompt-phase policies, then make the provider call.
+
+    A blocking provider call can't be cancelled once started, so the
+    prompt is checked first and a violating request is never sent.
+    `on_blocked`, e.g. a budget refund, runs when the gate blocks it.
+    """
+    if _has_prompt_policies(context):
+        try:
+            result = context.policy_engine.evaluate_sync(
+                _prompt_eval_context(span, prompt), phase="prompt")
+            _apply_prompt_policy_result(span, result)
+        except BaseException:
+            if on_blocked is not None:
+                on_blocked()
+            raise
+    return call()
+
+
+async def run_with_prompt_gate_async(
+        context: Optional[ObservabilityContext],
+        span: Span,
+        prompt: Optional[str],
+        call: Callable[[], Awaitable[T]],
+        on_blocked: Optional[Callable[[], None]] = None) -> T:
+    """
+    Evaluate prompt-phase policies concurrently with the provider call.
+
+    The provider call starts speculatively so compliant requests pay no
+    extra latency; it is cancelled as soon as a prompt violation is found
+    and `on_blocked` runs. A call that already returned, e.g. with an open
+    stream, has its result closed instead.
+    """
+    if not _has_prompt_policies(context):
+        return await call()
+
+    provider_call = asyncio.ensure_future(call())
+    try:
+        result = await context.policy_engine.evaluate_with_context(
+            _prompt_eval_context(span, prompt), phase="prompt")
+        _apply_prompt_policy_result(span, result)
+    except BaseException:
+        span.set_attribute("policy.prompt.cancelled_call",
+                           provider_call.cancel())
+        await asyncio.gather(provider_call, return_exceptions=True)
+        if (provider_call.done() and not provider_call.cancelled()
+                and provider_call.exception() is None):
+            await aclose_quietly(provider_call.result())
+        if on_blocked is not None:
+            on_blocked()
+        raise
+    return await provider_call
@@ -0,0 +1,44 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import redis
+
+_pools: Dict[Tuple[str, int, int, Optional[str]], redis.ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(host: str = "localhost",
+                        port: int = 6379,
+                        db: int = 0,
+                        password: Optional[str] = None,
+                        max_connections: Optional[int] = None
+                        ) -> redis.ConnectionPool:
+    """
+    Get the connection pool shared by every Redis client of a server.
+
+    Exporters and usage backends pointing at the same server and database
+    reuse one pool instead of each opening their own connections. The
+    `max_connections` of the first caller applies.
+    """
+    key = (host, port, db, password)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = redis.ConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                max_connections=max_connections,
+                decode_responses=True)
+        return pool
+
+
+def get_redis_client(host: str = "localhost",
+                     port: int = 6379,
+                     db: int = 0,
+                     password: Optional[str] = None,
+                     max_connections: Optional[int] = None) -> redis.Redis:
+    """Create a Redis client on the shared connection pool of a server."""
+    return redis.Redis(connection_pool=get_connection_pool(
+        host, port, db, password, max_connections))
@@ -0,0 +1,202 @@
+"""Versioned schema of the SQLite telemetry store"""
+import sqlite3
+from typing import Any, Callable, Dict, List, Tuple
+
+NS_PER_SECOND = 1_000_000_000
+
+# Rollup tables and their bucket width in nanoseconds
+ROLLUPS: Tuple[Tuple[str, int], ...] = (
+    ("telemetry_rollup_minute", 60 * NS_PER_SECOND),
+    ("telemetry_rollup_hour", 3600 * NS_PER_SECOND),
+)
+
+ROLLUP_UPSERT = '''
+    INSERT INTO {table} (
+        bucket_ns, model, provider, user_id, requests, failures,
+        prompt_tokens, completion_tokens, total_tokens,
+        duration_ms_sum, duration_ms_max
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket_ns, model, provider, user_id) DO UPDATE SET
+        requests = requests + excluded.requests,
+        failures = failures + excluded.failures,
+        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = completion_tokens + excluded.completion_tokens,
+        total_tokens = total_tokens + excluded.total_tokens,
+        duration_ms_sum = duration_ms_sum + excluded.duration_ms_sum,
+        duration_ms_max = MAX(duration_ms_max, excluded.duration_ms_max)
+'''
+
+
+def _create_legacy_table(conn: sqlite3.Connection) -> None:
+    """Version 1: the original table with ISO-8601 text timestamps."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS telemetry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            transaction_id TEXT,
+            user_id TEXT,
+            model TEXT,
+            provider TEXT,
+            request_type TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            total_tokens INTEGER,
+            duration_ms REAL,
+            success BOOLEAN,
+            trace_id TEXT,
+            span_id TEXT,
+            parent_span_id TEXT
+        )
+    ''')
+
+
+def _add_indexes_and_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Version 2: integer epoch-nanosecond timestamps, covering indexes for
+    the dashboard queries, and per-minute and per-hour rollup tables.
+    """
+    conn.execute('''
+        CREATE TABLE telemetry_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp_ns INTEGER NOT NULL,
+            transaction_id TEXT,
+            user_id TEXT,
+            model TEXT,
+            provider TEXT,
+            request_type TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            total_tokens INTEGER,
+            duration_ms REAL,
+            success BOOLEAN,
+            trace_id TEXT,
+            span_id TEXT,
+            parent_span_id TEXT
+        )
+    ''')
+    # julianday() parses the stored ISO text at millisecond precision
+    conn.execute('''
+        INSERT INTO telemetry_v2 (
+            id, timestamp_ns, transaction_id, user_id, model, provider,
+            request_type, prompt_tokens, completion_tokens, total_tokens,
+            duration_ms, success, trace_id, span_id, parent_span_id
+        )
+        SELECT
+            id,
+            CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000)
+                 AS INTEGER) * 1000000,
+            transaction_id, user_id, model, provider, request_type,
+            prompt_tokens, completion_tokens, total_tokens, duration_ms,
+            success, trace_id, span_id, parent_span_id
+        FROM telemetry
+    ''')
+    conn.execute("DROP TABLE telemetry")
+    conn.execute("ALTER TABLE telemetry_v2 RENAME TO telemetry")
+
+    for statement in (
+            '''CREATE INDEX idx_telemetry_time ON telemetry (
+                   timestamp_ns, prompt_tokens, completion_tokens,
+                   total_tokens)''',
+            '''CREATE INDEX idx_telemetry_model_time ON telemetry (
+                   model, timestamp_ns, total_tokens, duration_ms)''',
+            '''CREATE INDEX idx_telemetry_user_time ON telemetry (
+                   user_id, timestamp_ns, prompt_tokens, completion_tokens,
+                   total_tokens, duration_ms)''',
+            '''CREATE INDEX idx_telemetry_transaction_time ON telemetry (
+                   transaction_id, timestamp_ns)'''):
+        conn.execute(statement)
+
+    for table, width_ns in ROLLUPS:
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                bucket_ns INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                failures INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                duration_ms_sum REAL NOT NULL,
+                duration_ms_max REAL NOT NULL,
+                PRIMARY KEY (bucket_ns, model, provider, user_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'''
+            INSERT INTO {table}
+            SELECT
+                (timestamp_ns / {width_ns}) * {width_ns},
+                COALESCE(model, ''), COALESCE(provider, ''),
+                COALESCE(user_id, ''),
+                COUNT(*),
+                SUM(CASE WHEN success THEN 0 ELSE 1 END),
+                COALESCE(SUM(prompt_tokens), 0),
+                COALESCE(SUM(completion_tokens), 0),
+                COALESCE(SUM(total_tokens), 0),
+                COALESCE(SUM(duration_ms), 0),
+                COALESCE(MAX(duration_ms), 0)
+            FROM telemetry
+            GROUP BY 1, 2, 3, 4
+        ''')
+
+
+# Migration N upgrades a database from user_version N - 1 to N
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_legacy_table,
+    _add_indexes_and_rollups,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Bring a database up to the current schema version.
+
+    Each pending migration runs in its own transaction together with the
+    `user_version` bump, so an interrupted upgrade resumes where it
+    stopped. Databases from before versioning report version 0 and go
+    through every migration.
+
+    Returns:
+        The schema version of the database
+    """
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock; another process may have migrated
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                return version
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def aggregate_rollups(
+        rows: List[Dict[str, Any]]) -> Dict[str, List[Tuple[Any, ...]]]:
+    """Sum telemetry rows into rollup rows per table, ready for upsert."""
+    rollups: Dict[str, List[Tuple[Any, ...]]] = {}
+    for table, width_ns in ROLLUPS:
+        buckets: Dict[Tuple[Any, ...], List[Any]] = {}
+        for row in rows:
+            key = ((row['timestamp_ns'] // width_ns) * width_ns,
+                   row['model'] or '', row['provider'] or '', row['user_id']
+                   or '')
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, 0, 0, 0, 0, 0.0, 0.0]
+            duration_ms = row['duration_ms'] or 0.0
+            bucket[0] += 1
+            bucket[1] += 0 if row['success'] else 1
+            bucket[2] += row['prompt_tokens'] or 0
+            bucket[3] += row['completion_tokens'] or 0
+            bucket[4] += row['total_tokens'] or 0
+            bucket[5] += duration_ms
+            bucket[6] = max(bucket[6], duration_ms)
+        rollups[table] = [key + tuple(values) for key, values in buckets.items()]
+    return rollups
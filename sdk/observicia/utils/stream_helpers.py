@@ -1,15 +1,159 @@
 """Utility functions for handling streaming responses"""
 
-from typing import Any, AsyncGenerator, Generator
+import hashlib
+import re
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Tuple
 from opentelemetry import trace
 from opentelemetry.trace import Span, get_tracer, SpanKind, Status, StatusCode
 
-from .token_helpers import count_text_tokens
-from .policy_helpers import enforce_policies
+from .helpers import aclose_quietly
+from .token_helpers import count_text_tokens, get_encoder, usage_dimensions
+from .policy_helpers import enforce_policies, enforce_policies_async, log_chat
+
+# Whitespace between two words; tokenization never merges across it
+_STABLE_BOUNDARY = re.compile(r'(?<=[^\W_])\s+(?=\S)')
+
+
+class IncrementalTokenCounter:
+    """
+    Counts completion tokens as stream chunks arrive.
+
+    A BPE token can span two chunks, so text after the last word boundary
+    is held back and encoded together with the next chunk. Text without
+    word boundaries is committed once it exceeds `max_pending_chars`,
+    holding back the last few tokens instead. The last few committed
+    tokens are kept as a tail and re-encoded with the text after them, so
+    a token that only forms across a forced cut replaces the tokens
+    counted on either side of it instead of adding to them.
+    """
+
+    HOLDBACK_TOKENS = 4
+    BOUNDARY_SEARCH_CHARS = 256
+
+    def __init__(self, model: str, max_pending_chars: int = 1024) -> None:
+        self._encoding = get_encoder(model)
+        self._max_pending_chars = max_pending_chars
+        self._pending = ""
+        self._committed = 0
+        # Committed text before a forced cut and the tokens counted for it
+        self._tail = ""
+        self._tail_tokens = 0
+
+    def add(self, text: str) -> None:
+        """Add a chunk of completion text."""
+        if not text:
+            return
+        self._pending += text
+
+        boundary = 0
+        for match in _STABLE_BOUNDARY.finditer(
+                self._pending,
+                max(0,
+                    len(self._pending) - self.BOUNDARY_SEARCH_CHARS)):
+            boundary = match.start()
+
+        if boundary > 0:
+            stable, self._pending = (self._pending[:boundary],
+                                     self._pending[boundary:])
+            self._committed += (self._count(self._tail + stable) -
+                                self._tail_tokens)
+            self._tail, self._tail_tokens = "", 0
+        elif (len(self._pending) > self._max_pending_chars
+              and self._encoding is not None):
+            self._commit_tokens()
+
+    def total(self) -> int:
+        """Total completion tokens, including any held back text."""
+        return (self._committed - self._tail_tokens +
+                self._count(self._tail + self._pending))
+
+    def _count(self, text: str) -> int:
+        """Count tokens in a stable piece of text."""
+        if not text:
+            return 0
+        if self._encoding is None:
+            # Fallback to approximate count
+            return len(text.split())
+        return len(self._encoding.encode_ordinary(text))
+
+    def _commit_tokens(self) -> None:
+        """Commit all but the last few tokens of the tail and pending text."""
+        text = (self._tail + self._pending).encode('utf-8')
+        tokens = self._encoding.encode_ordinary(self._tail + self._pending)
+        token_bytes = [
+            len(self._encoding.decode_single_token_bytes(token))
+            for token in tokens
+        ]
+
+        commit, boundary = self._char_boundary(
+            text, token_bytes, len(tokens) - self.HOLDBACK_TOKENS)
+        if boundary <= len(self._tail.encode('utf-8')):
+            return
+        tail_start, tail_boundary = self._char_boundary(
+            text, token_bytes, max(0, commit - self.HOLDBACK_TOKENS))
+
+        self._committed += commit - self._tail_tokens
+        self._tail = text[tail_boundary:boundary].decode('utf-8')
+        self._tail_tokens = commit - tail_start
+        self._pending = text[boundary:].decode('utf-8')
+
+    @staticmethod
+    def _char_boundary(text: bytes, token_bytes: List[int],
+                       index: int) -> Tuple[int, int]:
+        """
+        Get the byte offset of the token at `index`, moving back to the
+        nearest token that starts on a character boundary.
+
+        Returns:
+            Tuple[int, int]: Token index and byte offset
+        """
+        index = max(0, index)
+        offset = sum(token_bytes[:index])
+        # Tokens may split a multi-byte character
+        while index > 0 and (text[offset] & 0xC0) == 0x80:
+            index -= 1
+            offset -= token_bytes[index]
+        return index, offset
+
+
+def _is_ollama_chunk(chunk: Any) -> bool:
+    """Whether a chunk is in Ollama's (mapping-like) format."""
+    return not hasattr(chunk, 'choices') and hasattr(chunk, 'get')
+
+
+def _extract_usage_from_chunk(chunk: Any) -> Optional[Tuple[int, int]]:
+    """Extract provider-reported (prompt, completion) token usage from a chunk."""
+    # OpenAI sends usage on the final chunk with stream_options.include_usage
+    usage = getattr(chunk, 'usage', None)
+    if usage is not None and getattr(usage, 'completion_tokens',
+                                     None) is not None:
+        return (getattr(usage, 'prompt_tokens', None)
+                or 0, usage.completion_tokens)
+
+    # Ollama reports eval counts on the final chunk
+    if _is_ollama_chunk(chunk):
+        if chunk.get('done') and chunk.get('eval_count') is not None:
+            return (chunk.get('prompt_eval_count') or 0, chunk['eval_count'])
+
+    return None
+
+
+def _expects_provider_usage(kwargs: dict) -> bool:
+    """Whether the request asked the provider to report stream usage."""
+    stream_options = kwargs.get('stream_options') or {}
+    return bool(stream_options.get('include_usage'))
 
 
 def _extract_content_from_chunk(chunk: Any, is_chat: bool = False) -> str:
     """Extract content from a response chunk based on type."""
+    if _is_ollama_chunk(chunk):
+        # Ollama chunk format
+        message = chunk.get('message')
+        if message is not None:
+            return (message.get('content') if hasattr(message, 'get') else
+                    getattr(message, 'content', None)) or ""
+        return chunk.get('response') or ""
+
     if not chunk.choices or not chunk.choices[0]:
         return ""
 
@@ -25,6 +169,241 @@ def _extract_content_from_chunk(chunk: Any, is_chat: bool = False) -> str:
     return ""
 
 
+class BoundedStreamBuffer:
+    """
+    Bounded-memory view of a streamed completion.
+
+    Instead of the full completion it keeps a sliding window of the most
+    recent `window_chars` characters and a running SHA-256 digest of the
+    whole text. New text is also tracked for windowed policy evaluation
+    (every `policy_chunk_chars`) and batched for streamed chat-log writes
+    (every `log_chunk_chars`), so memory per stream stays bounded by the
+    configured sizes regardless of completion length. `policy_chunk_chars`
+    is clamped to `window_chars` so each evaluated window still contains
+    all text that arrived since the previous one.
+    """
+
+    def __init__(self,
+                 window_chars: int = 4096,
+                 policy_chunk_chars: int = 2048,
+                 log_chunk_chars: int = 1024) -> None:
+        self._window_chars = window_chars
+        # Text between larger chunks would fall out of the window unchecked
+        self._policy_chunk_chars = min(policy_chunk_chars, window_chars)
+        self._log_chunk_chars = log_chunk_chars
+        self._window = ""
+        self._digest = hashlib.sha256()
+        self._unchecked_chars = 0
+        self._log_parts: List[str] = []
+        self._log_chars = 0
+        self.total_chars = 0
+
+    def add(self, text: str) -> None:
+        """Add a chunk of completion text."""
+        self._digest.update(text.encode('utf-8'))
+        self.total_chars += len(text)
+        self._window = (self._window + text)[-self._window_chars:]
+        self._unchecked_chars += len(text)
+        if self._log_chunk_chars > 0:
+            self._log_parts.append(text)
+            self._log_chars += len(text)
+
+    @property
+    def window(self) -> str:
+        """Most recent text of the completion."""
+        return self._window
+
+    def hexdigest(self) -> str:
+        """SHA-256 digest of the full completion so far."""
+        return self._digest.hexdigest()
+
+    def policy_window_due(self) -> bool:
+        """Whether enough new text arrived to evaluate policies again."""
+        return (self._policy_chunk_chars > 0
+                and self._unchecked_chars >= self._policy_chunk_chars)
+
+    def take_policy_window(self) -> str:
+        """Get the current window and mark its text as evaluated."""
+        self._unchecked_chars = 0
+        return self._window
+
+    def take_log_chunk(self, final: bool = False) -> Optional[str]:
+        """Get batched text for the chat log once a chunk is full."""
+        if not self._log_parts or (not final
+                                   and self._log_chars < self._log_chunk_chars):
+            return None
+        chunk = ''.join(self._log_parts)
+        self._log_parts = []
+        self._log_chars = 0
+        return chunk
+
+
+class _StreamState:
+    """Token counting and completion retention for one streamed response."""
+
+    def __init__(self, context: Any, prompt_tokens: int,
+                 kwargs: Dict[str, Any]) -> None:
+        self.model = kwargs.get('model', 'gpt-3.5-turbo')
+        self.prompt_tokens = prompt_tokens
+        self.reported_usage: Optional[Tuple[int, int]] = None
+
+        config = getattr(context, 'streaming_config', None) or {}
+        self.bounded = config.get('mode', 'full') == 'bounded'
+        self.buffer = BoundedStreamBuffer(
+            window_chars=config.get('window_chars', 4096),
+            policy_chunk_chars=config.get('policy_chunk_chars', 2048),
+            log_chunk_chars=config.get('log_chunk_chars',
+                                       1024)) if self.bounded else None
+        self.accumulated_response: List[str] = []
+        self.log_chunks = 0
+
+        # Bounded streams keep no text to fall back on if provider usage
+        # never arrives, so they always count locally
+        expects_usage = _expects_provider_usage(kwargs) and not self.bounded
+        self.counter = None if expects_usage else IncrementalTokenCounter(
+            self.model)
+
+    def add_chunk(self, chunk: Any, is_chat: bool) -> str:
+        """Record a chunk and return its text content."""
+        if (self.counter is not None and not self.bounded
+                and _is_ollama_chunk(chunk)):
+            # Ollama reports eval counts on its final chunk
+            self.counter = None
+
+        usage = _extract_usage_from_chunk(chunk)
+        if usage is not None:
+            self.reported_usage = usage
+
+        content = _extract_content_from_chunk(chunk, is_chat)
+        if content:
+            if self.bounded:
+                self.buffer.add(content)
+            else:
+                self.accumulated_response.append(content)
+            if self.counter is not None:
+                self.counter.add(content)
+        return content
+
+    def completion_text(self) -> str:
+        """Completion text available for policy evaluation."""
+        if self.bounded:
+            return self.buffer.window
+        return ''.join(self.accumulated_response)
+
+    def usage(self) -> Tuple[int, int]:
+        """Final (prompt, completion) tokens, preferring provider-reported usage."""
+        if self.reported_usage is not None:
+            reported_prompt, completion_tokens = self.reported_usage
+            return reported_prompt or self.prompt_tokens, completion_tokens
+        if self.counter is None:
+            # Usage was expected from the provider but never arrived
+            return self.prompt_tokens, count_text_tokens(
+                ''.join(self.accumulated_response), self.model)
+        return self.prompt_tokens, self.counter.total()
+
+    def finalize_attributes(self) -> Dict[str, Any]:
+        """Span attributes describing the completed stream."""
+        attributes = {
+            "usage.source":
+            "provider" if self.reported_usage is not None else "estimated"
+        }
+        if self.bounded:
+            attributes.update({
+                "completion.chars": self.buffer.total_chars,
+                "completion.sha256": self.buffer.hexdigest()
+            })
+        return attributes
+
+
+def _response_content(completion: str, is_chat: bool) -> Dict[str, Any]:
+    """Structure streamed completion text based on response type."""
+    return {
+        'choices': [{
+            'message': {
+                'content': completion
+            }
+        }]
+    } if is_chat else {
+        'choices': [{
+            'text': completion
+        }]
+    }
+
+
+def _flush_stream_chat_log(context: Any,
+                           span: Span,
+                           state: _StreamState,
+                           final: bool = False) -> None:
+    """Stream batched completion text out to the chat log."""
+    chunk = state.buffer.take_log_chunk(final=final)
+    if chunk:
+        log_chat(context,
+                 span,
+                 'completion',
+                 chunk,
+                 metadata={
+                     "stream_chunk": state.log_chunks,
+                     "final": final
+                 })
+        state.log_chunks += 1
+
+
+def _check_stream_window(context: Any, span: Span, state: _StreamState,
+                         prompt: Optional[str], is_chat: bool) -> None:
+    """Evaluate policies on the current window of a bounded stream."""
+    if not (context and context.policy_engine):
+        return
+    if state.buffer.policy_window_due():
+        window = state.buffer.take_policy_window()
+        enforce_policies(context,
+                         span,
+                         _response_content(window, is_chat),
+                         prompt=prompt,
+                         completion=window,
+                         log_chat_messages=False)
+
+
+async def _check_stream_window_async(context: Any, span: Span,
+                                     state: _StreamState,
+                                     prompt: Optional[str],
+                                     is_chat: bool) -> None:
+    """Evaluate policies on the current window of a bounded async stream."""
+    if not (context and context.policy_engine):
+        return
+    if state.buffer.policy_window_due():
+        window = state.buffer.take_policy_window()
+        await enforce_policies_async(context,
+                                     span,
+                                     _response_content(window, is_chat),
+                                     prompt=prompt,
+                                     completion=window,
+                                     log_chat_messages=False)
+
+
+class _AsyncStream:
+    """
+    Async iterator over a wrapped provider stream.
+
+    Closing it also closes the provider stream, even when iteration never
+    started, e.g. when a prompt policy blocks the request.
+    """
+
+    def __init__(self, chunks: AsyncGenerator, source: Any) -> None:
+        self._chunks = chunks
+        self._source = source
+
+    def __aiter__(self) -> "_AsyncStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        return await self._chunks.__anext__()
+
+    async def aclose(self) -> None:
+        """Stop the wrapped stream and close the provider stream."""
+        await self._chunks.aclose()
+        await aclose_quietly(self._source)
+
+
 async def handle_async_stream(func: Any,
                               client: Any,
                               parent_span: Span,
@@ -34,10 +413,11 @@ async def handle_async_stream(func: Any,
                               prompt: str = None,
                               is_chat: bool = False,
                               *args: Any,
-                              **kwargs: Any) -> AsyncGenerator:
-    """Handle async streaming responses."""
+                              provider: str = "openai",
+                              **kwargs: Any) -> "_AsyncStream":
+    """Handle async streaming responses, tracking usage under `provider`."""
     tracer = get_tracer(__name__)
-    accumulated_response = []
+    state = _StreamState(context, prompt_tokens, kwargs)
 
     # Get the generator first
     response_generator = await func(client, *args, **kwargs)
@@ -51,53 +431,56 @@ async def handle_async_stream(func: Any,
                            kind=SpanKind.INTERNAL) as stream_span:
         stream_span.set_attribute("prompt.tokens", prompt_tokens)
         stream_span.set_attribute("streaming", True)
+        stream_span.set_attribute("stream.mode",
+                                  "bounded" if state.bounded else "full")
         if prompt:
             stream_span.set_attribute("has_prompt", True)
 
         async def wrapped_generator():
             try:
+                if state.bounded:
+                    log_chat(context, parent_span, 'prompt', prompt)
+
                 async for chunk in response_generator:
-                    content = _extract_content_from_chunk(chunk, is_chat)
-                    if content:
-                        accumulated_response.append(content)
+                    content = state.add_chunk(chunk, is_chat)
+                    if state.bounded and content:
+                        _flush_stream_chat_log(context, parent_span, state)
+                        await _check_stream_window_async(
+                            context, stream_span, state, prompt, is_chat)
                     yield chunk
 
                 # After stream completes, process accumulated response
                 with tracer.start_span("finalize_stream",
                                        context=stream_ctx,
                                        kind=SpanKind.INTERNAL) as final_span:
-                    full_response = ''.join(accumulated_response)
-                    model = kwargs.get('model', 'gpt-3.5-turbo')
-                    completion_tokens = count_text_tokens(full_response, model)
-                    total_tokens = prompt_tokens + completion_tokens
+                    completion = state.completion_text()
+                    final_prompt_tokens, completion_tokens = state.usage()
+                    total_tokens = final_prompt_tokens + completion_tokens
 
+                    final_span.set_attributes(state.finalize_attributes())
                     final_span.set_attribute("completion.tokens",
                                              completion_tokens)
                     final_span.set_attribute("total.tokens", total_tokens)
 
-                    token_tracker.update("openai",
-                                         prompt_tokens=prompt_tokens,
-                                         completion_tokens=completion_tokens)
-
-                    # Structure response based on type
-                    response_content = {
-                        'choices': [{
-                            'message': {
-                                'content': full_response
-                            }
-                        }]
-                    } if is_chat else {
-                        'choices': [{
-                            'text': full_response
-                        }]
-                    }
+                    token_tracker.update(provider,
+                                         prompt_tokens=final_prompt_tokens,
+                                         completion_tokens=completion_tokens,
+                                         **usage_dimensions(context, state.model))
+
+                    if state.bounded:
+                        _flush_stream_chat_log(context,
+                                               parent_span,
+                                               state,
+                                               final=True)
 
                     if context and context.policy_engine:
-                        await enforce_policies(context,
-                                               final_span,
-                                               response_content,
-                                               prompt=prompt,
-                                               completion=full_response)
+                        await enforce_policies_async(
+                            context,
+                            final_span,
+                            _response_content(completion, is_chat),
+                            prompt=prompt,
+                            completion=completion,
+                            log_chat_messages=not state.bounded)
 
             except Exception as e:
                 stream_span.record_exception(e)
@@ -105,7 +488,7 @@ async def handle_async_stream(func: Any,
 
         # Create context for child spans
         stream_ctx = trace.set_span_in_context(stream_span)
-        return wrapped_generator()
+        return _AsyncStream(wrapped_generator(), response_generator)
 
 
 def handle_stream(func: Any,
@@ -117,10 +500,11 @@ def handle_stream(func: Any,
                   prompt: str = None,
                   is_chat: bool = False,
                   *args: Any,
+                  provider: str = "openai",
                   **kwargs: Any) -> Generator:
-    """Handle sync streaming responses."""
+    """Handle sync streaming responses, tracking usage under `provider`."""
     tracer = get_tracer(__name__)
-    accumulated_response = []
+    state = _StreamState(context, prompt_tokens, kwargs)
 
     # Get the sync generator
     response_generator = func(client, *args, **kwargs)
@@ -129,50 +513,52 @@ def handle_stream(func: Any,
     with tracer.start_as_current_span("stream_processing") as stream_span:
         stream_span.set_attribute("prompt.tokens", prompt_tokens)
         stream_span.set_attribute("streaming", True)
+        stream_span.set_attribute("stream.mode",
+                                  "bounded" if state.bounded else "full")
         if prompt:
             stream_span.set_attribute("has_prompt", True)
 
         try:
+            if state.bounded:
+                log_chat(context, parent_span, 'prompt', prompt)
+
             for chunk in response_generator:
-                content = _extract_content_from_chunk(chunk, is_chat)
-                if content:
-                    accumulated_response.append(content)
+                content = state.add_chunk(chunk, is_chat)
+                if state.bounded and content:
+                    _flush_stream_chat_log(context, parent_span, state)
+                    _check_stream_window(context, stream_span, state, prompt,
+                                         is_chat)
                 yield chunk
 
             # After stream completes, process accumulated response
             with tracer.start_as_current_span("finalize_stream") as final_span:
-                full_response = ''.join(accumulated_response)
-                model = kwargs.get('model', 'gpt-3.5-turbo')
-                completion_tokens = count_text_tokens(full_response, model)
-                total_tokens = prompt_tokens + completion_tokens
+                completion = state.completion_text()
+                final_prompt_tokens, completion_tokens = state.usage()
+                total_tokens = final_prompt_tokens + completion_tokens
 
+                final_span.set_attributes(state.finalize_attributes())
                 final_span.set_attribute("completion.tokens",
                                          completion_tokens)
                 final_span.set_attribute("total.tokens", total_tokens)
 
-                token_tracker.update("openai",
-                                     prompt_tokens=prompt_tokens,
-                                     completion_tokens=completion_tokens)
-
-                # Structure response based on type
-                response_content = {
-                    'choices': [{
-                        'message': {
-                            'content': full_response
-                        }
-                    }]
-                } if is_chat else {
-                    'choices': [{
-                        'text': full_response
-                    }]
-                }
+                token_tracker.update(provider,
+                                     prompt_tokens=final_prompt_tokens,
+                                     completion_tokens=completion_tokens,
+                                     **usage_dimensions(context, state.model))
+
+                if state.bounded:
+                    _flush_stream_chat_log(context,
+                                           parent_span,
+                                           state,
+                                           final=True)
 
                 if context and context.policy_engine:
                     enforce_policies(context,
                                      final_span,
-                                     response_content,
+                                     _response_content(completion, is_chat),
                                      prompt=prompt,
-                                     completion=full_response)
+                                     completion=completion,
+                                     log_chat_messages=not state.bounded)
 
         except Exception as e:
             stream_span.record_exception(e)
@@ -1,37 +1,332 @@
 # token_helpers.py
 """Utility functions for token counting and tracking"""
 
+import hashlib
+import threading
+from collections import OrderedDict
 import tiktoken
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from opentelemetry.trace import Span
 from ..core.token_tracker import TokenTracker
 
 
-def count_prompt_tokens(messages: List[Dict[str, Any]], model: str) -> int:
-    """Count tokens in chat messages."""
+class EncoderRegistry:
+    """
+    Process-wide LRU cache of tiktoken encoders keyed by model name.
+
+    Unknown models (e.g. Ollama's ``llama3``) are cached as ``None`` so the
+    exception-driven lookup in tiktoken only runs once per model. An alias
+    table maps provider model names to tiktoken encodings (or to a model
+    name tiktoken knows about).
+    """
+
+    def __init__(self,
+                 max_size: int = 64,
+                 aliases: Optional[Dict[str, str]] = None) -> None:
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._aliases: Dict[str, str] = dict(aliases or {})
+        self._encoders: "OrderedDict[str, Optional[tiktoken.Encoding]]" = OrderedDict(
+        )
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+
+    def configure(self,
+                  max_size: Optional[int] = None,
+                  aliases: Optional[Dict[str, str]] = None) -> None:
+        """Update cache size and alias table, dropping cached entries."""
+        with self._lock:
+            if max_size is not None:
+                self._max_size = max_size
+            if aliases is not None:
+                self._aliases = dict(aliases)
+            self._encoders.clear()
+
+    def get(self, model: str) -> Optional[tiktoken.Encoding]:
+        """Get the encoder for a model, or None if it cannot be resolved."""
+        with self._lock:
+            if model in self._encoders:
+                self._encoders.move_to_end(model)
+                encoder = self._encoders[model]
+                if encoder is None:
+                    self._negative_hits += 1
+                else:
+                    self._hits += 1
+                return encoder
+            self._misses += 1
+
+        encoder, cacheable = self._resolve(model)
+        if cacheable:
+            with self._lock:
+                self._encoders[model] = encoder
+                self._encoders.move_to_end(model)
+                while len(self._encoders) > self._max_size:
+                    self._encoders.popitem(last=False)
+        return encoder
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache hit/miss counters."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "size": len(self._encoders),
+                "max_size": self._max_size
+            }
+
+    def clear(self) -> None:
+        """Drop all cached encoders and reset counters."""
+        with self._lock:
+            self._encoders.clear()
+            self._hits = 0
+            self._negative_hits = 0
+            self._misses = 0
+
+    def _lookup_alias(self, model: str) -> Optional[str]:
+        """Find an alias for a model, ignoring Ollama-style ``:tag`` suffixes."""
+        if model in self._aliases:
+            return self._aliases[model]
+        base_model = model.split(':', 1)[0]
+        return self._aliases.get(base_model)
+
+    def _resolve(self,
+                 model: str) -> Tuple[Optional[tiktoken.Encoding], bool]:
+        """Resolve an encoder. Returns (encoder, cacheable)."""
+        alias = self._lookup_alias(model)
+        try:
+            if alias is None:
+                return tiktoken.encoding_for_model(model), True
+            try:
+                return tiktoken.get_encoding(alias), True
+            except ValueError:
+                # Alias refers to a model name rather than an encoding
+                return tiktoken.encoding_for_model(alias), True
+        except KeyError:
+            # Unknown model - remember so we skip the lookup next time
+            return None, True
+        except Exception:
+            # Transient failure (e.g. encoding download), retry next call
+            return None, False
+
+
+_encoder_registry = EncoderRegistry()
+
+
+def get_encoder(model: str) -> Optional[tiktoken.Encoding]:
+    """Get the cached tiktoken encoder for a model."""
+    return _encoder_registry.get(model)
+
+
+def configure_encoder_registry(max_size: Optional[int] = None,
+                               aliases: Optional[Dict[str, str]] = None) -> None:
+    """Configure the process-wide encoder registry."""
+    _encoder_registry.configure(max_size=max_size, aliases=aliases)
+
+
+def get_encoder_stats() -> Dict[str, int]:
+    """Get hit/miss counters of the process-wide encoder registry."""
+    return _encoder_registry.stats()
+
+
+# Inputs with at least `threshold` texts are encoded with tiktoken's
+# multi-threaded batch encoder instead of one text at a time.
+_batch_settings: Dict[str, int] = {"threshold": 64, "num_threads": 8}
+
+
+def configure_batch_counting(threshold: Optional[int] = None,
+                             num_threads: Optional[int] = None) -> None:
+    """Configure when and how batched token counting is used."""
+    if threshold is not None:
+        _batch_settings["threshold"] = threshold
+    if num_threads is not None:
+        _batch_settings["num_threads"] = num_threads
+
+
+def _encode_lengths(encoding: tiktoken.Encoding,
+                    texts: List[str]) -> List[int]:
+    """Token length of each text, batching large inputs across threads."""
+    if len(texts) >= _batch_settings["threshold"]:
+        encoded = encoding.encode_ordinary_batch(
+            texts, num_threads=_batch_settings["num_threads"])
+        return [len(tokens) for tokens in encoded]
+    return [len(encoding.encode_ordinary(text)) for text in texts]
+
+
+def count_text_tokens_batch(texts: List[str], model: str) -> List[int]:
+    """Count tokens for each text in a list (e.g. embedding inputs)."""
+    texts = [text if isinstance(text, str) else str(text) for text in texts]
+    encoding = get_encoder(model)
+    if encoding is not None:
+        try:
+            return _encode_lengths(encoding, texts)
+        except Exception:
+            pass
+
+    # Fallback to approximate count
+    return [len(text.split()) for text in texts]
+
+
+class MessageTokenCache:
+    """
+    Per-scope cache of per-message token counts for multi-round chats.
+
+    A scope is a session or transaction id. Each round of a conversation
+    resends the full history, so only messages not seen before in the
+    scope are encoded. Scopes are evicted LRU beyond `max_scopes`, entries
+    within a scope beyond `max_entries_per_scope`, and a scope is dropped
+    as soon as its session or transaction ends.
+    """
+
+    DEFAULT_SCOPE = "__default__"
+
+    def __init__(self,
+                 max_scopes: int = 1024,
+                 max_entries_per_scope: int = 512) -> None:
+        self._lock = threading.Lock()
+        self._max_scopes = max_scopes
+        self._max_entries_per_scope = max_entries_per_scope
+        self._scopes: "OrderedDict[str, OrderedDict[bytes, int]]" = OrderedDict(
+        )
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def message_key(message: Dict[str, Any], model: str) -> bytes:
+        """Stable hash of a message's role and content for a model."""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (model, str(message.get('role', '')),
+                     message.get('content', '')):
+            digest.update(part.encode('utf-8', errors='replace'))
+            digest.update(b'\0')
+        return digest.digest()
+
+    def count(self, scope_id: Optional[str], encoding: tiktoken.Encoding,
+              messages: List[Dict[str, Any]], model: str) -> int:
+        """Count content tokens of messages, encoding only unseen ones."""
+        scope_id = scope_id or self.DEFAULT_SCOPE
+        keyed = [(self.message_key(message, model), message['content'])
+                 for message in messages
+                 if isinstance(message.get('content'), str)]
+
+        counts: Dict[bytes, int] = {}
+        with self._lock:
+            entries = self._get_scope(scope_id)
+            for key, _ in keyed:
+                if key in entries:
+                    entries.move_to_end(key)
+                    counts[key] = entries[key]
+            self._hits += len(counts)
+
+        missing: Dict[bytes, str] = {
+            key: content
+            for key, content in keyed if key not in counts
+        }
+        if missing:
+            lengths = _encode_lengths(encoding, list(missing.values()))
+            new_counts = dict(zip(missing.keys(), lengths))
+            counts.update(new_counts)
+            with self._lock:
+                self._misses += len(new_counts)
+                entries = self._get_scope(scope_id)
+                entries.update(new_counts)
+                while len(entries) > self._max_entries_per_scope:
+                    entries.popitem(last=False)
+
+        return sum(counts[key] for key, _ in keyed)
+
+    def evict(self, scope_id: str) -> None:
+        """Drop cached counts for a finished session or transaction."""
+        with self._lock:
+            self._scopes.pop(scope_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache hit/miss counters."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "scopes": len(self._scopes),
+                "entries": sum(len(e) for e in self._scopes.values())
+            }
+
+    def _get_scope(self, scope_id: str) -> "OrderedDict[bytes, int]":
+        """Get (or create) a scope's entries. Caller must hold the lock."""
+        entries = self._scopes.get(scope_id)
+        if entries is None:
+            entries = OrderedDict()
+            self._scopes[scope_id] = entries
+            while len(self._scopes) > self._max_scopes:
+                self._scopes.popitem(last=False)
+        else:
+            self._scopes.move_to_end(scope_id)
+        return entries
+
+
+def _count_message_contents(messages: List[Dict[str, Any]], model: str,
+                            context: Optional[Any]) -> Optional[int]:
+    """Content tokens of chat messages, or None if no encoder is available."""
+    encoding = get_encoder(model)
+    if encoding is None:
+        return None
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        num_tokens = 0
-        for message in messages:
-            if isinstance(message.get('content'), str):
-                num_tokens += len(encoding.encode(message['content']))
-            num_tokens += 4  # Format tokens per message
-        num_tokens += 2  # Conversation format tokens
-        return num_tokens
+        token_cache = getattr(context, 'token_cache', None)
+        if token_cache is not None:
+            return token_cache.count(context.get_token_cache_scope(),
+                                     encoding, messages, model)
+        contents = [
+            message['content'] for message in messages
+            if isinstance(message.get('content'), str)
+        ]
+        return sum(_encode_lengths(encoding, contents))
     except Exception:
+        return None
+
+
+def count_prompt_tokens(messages: List[Dict[str, Any]],
+                        model: str,
+                        context: Optional[Any] = None) -> int:
+    """
+    Count tokens in chat messages.
+
+    If `context` carries a token cache, per-message counts are reused
+    across rounds of the current session or transaction.
+    """
+    num_tokens = _count_message_contents(messages, model, context)
+    if num_tokens is None:
+        # Fallback to approximate count
+        return sum(
+            len(str(msg.get('content', '')).split()) for msg in messages)
+
+    num_tokens += 4 * len(messages)  # Format tokens per message
+    num_tokens += 2  # Conversation format tokens
+    return num_tokens
+
+
+def count_message_tokens(messages: List[Dict[str, Any]],
+                         model: str,
+                         context: Optional[Any] = None) -> int:
+    """Count content tokens in chat messages, without format tokens."""
+    num_tokens = _count_message_contents(messages, model, context)
+    if num_tokens is None:
         # Fallback to approximate count
         return sum(
             len(str(msg.get('content', '')).split()) for msg in messages)
+    return num_tokens
 
 
 def count_text_tokens(text: str, model: str) -> int:
     """Count tokens in plain text."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except Exception:
-        # Fallback to approximate count
-        return len(text.split())
+    encoding = get_encoder(model)
+    if encoding is not None:
+        try:
+            return _encode_lengths(encoding, [text])[0]
+        except Exception:
+            pass
+
+    # Fallback to approximate count
+    return len(text.split())
 
 
 def record_token_usage(span: Span, response: Any) -> None:
@@ -57,8 +352,25 @@ def record_token_usage(span: Span, response: Any) -> None:
         span.set_attributes(usage_dict)
 
 
-def update_token_usage(token_tracker: TokenTracker, provider: str,
-                       usage: Any) -> None:
+def usage_dimensions(context: Any = None,
+                     model: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Get the model, user, session and transaction to attribute usage to."""
+    dimensions = {"model": model if isinstance(model, str) else None}
+    get_dimensions = getattr(context, "get_usage_dimensions", None)
+    context_dimensions = get_dimensions() if callable(get_dimensions) else None
+    if isinstance(context_dimensions, dict):
+        dimensions.update({
+            name: value if isinstance(value, str) else None
+            for name, value in context_dimensions.items()
+        })
+    return dimensions
+
+
+def update_token_usage(token_tracker: TokenTracker,
+                       provider: str,
+                       usage: Any,
+                       model: Optional[str] = None,
+                       context: Any = None) -> None:
     """Update token tracker with usage statistics."""
     prompt_tokens = getattr(usage, 'prompt_tokens', 0)
     completion_tokens = getattr(usage, 'completion_tokens', 0)
@@ -70,4 +382,5 @@ def update_token_usage(token_tracker: TokenTracker, provider: str,
 
     token_tracker.update(provider,
                          prompt_tokens=prompt_tokens,
-                         completion_tokens=completion_tokens)
+                         completion_tokens=completion_tokens,
+                         **usage_dimensions(context, model))
@@ -0,0 +1,74 @@
+import gzip
+import json
+import pytest
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OPAHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for OPA's data API."""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.server.encodings.append(self.headers.get("Content-Encoding"))
+        self.server.requests.append((self.path, json.loads(body)))
+
+        behaviour = self.server.behaviours.pop(0) if self.server.behaviours \
+            else None
+        if behaviour == "unavailable":
+            self._respond(503, {})
+            return
+        if behaviour == "slow" or "slow" in self.path:
+            time.sleep(0.5)
+
+        if self.path == "/v1/query":
+            self._respond(200, {"result": [self._query(body)]})
+            return
+
+        allow = "deny" not in self.path
+        self._respond(200, {"result": {"allow": allow, "violations": []}})
+
+    def _query(self, body):
+        """Bind each `pN := [x | x := data[...]]` of an ad-hoc query."""
+        bindings = {}
+        query = json.loads(body)["query"]
+        for name, ref in re.findall(r'(p\d+) := \[x \| x := data((?:\["[^"]*"\])+)\]',
+                                    query):
+            path = "/".join(json.loads(f"[{segment}]")[0]
+                            for segment in re.findall(r'\[("[^"]*")\]', ref))
+            bindings[name] = [] if "missing" in path else [{
+                "allow": "deny" not in path,
+                "violations": []
+            }]
+        return bindings
+
+    def _respond(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def opa_server():
+    """Local stand-in for an OPA server, recording the requests it gets."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OPAHandler)
+    server.requests = []
+    server.behaviours = []
+    server.encodings = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
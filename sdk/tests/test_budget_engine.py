@@ -0,0 +1,201 @@
+import pytest
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from observicia.core.budget_engine import (Budget, BudgetEngine,
+                                           BudgetExceededError)
+from observicia.core.policy_engine import Policy, PolicyEngine
+from observicia.core.token_tracker import TokenTracker
+from observicia.utils.budget_helpers import (enforce_budget,
+                                             enforce_budget_async,
+                                             refund_on_error)
+from observicia.utils.policy_helpers import run_with_prompt_gate
+
+
+def test_sliding_window_rejects_over_limit():
+    """Test requests beyond the window limit are rejected per user."""
+    engine = BudgetEngine([Budget(name="per-user", limit=100)])
+
+    assert engine.try_acquire(60, {"user_id": "alice"}).allowed
+    decision = engine.try_acquire(60, {"user_id": "alice"})
+    assert not decision.allowed
+    assert decision.budget == "per-user"
+    assert decision.remaining == 40
+
+    # Other users and requests without a user are unaffected
+    assert engine.try_acquire(60, {"user_id": "bob"}).allowed
+    assert engine.try_acquire(1000, {"user_id": None}).allowed
+
+
+def test_sliding_window_expires():
+    """Test usage leaves the sliding window after it ends."""
+    engine = BudgetEngine(
+        [Budget(name="global", scope="global", limit=10, window_seconds=10)])
+    now = time.time()
+
+    assert engine.try_acquire(10, {}, now=now - 20).allowed
+    assert engine.try_acquire(10, {}, now=now).allowed
+    assert not engine.try_acquire(1, {}, now=now).allowed
+
+
+def test_budget_match_filters_models():
+    """Test budgets only apply to matching dimensions."""
+    engine = BudgetEngine([
+        Budget(name="gpt-4",
+               scope="global",
+               limit=10,
+               match={"model": "gpt-4"})
+    ])
+
+    assert not engine.try_acquire(20, {"model": "gpt-4"}).allowed
+    assert engine.try_acquire(20, {"model": "gpt-3.5-turbo"}).allowed
+
+
+def test_token_bucket_delay():
+    """Test delayed requests wait for the bucket to refill."""
+    engine = BudgetEngine([
+        Budget(name="bucket",
+               scope="global",
+               limit=100,
+               window_seconds=1,
+               algorithm="token_bucket",
+               action="delay",
+               max_wait_seconds=1)
+    ])
+
+    engine.acquire(100, {})
+    decision, waited = engine.acquire(10, {})
+    assert decision.allowed
+    assert 0.05 <= waited <= 0.5
+
+    with pytest.raises(BudgetExceededError):
+        engine.acquire(500, {})  # larger than the bucket
+
+
+@pytest.mark.asyncio
+async def test_async_acquire_delays():
+    """Test async waits use the event loop."""
+    engine = BudgetEngine([
+        Budget(name="bucket",
+               scope="global",
+               limit=50,
+               window_seconds=1,
+               algorithm="token_bucket",
+               action="delay")
+    ])
+
+    await engine.acquire_async(50, {})
+    decision, waited = await engine.acquire_async(5, {})
+    assert decision.allowed
+    assert waited > 0
+
+
+def test_completion_tokens_charged_by_tracker():
+    """Test completion tokens recorded by the tracker count against budgets."""
+    engine = BudgetEngine([Budget(name="per-user", limit=100)])
+    tracker = TokenTracker()
+    tracker.add_listener(engine.record_usage)
+
+    assert engine.try_acquire(10, {"user_id": "alice"}).allowed
+    tracker.update("openai", 10, 85, user_id="alice")
+    assert not engine.try_acquire(10, {"user_id": "alice"}).allowed
+
+
+def test_enforce_budget_records_decision():
+    """Test the throttling decision is recorded on the span."""
+    context = SimpleNamespace(
+        budget_engine=BudgetEngine(
+            [Budget(name="global", scope="global", limit=10)]))
+    span = Mock()
+
+    enforce_budget(context, span, "openai", "gpt-4", 5)
+    attributes = span.set_attributes.call_args.args[0]
+    assert attributes["budget.decision"] == "allowed"
+    assert attributes["budget.remaining"] == 5
+
+    with pytest.raises(BudgetExceededError):
+        enforce_budget(context, span, "openai", "gpt-4", 10)
+    attributes = span.set_attributes.call_args.args[0]
+    assert attributes["budget.decision"] == "rejected"
+    assert attributes["budget.name"] == "global"
+
+
+@pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+def test_refund_returns_admitted_tokens(algorithm):
+    """Test refunded requests no longer count against the budget."""
+    engine = BudgetEngine([
+        Budget(name="global", scope="global", limit=100, algorithm=algorithm)
+    ])
+
+    decision = engine.try_acquire(80, {})
+    assert not engine.try_acquire(80, {}).allowed
+    engine.refund(80, {}, decision)
+    assert engine.try_acquire(80, {}).allowed
+
+
+def test_prompt_gate_refunds_blocked_requests():
+    """Test prompts blocked by policies don't use up the budget."""
+    context = SimpleNamespace(
+        budget_engine=BudgetEngine(
+            [Budget(name="global", scope="global", limit=10)]),
+        policy_engine=PolicyEngine(policies=[
+            Policy(name="no_secrets",
+                   backend="local",
+                   phase="prompt",
+                   rules={"deny_patterns": ["secret"]})
+        ]))
+    span = Mock(attributes={})
+    span.get_span_context.return_value = SimpleNamespace(trace_id=1,
+                                                         span_id=2)
+    call = Mock(return_value="response")
+
+    for _ in range(3):
+        refund = enforce_budget(context, span, "openai", "gpt-4", 8)
+        with pytest.raises(ValueError):
+            run_with_prompt_gate(context, span, "a secret", call,
+                                 on_blocked=refund)
+    span.set_attribute.assert_any_call("budget.refunded_tokens", 8)
+
+    refund = enforce_budget(context, span, "openai", "gpt-4", 8)
+    assert run_with_prompt_gate(context, span, "hello", call,
+                                on_blocked=refund) == "response"
+    with pytest.raises(BudgetExceededError):
+        enforce_budget(context, span, "openai", "gpt-4", 8)
+    context.policy_engine.close()
+
+
+def test_failed_provider_calls_are_refunded():
+    """Test provider errors give back the admitted tokens exactly once."""
+    context = SimpleNamespace(
+        budget_engine=BudgetEngine(
+            [Budget(name="global", scope="global", limit=10)]))
+    span = Mock()
+
+    for _ in range(3):
+        refund = enforce_budget(context, span, "openai", "gpt-4", 8)
+        with pytest.raises(TimeoutError):
+            with refund_on_error(refund):
+                raise TimeoutError("provider timed out")
+        refund()  # already refunded
+    engine = context.budget_engine
+    assert engine.try_acquire(8, {}).allowed
+    assert not engine.try_acquire(3, {}).allowed
+
+
+@pytest.mark.asyncio
+async def test_enforce_budget_async_without_engine():
+    """Test contexts without budgets skip enforcement."""
+    span = Mock()
+    await enforce_budget_async(SimpleNamespace(), span, "ollama", "llama3", 5)
+    span.set_attributes.assert_not_called()
+
+
+def test_invalid_budget():
+    """Test unknown scopes are rejected at configuration time."""
+    with pytest.raises(ValueError):
+        Budget(name="bad", limit=10, scope="team")
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
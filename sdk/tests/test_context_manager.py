@@ -1,4 +1,5 @@
 import pytest
+import threading
 from unittest.mock import Mock, patch, AsyncMock
 from datetime import datetime
 from opentelemetry import trace
@@ -125,6 +126,55 @@ class TestContextManager:
         assert retrieved == context
         assert retrieved.attributes == initial_context
 
+    def test_token_cache_scoped_to_transaction(self, context_manager):
+        transaction_id = context_manager.start_transaction()
+        assert context_manager.get_token_cache_scope() == transaction_id
+
+        context_manager.token_cache._get_scope(transaction_id)[b"key"] = 3
+        context_manager.end_transaction(transaction_id)
+
+        assert context_manager.get_token_cache_scope() is None
+        assert context_manager.token_cache.stats()["scopes"] == 0
+
+    def test_token_cache_scope_follows_current_transaction(
+            self, context_manager):
+        outer = context_manager.start_transaction()
+        inner = context_manager.start_transaction()
+        assert context_manager.get_token_cache_scope() == inner
+
+        # Transactions of other threads don't leak into this one
+        scopes = []
+        thread = threading.Thread(target=lambda: scopes.append(
+            (context_manager.get_token_cache_scope(),
+             context_manager.start_transaction(),
+             context_manager.get_token_cache_scope())))
+        thread.start()
+        thread.join()
+        assert scopes[0][0] is None
+        assert scopes[0][2] == scopes[0][1]
+        assert context_manager.get_token_cache_scope() == inner
+
+        context_manager.end_transaction(inner)
+        assert context_manager.get_token_cache_scope() == outer
+        context_manager.end_transaction(outer)
+        assert context_manager.get_token_cache_scope() is None
+
+    def test_usage_dimensions(self, context_manager):
+        context_manager.set_user_id("test-user")
+        transaction_id = context_manager.start_transaction()
+
+        dimensions = context_manager.get_usage_dimensions()
+        assert dimensions["user_id"] == "test-user"
+        assert dimensions["transaction_id"] == transaction_id
+
+    def test_end_session(self, context_manager):
+        context_manager.create_session("test-session")
+        context_manager.token_cache._get_scope("test-session")
+        context_manager.end_session("test-session")
+
+        assert context_manager.get_session("test-session") is None
+        assert context_manager.token_cache.stats()["scopes"] == 0
+
     @pytest.mark.asyncio
     async def test_create_span(self, context_manager, trace_context):
         span_name = "test-span"
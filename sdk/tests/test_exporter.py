@@ -0,0 +1,366 @@
+import importlib.util
+import pytest
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+
+from observicia.utils.exporter import RedisSpanExporter, SQLiteSpanExporter
+from observicia.utils.redis_helpers import get_connection_pool
+from observicia.utils.sqlite_schema import SCHEMA_VERSION
+
+
+def make_spans(count, start_time=None, **attributes):
+    """Create finished LLM spans with token attributes."""
+    spans = []
+
+    class Collector:
+
+        def export(self, batch):
+            spans.extend(batch)
+
+        def shutdown(self):
+            pass
+
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(Collector()))
+    tracer = provider.get_tracer(__name__)
+    for i in range(count):
+        with tracer.start_as_current_span("openai.chat.completion",
+                                          start_time=start_time) as span:
+            span.set_attributes({
+                "llm.model": "gpt-4",
+                "llm.provider": "openai",
+                "user.id": "alice",
+                "prompt.tokens": 10,
+                "completion.tokens": i,
+                "total.tokens": 10 + i,
+                **attributes
+            })
+    with tracer.start_as_current_span("policy_evaluation"):
+        pass  # no token data, not exported
+    return spans
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / "telemetry.db")
+
+
+def test_sqlite_exporter_batches_in_wal_mode(database):
+    """Test spans are written on one connection in WAL mode."""
+    exporter = SQLiteSpanExporter(database)
+
+    assert exporter.export(make_spans(100)) == SpanExportResult.SUCCESS
+    assert exporter.export(make_spans(50)) == SpanExportResult.SUCCESS
+
+    # Readers see committed rows while the exporter keeps its connection
+    with sqlite3.connect(database) as reader:
+        assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        count, tokens = reader.execute(
+            "SELECT COUNT(*), SUM(completion_tokens) FROM telemetry"
+        ).fetchone()
+    assert count == 150
+    assert tokens == sum(range(100)) + sum(range(50))
+
+    assert exporter.force_flush()
+    exporter.shutdown()
+
+
+def test_sqlite_exporter_from_threads(database):
+    """Test export batches from several threads share the connection."""
+    exporter = SQLiteSpanExporter(database)
+    spans = make_spans(20)
+    threads = [
+        threading.Thread(target=exporter.export, args=(spans, ))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    exporter.shutdown()
+
+    with sqlite3.connect(database) as reader:
+        assert reader.execute(
+            "SELECT COUNT(*) FROM telemetry").fetchone()[0] == 80
+
+
+def test_sqlite_exporter_shutdown(database):
+    """Test shutdown closes the connection and later exports fail."""
+    exporter = SQLiteSpanExporter(database)
+    exporter.shutdown()
+    exporter.shutdown()  # idempotent
+
+    assert exporter.export(make_spans(1)) == SpanExportResult.FAILURE
+    assert not exporter.force_flush()
+
+
+def test_sqlite_rollups_accumulate(database):
+    """Test batches are summed into minute and hour rollups."""
+    exporter = SQLiteSpanExporter(database)
+    exporter.export(make_spans(10))
+    exporter.export(make_spans(5, **{"policy.passed": False}))
+    exporter.shutdown()
+
+    with sqlite3.connect(database) as reader:
+        for table in ("telemetry_rollup_minute", "telemetry_rollup_hour"):
+            requests, failures, completion_tokens, model = reader.execute(
+                f"SELECT SUM(requests), SUM(failures), "
+                f"SUM(completion_tokens), MIN(model) FROM {table}").fetchone()
+            assert (requests, failures) == (15, 5)
+            assert completion_tokens == sum(range(10)) + sum(range(5))
+            assert model == "gpt-4"
+        timestamp_ns = reader.execute(
+            "SELECT timestamp_ns FROM telemetry LIMIT 1").fetchone()[0]
+    assert isinstance(timestamp_ns, int)
+
+
+def test_sqlite_migrates_legacy_database(database):
+    """Test databases with ISO text timestamps are upgraded in place."""
+    with sqlite3.connect(database) as conn:
+        conn.execute('''
+            CREATE TABLE telemetry (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL, transaction_id TEXT, user_id TEXT,
+                model TEXT, provider TEXT, request_type TEXT,
+                prompt_tokens INTEGER, completion_tokens INTEGER,
+                total_tokens INTEGER, duration_ms REAL, success BOOLEAN,
+                trace_id TEXT, span_id TEXT, parent_span_id TEXT)
+        ''')
+        conn.execute(
+            "INSERT INTO telemetry (timestamp, user_id, model, provider, "
+            "prompt_tokens, completion_tokens, total_tokens, duration_ms, "
+            "success) VALUES ('2024-01-01T00:00:30.250000', 'bob', 'gpt-4', "
+            "'openai', 5, 7, 12, 100.0, 1)")
+
+    SQLiteSpanExporter(database).shutdown()
+
+    with sqlite3.connect(database) as conn:
+        assert conn.execute(
+            "PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("SELECT timestamp_ns FROM telemetry").fetchone(
+        )[0] == 1704067230250000000
+        assert conn.execute(
+            "SELECT bucket_ns, user_id, total_tokens, duration_ms_sum "
+            "FROM telemetry_rollup_minute").fetchall() == [
+                (1704067200000000000, "bob", 12, 100.0)
+            ]
+        # The user panel is answered from the covering index alone
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT SUM(total_tokens) FROM telemetry "
+            "WHERE user_id = 'bob' AND timestamp_ns > 0"))
+    assert "COVERING INDEX idx_telemetry_user_time" in plan
+
+
+def test_sqlite_retention_deletes_in_chunks(database):
+    """Test expired raw rows go first and rollups are kept longer."""
+    exporter = SQLiteSpanExporter(database,
+                                  retention_hours=1,
+                                  minute_rollup_retention_hours=24,
+                                  retention_interval_seconds=3600,
+                                  retention_chunk_size=7)
+    spans = make_spans(20)
+    exporter.export(spans)
+    start_ns = min(span.start_time for span in spans)
+
+    # Two hours later raw rows have expired, minute rollups have not
+    deleted = exporter.enforce_retention(start_ns + 2 * 3600 * 10**9)
+    assert deleted == {
+        "telemetry": 20,
+        "telemetry_rollup_minute": 0,
+        "telemetry_rollup_hour": 0
+    }
+    # Two days later the minute rollups have expired too
+    deleted = exporter.enforce_retention(start_ns + 48 * 3600 * 10**9)
+    assert deleted["telemetry_rollup_minute"] >= 1
+    assert deleted["telemetry_rollup_hour"] == 0
+    exporter.shutdown()
+
+    with sqlite3.connect(database) as reader:
+        assert reader.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert reader.execute(
+            "SELECT COUNT(*) FROM telemetry").fetchone()[0] == 0
+        assert reader.execute(
+            "SELECT SUM(requests) FROM telemetry_rollup_hour").fetchone(
+            )[0] == 20
+
+
+def test_sqlite_retention_thread(database):
+    """Test the retention thread runs in the background until shutdown."""
+    with pytest.raises(ValueError):
+        SQLiteSpanExporter(database,
+                           retention_hours=48,
+                           minute_rollup_retention_hours=24)
+
+    exporter = SQLiteSpanExporter(database,
+                                  retention_hours=0,
+                                  retention_interval_seconds=0.01)
+    exporter.export(make_spans(5))
+    thread = exporter._retention_thread
+    assert thread.is_alive()
+    for _ in range(100):
+        with sqlite3.connect(database) as reader:
+            if not reader.execute(
+                    "SELECT COUNT(*) FROM telemetry").fetchone()[0]:
+                break
+        thread.join(0.01)
+    else:
+        pytest.fail("retention thread did not delete expired rows")
+
+    exporter.shutdown()
+    assert not thread.is_alive()
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_redis_exporter_keys_by_span_id(redis_client):
+    """Test spans starting in the same nanosecond don't overwrite each other."""
+    exporter = RedisSpanExporter(client=redis_client)
+    spans = make_spans(3, start_time=1_700_000_000_000_000_000)
+
+    assert exporter.export(spans) == SpanExportResult.SUCCESS
+
+    span_keys = redis_client.keys("observicia:telemetry:span:*")
+    assert len(span_keys) == 3
+    key = exporter.span_key(spans[0].context.trace_id,
+                            spans[0].context.span_id)
+    data = redis_client.hgetall(key)
+    assert data["span_id"] == format(spans[0].context.span_id, "016x")
+    assert data["completion_tokens"] == "0"
+    assert 0 < redis_client.ttl(key) <= 24 * 3600
+
+
+def test_redis_exporter_batch_is_one_round_trip(redis_client, monkeypatch):
+    """Test a batch is written with a single non-transactional pipeline."""
+    exporter = RedisSpanExporter(client=redis_client)
+    pipelines = []
+    make_pipeline = redis_client.pipeline
+
+    def pipeline(transaction=True):
+        pipelines.append(transaction)
+        return make_pipeline(transaction=transaction)
+
+    monkeypatch.setattr(redis_client, "pipeline", pipeline)
+    monkeypatch.setattr(redis_client, "execute_command",
+                        lambda *args, **kwargs: pytest.fail(str(args)))
+
+    assert exporter.export(make_spans(512)) == SpanExportResult.SUCCESS
+    assert pipelines == [False]
+    monkeypatch.undo()
+    assert redis_client.zcard(exporter.index_key()) == 512
+
+
+def test_redis_exporter_time_indexes(redis_client):
+    """Test spans are found by time range per model and per user."""
+    exporter = RedisSpanExporter(client=redis_client)
+    now = time.time_ns()
+    exporter.export(make_spans(2, start_time=now - 120 * 10**9))
+    exporter.export(
+        make_spans(3,
+                   start_time=now,
+                   **{
+                       "llm.model": "llama3",
+                       "user.id": "bob"
+                   }))
+
+    assert len(exporter.get_spans(now - 3600 * 10**9, now)) == 5
+    assert len(exporter.get_spans(now - 60 * 10**9, now)) == 3
+    assert len(exporter.get_spans(0, now, model="gpt-4")) == 2
+    assert [
+        span["model"] for span in exporter.get_spans(0, now, user_id="bob")
+    ] == ["llama3"] * 3
+    assert exporter.get_spans(0, now, model="gpt-4", user_id="bob") == []
+    assert exporter.get_spans(0, now - 3600 * 10**9) == []
+
+
+def test_redis_connection_pool_is_shared():
+    """Test clients of the same server share one connection pool."""
+    first = RedisSpanExporter(host="redis.example", port=6390)
+    second = RedisSpanExporter(host="redis.example",
+                               port=6390,
+                               key_prefix="other:")
+    other_db = RedisSpanExporter(host="redis.example", port=6390, db=1)
+
+    pool = get_connection_pool("redis.example", 6390)
+    assert first.redis_client.connection_pool is pool
+    assert second.redis_client.connection_pool is pool
+    assert other_db.redis_client.connection_pool is not pool
+
+    first.shutdown()
+    assert second.redis_client.connection_pool is pool
+
+
+def load_stream_consumer():
+    """Import the stream consumer utility from the repository's util/."""
+    path = Path(__file__).resolve().parents[2] / "util" / \
+        "redis_stream_consumer.py"
+    spec = importlib.util.spec_from_file_location("redis_stream_consumer",
+                                                  path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_redis_exporter_stream_mode(redis_client):
+    """Test stream mode appends compact records trimmed to about maxlen."""
+    with pytest.raises(ValueError):
+        RedisSpanExporter(client=redis_client, mode="list")
+
+    exporter = RedisSpanExporter(client=redis_client,
+                                 mode="stream",
+                                 stream_maxlen=100)
+    spans = make_spans(3, **{"transaction_id": ""})
+    assert exporter.export(spans) == SpanExportResult.SUCCESS
+
+    entries = redis_client.xrange(exporter.stream_key)
+    assert len(entries) == 3
+    fields = entries[0][1]
+    assert fields["timestamp_ns"] == str(spans[0].start_time)
+    assert fields["total_tokens"] == "10"
+    assert "transaction_id" not in fields and "timestamp" not in fields
+    assert not redis_client.keys("observicia:telemetry:span:*")
+
+    for _ in range(5):
+        exporter.export(make_spans(100))
+    assert redis_client.xlen(exporter.stream_key) < 503
+
+
+def test_redis_stream_consumer_group(redis_client):
+    """Test consumers in a group share records and recover pending ones."""
+    consumer_module = load_stream_consumer()
+    exporter = RedisSpanExporter(client=redis_client, mode="stream")
+    first = consumer_module.TelemetryStreamConsumer(redis_client,
+                                                    consumer="first",
+                                                    count=2,
+                                                    block_ms=0,
+                                                    claim_idle_ms=0)
+    second = consumer_module.TelemetryStreamConsumer(redis_client,
+                                                     consumer="second",
+                                                     block_ms=0,
+                                                     claim_idle_ms=0)
+    first.ensure_group()
+    second.ensure_group()  # already exists
+
+    exporter.export(make_spans(5))
+
+    # The first consumer reads two records and stops before acknowledging
+    assert len(first.read()) == 2
+    handled = []
+    assert second.poll(lambda entry_id, fields: handled.append(
+        int(fields["completion_tokens"]))) == 5
+    assert sorted(handled) == list(range(5))
+    assert redis_client.xpending(exporter.stream_key,
+                                 "observicia")["pending"] == 0
+    assert first.poll(lambda entry_id, fields: None) == 0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,810 @@
+import asyncio
+import pytest
+import threading
+import time
+from types import SimpleNamespace
+
+from unittest.mock import AsyncMock, Mock
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import \
+    InMemorySpanExporter
+
+from observicia.core.circuit_breaker import CircuitBreaker
+from observicia.core.policy_audit import PolicyAuditor
+from observicia.core.policy_engine import (Policy, PolicyDecisionCache,
+                                           PolicyEngine, PolicyResult,
+                                           encode_json, project_input)
+from observicia.utils.policy_helpers import (enforce_policies,
+                                             enforce_policies_async,
+                                             run_with_prompt_gate,
+                                             run_with_prompt_gate_async)
+
+
+def make_engine(server, policies, **kwargs):
+    host, port = server.server_address
+    return PolicyEngine(f"http://{host}:{port}/", policies=policies, **kwargs)
+
+
+def test_connections_are_reused(opa_server):
+    """Test evaluations share keep-alive connections to OPA."""
+    engine = make_engine(opa_server, [
+        Policy(name="allow_a", path="policies/a"),
+        Policy(name="allow_b", path="policies/b")
+    ])
+
+    for _ in range(3):
+        assert engine.evaluate_sync({"model": "gpt-4"}).passed
+
+    stats = engine.connection_stats()
+    assert stats["requests"] == 6
+    # One connection per concurrently evaluated policy, reused afterwards
+    assert stats["new_connections"] <= 2
+    assert stats["reused_connections"] >= 4
+    engine.close()
+
+
+def test_unavailable_opa_is_retried(opa_server):
+    """Test 503 responses are retried with backoff."""
+    opa_server.behaviours = ["unavailable", "unavailable"]
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         max_retries=2,
+                         retry_base_delay=0.01)
+    responses = []
+    post = engine.session.post
+
+    def recording_post(*args, **kwargs):
+        response = post(*args, **kwargs)
+        response.close = Mock(wraps=response.close)
+        responses.append(response)
+        return response
+
+    engine.session.post = recording_post
+
+    assert engine.evaluate_sync({}).passed
+    assert len(opa_server.requests) == 3
+    # Retried responses are closed before backing off
+    assert [r.close.called for r in responses] == [True, True, False]
+    assert engine.connection_stats()["retries"] == 2
+    engine.close()
+
+
+def test_read_timeout_fails_policy(opa_server):
+    """Test a hung OPA fails the policy instead of blocking forever."""
+    opa_server.behaviours = ["slow"]
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         read_timeout=0.1,
+                         max_retries=0)
+
+    result = engine.evaluate_sync({})
+    assert not result.passed
+    assert engine.connection_stats()["failures"] == 1
+    engine.close()
+
+
+def test_policy_violation(opa_server):
+    """Test denied policies are reported as violations."""
+    engine = make_engine(opa_server,
+                         [Policy(name="deny_all", path="policies/deny")])
+
+    result = engine.evaluate_sync({})
+    assert not result.passed
+    assert result.violations == ["deny_all: Policy check failed"]
+    assert opa_server.requests[0][0] == "/v1/data/policies/deny"
+    engine.close()
+
+
+def test_policies_evaluated_in_parallel(opa_server):
+    """Test policy latency is the slowest policy, not the sum."""
+    engine = make_engine(opa_server, [
+        Policy(name="slow_a", path="policies/slow_a"),
+        Policy(name="slow_b", path="policies/slow_b"),
+        Policy(name="slow_c", path="policies/slow_c")
+    ])
+
+    start = time.monotonic()
+    assert engine.evaluate_sync({}).passed
+    assert time.monotonic() - start < 1.2
+    engine.close()
+
+
+def test_aggregation_follows_policy_order(opa_server):
+    """Test violations are reported in policy order whatever finishes first."""
+    engine = make_engine(opa_server, [
+        Policy(name="deny_slow", path="policies/deny_slow"),
+        Policy(name="deny_fast", path="policies/deny_fast", risk_level="high")
+    ])
+
+    result = engine.evaluate_sync({})
+    assert [v.split(":")[0] for v in result.violations
+            ] == ["deny_slow", "deny_fast"]
+    assert result.risk_level == "high"
+    engine.close()
+
+
+def test_evaluation_deadline(opa_server):
+    """Test policies missing the overall deadline fail without blocking."""
+    engine = make_engine(opa_server, [
+        Policy(name="allow_a", path="policies/a"),
+        Policy(name="slow_b", path="policies/slow_b")
+    ],
+                         evaluation_timeout=0.2)
+
+    start = time.monotonic()
+    result = engine.evaluate_sync({})
+    assert time.monotonic() - start < 0.45
+    assert not result.passed
+    assert [v.split(":")[0] for v in result.violations] == ["slow_b"]
+    engine.close()
+
+
+def test_single_policy_deadline(opa_server):
+    """Test the deadline also bounds one policy's retries and read timeout."""
+    opa_server.behaviours = ["slow"] * 3
+    engine = make_engine(opa_server,
+                         [Policy(name="slow_a", path="policies/a")],
+                         read_timeout=5.0,
+                         max_retries=2,
+                         evaluation_timeout=0.2)
+
+    start = time.monotonic()
+    result = engine.evaluate_sync({})
+    assert time.monotonic() - start < 0.45
+    assert "timed out" in result.violations[0]
+    engine.close()
+
+
+def test_timed_out_workers_are_released(opa_server):
+    """Test evaluations past the deadline give their worker threads back."""
+    engine = make_engine(opa_server, [
+        Policy(name="slow_a", path="policies/slow_a"),
+        Policy(name="slow_b", path="policies/slow_b")
+    ],
+                         max_parallel=2,
+                         read_timeout=5.0,
+                         evaluation_timeout=0.1)
+
+    assert not engine.evaluate_sync({}).passed
+    for name in ("slow_a", "slow_b"):
+        engine.deactivate_policy(name)
+    engine.add_policy(Policy(name="allow_a", path="policies/a"))
+    engine.add_policy(Policy(name="allow_b", path="policies/b"))
+    time.sleep(0.05)
+
+    # A hung OPA would still hold both workers for the next request
+    assert engine.evaluate_sync({}).passed
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_async_evaluation_in_parallel(opa_server):
+    """Test the async path evaluates policies concurrently."""
+    engine = make_engine(opa_server, [
+        Policy(name="slow_a", path="policies/slow_a"),
+        Policy(name="deny_slow", path="policies/deny_slow")
+    ])
+
+    start = time.monotonic()
+    result = await engine.evaluate_with_context({})
+    assert time.monotonic() - start < 0.9
+    assert [v.split(":")[0] for v in result.violations] == ["deny_slow"]
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_async_retries_and_reuses_client(opa_server):
+    """Test the async path retries on the loop's pooled client."""
+    opa_server.behaviours = ["unavailable"]
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         retry_base_delay=0.01)
+    responses = []
+    client = engine._async_client()
+    post = client.post
+
+    async def recording_post(*args, **kwargs):
+        response = await post(*args, **kwargs)
+        response.aclose = AsyncMock(wraps=response.aclose)
+        responses.append(response)
+        return response
+
+    client.post = recording_post
+
+    assert (await engine.evaluate_with_context({})).passed
+    assert [r.aclose.called for r in responses] == [True, False]
+    assert (await engine.evaluate_with_context({})).passed
+    assert engine._async_client() is client
+    assert len(opa_server.requests) == 3
+    assert engine.connection_stats()["retries"] == 1
+
+    await engine.aclose()
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_enforce_policies_async_raises_on_violation(opa_server):
+    """Test async enforcement records the result and raises on violations."""
+    context = Mock()
+    context.policy_engine = make_engine(
+        opa_server, [Policy(name="deny_all", path="policies/deny")])
+    span = Mock()
+    span.attributes = {"llm.model": "gpt-4"}
+    span.get_span_context.return_value = Mock(trace_id=1, span_id=2)
+
+    with pytest.raises(ValueError):
+        await enforce_policies_async(context,
+                                     span,
+                                     {"text": "hi"},
+                                     prompt="hi",
+                                     completion="hello",
+                                     log_chat_messages=False)
+
+    span.set_attributes.assert_called_with({
+        "policy.passed": False,
+        "policy.violations": "deny_all: Policy check failed"
+    })
+    assert opa_server.requests[0][1]["input"]["completion"] == "hello"
+    await context.policy_engine.aclose()
+    context.policy_engine.close()
+
+
+def test_bundled_evaluation_uses_one_request(opa_server):
+    """Test bundle mode evaluates every policy in a single OPA query."""
+    engine = make_engine(opa_server, [
+        Policy(name="allow_a", path="policies/a"),
+        Policy(name="deny_b", path="policies/deny-b"),
+        Policy(name="missing_c", path="policies/missing")
+    ],
+                         bundle=True)
+
+    result = engine.evaluate_sync({"model": "gpt-4"})
+    assert len(opa_server.requests) == 1
+    path, body = opa_server.requests[0]
+    assert path == "/v1/query"
+    assert 'data["policies"]["deny-b"]' in body["query"]
+    assert body["input"] == {"model": "gpt-4"}
+    assert result.violations == [
+        "deny_b: Policy check failed", "missing_c: Policy check failed"
+    ]
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_bundled_async_evaluation(opa_server):
+    """Test the async path also bundles policies into one query."""
+    engine = make_engine(opa_server, [
+        Policy(name="allow_a", path="policies/a"),
+        Policy(name="allow_b", path="policies/b")
+    ],
+                         bundle=True)
+
+    assert (await engine.evaluate_with_context({})).passed
+    assert [path for path, _ in opa_server.requests] == ["/v1/query"]
+    await engine.aclose()
+    engine.close()
+
+
+def test_decision_cache_reuses_cacheable_policies(opa_server):
+    """Test repeated inputs reuse decisions of cacheable policies only."""
+    engine = make_engine(opa_server, [
+        Policy(name="pii", path="policies/pii", cacheable=True),
+        Policy(name="per_user", path="policies/user")
+    ])
+    span = Mock()
+
+    for trace_id in (1, 2):
+        eval_context = {
+            "response": {
+                "id": f"resp-{trace_id}",
+                "text": "hello"
+            },
+            "trace_context": {
+                "trace_id": trace_id,
+                "span_id": trace_id,
+                "attributes": {}
+            }
+        }
+        assert engine._evaluate_policies_sync(eval_context,
+                                              engine.available_policies,
+                                              span).passed
+
+    paths = [path for path, _ in opa_server.requests]
+    assert paths.count("/v1/data/policies/pii") == 1
+    assert paths.count("/v1/data/policies/user") == 2
+    span.set_attributes.assert_called_with({
+        "policy.cache.hits": 1,
+        "policy.cache.misses": 0,
+        "policy.cache.hit_ratio": 0.5
+    })
+    engine.close()
+
+
+def test_decision_cache_ignores_volatile_attributes():
+    """Test per-call span attributes such as budget state don't split keys."""
+    cache = PolicyDecisionCache()
+    policy = Policy(name="pii", path="policies/pii", cacheable=True)
+
+    def context(remaining, model="gpt-4"):
+        return {
+            "completion": "hello",
+            "trace_context": {
+                "trace_id": remaining,
+                "attributes": {
+                    "llm.model": model,
+                    "budget.remaining": remaining,
+                    "budget.wait_ms": remaining % 7
+                }
+            }
+        }
+
+    assert cache.key(policy, context(100)) == cache.key(policy, context(42))
+    assert cache.key(policy, context(100)) != cache.key(
+        policy, context(100, model="gpt-3.5"))
+
+    # Declared fields are kept even when they are usually volatile
+    reads_budget = Policy(name="budget",
+                          path="policies/budget",
+                          cacheable=True,
+                          input_fields=["trace_context.attributes"])
+    assert cache.key(reads_budget, context(100)) != cache.key(
+        reads_budget, context(42))
+
+
+def test_decision_cache_ttl_and_lru():
+    """Test cached decisions expire and the cache stays bounded."""
+    cache = PolicyDecisionCache(max_size=2, ttl=60)
+    policy = Policy(name="pii", path="policies/pii")
+    keys = [cache.key(policy, {"prompt": str(i)}) for i in range(3)]
+    assert len(set(keys)) == 3
+
+    for key in keys:
+        cache.put(key, {"result": {"allow": True}})
+    assert cache.get(keys[0]) is None  # evicted
+    assert cache.get(keys[2]) == {"result": {"allow": True}}
+
+    cache.put(keys[1], {"result": {"allow": True}}, ttl=0)
+    assert cache.get(keys[1]) is None  # expired
+
+
+def test_failed_evaluations_are_not_cached(opa_server):
+    """Test errors are retried instead of being served from the cache."""
+    opa_server.behaviours = ["unavailable"]
+    engine = make_engine(
+        opa_server, [Policy(name="pii", path="policies/pii", cacheable=True)],
+        max_retries=0)
+
+    assert not engine.evaluate_sync({"prompt": "hi"}).passed
+    assert engine.evaluate_sync({"prompt": "hi"}).passed
+    assert len(opa_server.requests) == 2
+    engine.close()
+
+
+def reject_internal(eval_context):
+    """Local policy function used by the tests below."""
+    if "internal" in (eval_context.get("prompt") or ""):
+        return {"allow": False, "violations": ["Internal data in prompt"]}
+    return True
+
+
+def local_context(prompt="hi", model="gpt-4", prompt_tokens=10):
+    return {
+        "prompt": prompt,
+        "trace_context": {
+            "attributes": {
+                "llm.model": model,
+                "prompt.tokens": prompt_tokens
+            }
+        }
+    }
+
+
+def test_local_policy_rules():
+    """Test local rules are evaluated without an OPA endpoint."""
+    engine = PolicyEngine(policies=[
+        Policy(name="limits",
+               backend="local",
+               rules={
+                   "max_prompt_tokens": 100,
+                   "allowed_models": ["gpt-4"],
+                   "deny_patterns": [r"\b\d{3}-\d{2}-\d{4}\b"]
+               })
+    ])
+
+    assert engine.evaluate_sync(local_context()).passed
+    result = engine.evaluate_sync(
+        local_context(prompt="ssn 123-45-6789",
+                      model="gpt-3.5-turbo",
+                      prompt_tokens=500))
+    assert not result.passed
+    assert len(result.violations) == 3
+    engine.close()
+
+
+def test_local_policy_function():
+    """Test local policies can delegate to a Python function."""
+    engine = PolicyEngine(policies=[
+        Policy(name="internal",
+               backend="local",
+               rules={"function": f"{__name__}:reject_internal"})
+    ])
+
+    assert engine.evaluate_sync(local_context()).passed
+    result = engine.evaluate_sync(local_context(prompt="internal roadmap"))
+    assert result.violations == ["internal: Internal data in prompt"]
+    engine.close()
+
+
+def test_local_rules_are_recompiled_when_changed():
+    """Test rules edited in place are not served from the compile cache."""
+    policy = Policy(name="limits",
+                    backend="local",
+                    rules={"max_prompt_tokens": 100})
+    engine = PolicyEngine(policies=[policy])
+
+    assert engine.evaluate_sync(local_context(prompt_tokens=50)).passed
+    policy.rules["max_prompt_tokens"] = 10
+    assert not engine.evaluate_sync(local_context(prompt_tokens=50)).passed
+    engine.close()
+
+
+def test_invalid_local_rules():
+    """Test unknown local rules are rejected when the policy is added."""
+    with pytest.raises(ValueError):
+        PolicyEngine(policies=[
+            Policy(name="bad", backend="local", rules={"max_cost": 1})
+        ])
+
+
+@pytest.mark.asyncio
+async def test_mixed_local_and_opa_policies(opa_server):
+    """Test only OPA policies are sent to the server, in policy order."""
+    engine = make_engine(opa_server, [
+        Policy(name="deny_remote", path="policies/deny"),
+        Policy(name="limits",
+               backend="local",
+               rules={"max_prompt_tokens": 5})
+    ])
+
+    for result in (engine.evaluate_sync(local_context()), await
+                   engine.evaluate_with_context(local_context())):
+        assert [v.split(":")[0]
+                for v in result.violations] == ["deny_remote", "limits"]
+    assert [path for path, _ in opa_server.requests
+            ] == ["/v1/data/policies/deny"] * 2
+    await engine.aclose()
+    engine.close()
+
+
+def test_opa_policy_without_endpoint_fails():
+    """Test OPA policies fail closed when no endpoint is configured."""
+    engine = PolicyEngine(policies=[Policy(name="remote", path="policies/a")])
+    result = engine.evaluate_sync({})
+    assert result.violations == ["remote: No OPA endpoint configured"]
+    assert result.risk_level == "high"
+    engine.close()
+
+
+def test_audit_policies_do_not_block(opa_server):
+    """Test audit-mode policies are evaluated off the request path."""
+    engine = make_engine(opa_server, [
+        Policy(name="allow_a", path="policies/a"),
+        Policy(name="deny_slow", path="policies/deny_slow", mode="audit")
+    ])
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    engine.auditor.tracer = provider.get_tracer(__name__)
+
+    start = time.monotonic()
+    result = engine.evaluate_sync(
+        {"trace_context": {
+            "trace_id": f"{0xabc:032x}",
+            "span_id": f"{0xdef:016x}",
+            "attributes": {}
+        }})
+    assert time.monotonic() - start < 0.4
+    assert result.passed
+
+    engine.auditor.join()
+    [audit_span] = exporter.get_finished_spans()
+    assert audit_span.name == "policy_audit"
+    assert audit_span.links[0].context.span_id == 0xdef
+    assert audit_span.attributes["policy.passed"] is False
+    assert engine.auditor.stats()["completed"] == 1
+    engine.close()
+
+
+def test_audit_queue_sheds_load():
+    """Test audits beyond the queue bound are shed instead of blocking."""
+    release = threading.Event()
+    auditor = PolicyAuditor(
+        lambda *args: release.wait() and PolicyResult(True, []),
+        queue_size=1,
+        workers=1)
+    policies = [Policy(name="audit", path="policies/a", mode="audit")]
+
+    results = [auditor.submit({}, policies) for _ in range(5)]
+    assert not all(results)
+    assert auditor.stats()["shed"] == results.count(False)
+
+    release.set()
+    auditor.close()
+
+
+def prompt_gate_span():
+    span = Mock()
+    span.attributes = {"llm.model": "gpt-4"}
+    span.get_span_context.return_value = Mock(trace_id=1, span_id=2)
+    return span
+
+
+def test_prompt_gate_blocks_before_provider_call():
+    """Test violating prompts never reach the provider."""
+    engine = PolicyEngine(policies=[
+        Policy(name="no_secrets",
+               backend="local",
+               phase="prompt",
+               rules={"deny_patterns": ["secret"]})
+    ])
+    context = SimpleNamespace(policy_engine=engine)
+    call = Mock(return_value="response")
+
+    assert run_with_prompt_gate(context, prompt_gate_span(), "hello",
+                                call) == "response"
+    with pytest.raises(ValueError):
+        run_with_prompt_gate(context, prompt_gate_span(), "a secret", call)
+    assert call.call_count == 1
+
+    # Prompt-phase policies are not evaluated again on the response
+    assert engine.evaluate_sync({"completion": "a secret"}).passed
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_async_prompt_gate_is_speculative(opa_server):
+    """Test the provider call overlaps the prompt check and is cancelled."""
+    engine = make_engine(opa_server, [
+        Policy(name="slow_check", path="policies/slow_check", phase="prompt")
+    ])
+    context = SimpleNamespace(policy_engine=engine)
+
+    async def provider_call():
+        await asyncio.sleep(0.5)
+        return "response"
+
+    start = time.monotonic()
+    assert await run_with_prompt_gate_async(context, prompt_gate_span(),
+                                            "hello",
+                                            provider_call) == "response"
+    assert time.monotonic() - start < 0.9
+
+    engine.policies["slow_check"].path = "policies/deny_slow"
+    cancelled = asyncio.Event()
+
+    async def long_call():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    span = prompt_gate_span()
+    with pytest.raises(ValueError):
+        await run_with_prompt_gate_async(context, span, "hello", long_call)
+    assert cancelled.is_set()
+    span.set_attribute.assert_called_with("policy.prompt.cancelled_call",
+                                          True)
+    await engine.aclose()
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_blocked_prompt_closes_returned_stream(opa_server):
+    """Test a stream returned before the prompt was blocked gets closed."""
+    engine = make_engine(opa_server, [
+        Policy(name="slow_check", path="policies/deny_slow", phase="prompt")
+    ])
+    context = SimpleNamespace(policy_engine=engine)
+    stream = Mock(aclose=AsyncMock())
+    on_blocked = Mock()
+
+    async def open_stream():
+        return stream
+
+    with pytest.raises(ValueError):
+        await run_with_prompt_gate_async(context, prompt_gate_span(),
+                                         "hello", open_stream, on_blocked)
+    stream.aclose.assert_awaited_once()
+    on_blocked.assert_called_once()
+    await engine.aclose()
+    engine.close()
+
+
+def test_circuit_breaker_states():
+    """Test the breaker opens on errors, probes when half-open and closes."""
+    breaker = CircuitBreaker(window_size=4, minimum_calls=4, open_seconds=0.1)
+
+    for success in (True, False, True, False):
+        assert breaker.allow_request()
+        breaker.record(success, 0.01)
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    time.sleep(0.15)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # one probe at a time
+    breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_opens_on_slow_calls():
+    """Test calls slower than the latency threshold open the breaker."""
+    breaker = CircuitBreaker(slow_call_seconds=0.5,
+                             window_size=2,
+                             minimum_calls=2)
+    breaker.record(True, 1.0)
+    breaker.record(True, 1.0)
+    assert breaker.state == "open"
+
+
+def test_open_circuit_skips_opa(opa_server):
+    """Test an unavailable OPA stops receiving requests once the circuit opens."""
+    opa_server.behaviours = ["unavailable"] * 10
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         max_retries=0,
+                         breaker_minimum_calls=2,
+                         breaker_window=2)
+
+    for _ in range(4):
+        assert not engine.evaluate_sync({}).passed
+    assert len(opa_server.requests) == 2
+    assert engine.circuit_breaker.state == "open"
+    assert engine.connection_stats()["circuit_rejected"] == 2
+    engine.close()
+
+
+def test_encode_failure_releases_half_open_probe(opa_server):
+    """Test a payload that cannot be encoded leaves the probe slot free."""
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         breaker_open_seconds=0)
+    engine.circuit_breaker._open()
+    unencodable = {}
+    unencodable["self"] = unencodable
+
+    assert not engine.evaluate_sync(unencodable).passed
+    assert engine.circuit_breaker.state == "half_open"
+    assert engine.evaluate_sync({}).passed
+    assert engine.circuit_breaker.state == "closed"
+    engine.close()
+
+
+def test_fail_open_policies(opa_server):
+    """Test fail-open policies allow requests while OPA is unavailable."""
+    opa_server.behaviours = ["unavailable"] * 2
+    engine = make_engine(opa_server, [
+        Policy(name="optional", path="policies/a", failure_mode="open"),
+        Policy(name="required", path="policies/b")
+    ],
+                         max_retries=0)
+
+    result = engine.evaluate_sync({})
+    assert [v.split(":")[0] for v in result.violations] == ["required"]
+    assert "HTTP 503" in result.metadata["optional"]["failed_open"]
+    engine.close()
+
+
+def test_project_input_handles_dotted_keys():
+    """Test projection keeps only declared fields, including dotted keys."""
+    eval_context = {
+        "prompt": "hi",
+        "completion": "hello",
+        "response": {
+            "choices": []
+        },
+        "trace_context": {
+            "trace_id": 1,
+            "attributes": {
+                "llm.model": "gpt-4",
+                "prompt.tokens": 3
+            }
+        }
+    }
+
+    assert project_input(
+        eval_context,
+        ["completion", "trace_context.attributes.llm.model", "missing"]) == {
+            "completion": "hello",
+            "trace_context": {
+                "attributes": {
+                    "llm.model": "gpt-4"
+                }
+            }
+        }
+
+
+def test_policies_receive_projected_input(opa_server):
+    """Test OPA only receives the input fields each policy declares."""
+    engine = make_engine(opa_server, [
+        Policy(name="pii", path="policies/pii", input_fields=["completion"]),
+        Policy(name="full", path="policies/full")
+    ])
+    eval_context = {"completion": "hello", "response": {"text": "hello"}}
+
+    assert engine.evaluate_sync(eval_context).passed
+    inputs = {path: body["input"] for path, body in opa_server.requests}
+    assert inputs["/v1/data/policies/pii"] == {"completion": "hello"}
+    assert inputs["/v1/data/policies/full"] == eval_context
+    assert engine.required_inputs() is None
+    engine.close()
+
+
+def test_bundle_input_is_union_of_fields(opa_server):
+    """Test bundled queries send the fields needed by any bundled policy."""
+    engine = make_engine(opa_server, [
+        Policy(name="a", path="policies/a", input_fields=["prompt"]),
+        Policy(name="b", path="policies/b", input_fields=["completion"])
+    ],
+                         bundle=True)
+
+    assert engine.evaluate_sync({
+        "prompt": "hi",
+        "completion": "hello",
+        "response": {}
+    }).passed
+    assert opa_server.requests[0][1]["input"] == {
+        "prompt": "hi",
+        "completion": "hello"
+    }
+    assert engine.required_inputs() == {"prompt", "completion"}
+    engine.close()
+
+
+def test_trace_ids_are_encoded(opa_server, monkeypatch):
+    """Test inputs of real spans use orjson and carry hex trace ids."""
+    pytest.importorskip("orjson")
+    from observicia.core import policy_engine as policy_engine_module
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")])
+    tracer = TracerProvider().get_tracer(__name__)
+    context = SimpleNamespace(policy_engine=engine)
+    # Fail if encoding falls back to json
+    monkeypatch.setattr(policy_engine_module, "json",
+                        Mock(dumps=Mock(side_effect=AssertionError)))
+
+    with tracer.start_as_current_span("llm.call") as span:
+        span_context = span.get_span_context()
+        enforce_policies(context, span, None, log_chat_messages=False)
+
+    sent = opa_server.requests[0][1]["input"]["trace_context"]
+    assert sent["trace_id"] == f"{span_context.trace_id:032x}"
+    assert sent["span_id"] == f"{span_context.span_id:016x}"
+    engine.close()
+
+
+@pytest.mark.asyncio
+async def test_gzip_request_bodies(opa_server):
+    """Test large request bodies are gzipped on both paths."""
+    engine = make_engine(opa_server,
+                         [Policy(name="allow_a", path="policies/a")],
+                         compress_requests=True,
+                         compress_min_bytes=100)
+    eval_context = {"completion": "word " * 1000}
+
+    assert engine.evaluate_sync(dict(eval_context)).passed
+    assert (await engine.evaluate_with_context(dict(eval_context))).passed
+    assert engine.evaluate_sync({"completion": "short"}).passed
+    assert opa_server.encodings == ["gzip", "gzip", None]
+    assert opa_server.requests[0][1]["input"] == eval_context
+    assert engine.connection_stats()["bytes_sent"] < 1000
+    await engine.aclose()
+    engine.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
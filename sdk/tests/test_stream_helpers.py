@@ -0,0 +1,293 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+from observicia.core.token_tracker import TokenTracker
+from observicia.utils import stream_helpers
+from observicia.utils.stream_helpers import (BoundedStreamBuffer,
+                                             IncrementalTokenCounter,
+                                             handle_async_stream,
+                                             handle_stream)
+
+
+class CharEncoding:
+    """Tokenizer stand-in that emits one token per character."""
+
+    def encode_ordinary(self, text):
+        return list(text)
+
+    def decode_single_token_bytes(self, token):
+        return token.encode('utf-8')
+
+
+class PairMergeEncoding(CharEncoding):
+    """
+    Tokenizer stand-in applying merges by priority, like BPE, so a token
+    can depend on text after it: "abc" is a|bc but "abcd" is ab|cd.
+    """
+
+    MERGES = [("c", "d"), ("b", "c"), ("a", "b")]
+
+    def encode_ordinary(self, text):
+        tokens = list(text)
+        for pair in self.MERGES:
+            merged, i = [], 0
+            while i < len(tokens):
+                if tuple(tokens[i:i + 2]) == pair:
+                    merged.append(tokens[i] + tokens[i + 1])
+                    i += 2
+                else:
+                    merged.append(tokens[i])
+                    i += 1
+            tokens = merged
+        return tokens
+
+
+def make_chat_chunk(content=None, usage=None):
+    """Helper to create OpenAI-style chat completion chunks"""
+    choices = [SimpleNamespace(delta=SimpleNamespace(
+        content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def test_counter_holds_back_split_words():
+    """Words split across chunks are counted once."""
+    counter = IncrementalTokenCounter("unknown-model")
+    for chunk in ["Hel", "lo wo", "rld, how", " are", " you"]:
+        counter.add(chunk)
+    assert counter.total() == 5
+
+
+def test_counter_commits_long_unbroken_text(monkeypatch):
+    """Text without word boundaries is committed on character boundaries."""
+    monkeypatch.setattr(stream_helpers, "get_encoder",
+                        lambda model: CharEncoding())
+    counter = IncrementalTokenCounter("gpt-4", max_pending_chars=8)
+    for _ in range(10):
+        counter.add("日本語")
+    assert len(counter._pending) < 12
+    assert counter.total() == 30
+
+
+def test_counter_recounts_tokens_across_forced_cuts(monkeypatch):
+    """A token formed across a forced cut replaces the tokens it spans."""
+    monkeypatch.setattr(stream_helpers, "get_encoder",
+                        lambda model: PairMergeEncoding())
+    counter = IncrementalTokenCounter("gpt-4", max_pending_chars=2)
+    counter.HOLDBACK_TOKENS = 1
+    # "a" is committed as a token before "d" turns a|bc into ab|cd
+    for chunk in "abcd" * 5:
+        counter.add(chunk)
+    assert counter.total() == len(PairMergeEncoding().encode_ordinary(
+        "abcd" * 5)) == 10
+
+
+def test_stream_prefers_provider_usage():
+    """Provider-reported usage replaces the local estimate."""
+    token_tracker = TokenTracker()
+    chunks = [
+        make_chat_chunk("Hello"),
+        make_chat_chunk(" world"),
+        make_chat_chunk(usage=SimpleNamespace(prompt_tokens=7,
+                                              completion_tokens=3))
+    ]
+    func = Mock(return_value=iter(chunks))
+
+    stream = handle_stream(func,
+                           None,
+                           Mock(),
+                           5,
+                           token_tracker,
+                           None,
+                           is_chat=True,
+                           model="gpt-4",
+                           stream_options={"include_usage": True})
+    assert list(stream) == chunks
+
+    totals = token_tracker.get_totals("openai")
+    assert totals.prompt_tokens == 7
+    assert totals.completion_tokens == 3
+
+
+def test_stream_counts_incrementally_without_usage():
+    """Without provider usage the incremental count is recorded."""
+    token_tracker = TokenTracker()
+    chunks = [make_chat_chunk("one tw"), make_chat_chunk("o three")]
+    func = Mock(return_value=iter(chunks))
+
+    list(
+        handle_stream(func,
+                      None,
+                      Mock(),
+                      5,
+                      token_tracker,
+                      None,
+                      is_chat=True,
+                      model="unknown-model"))
+
+    totals = token_tracker.get_totals("openai")
+    assert totals.prompt_tokens == 5
+    assert totals.completion_tokens == 3
+
+
+def test_bounded_buffer_keeps_window():
+    """Bounded buffer retains only the window and digests the rest."""
+    import hashlib
+    buffer = BoundedStreamBuffer(window_chars=8,
+                                 policy_chunk_chars=10,
+                                 log_chunk_chars=6)
+    text = ""
+    for chunk in ["abcd", "efgh", "ijkl"]:
+        buffer.add(chunk)
+        text += chunk
+
+    assert buffer.window == "efghijkl"
+    assert buffer.total_chars == 12
+    assert buffer.hexdigest() == hashlib.sha256(text.encode()).hexdigest()
+    assert buffer.policy_window_due()
+    assert buffer.take_policy_window() == "efghijkl"
+    assert not buffer.policy_window_due()
+    assert buffer.take_log_chunk() == "abcdefghijkl"
+    assert buffer.take_log_chunk(final=True) is None
+
+
+def test_bounded_buffer_clamps_policy_chunk_to_window():
+    """Policy windows never skip text when the chunk exceeds the window."""
+    buffer = BoundedStreamBuffer(window_chars=8, policy_chunk_chars=20)
+    evaluated = ""
+    for chunk in "abcdefghijklmnopqrstuvwx":
+        buffer.add(chunk)
+        if buffer.policy_window_due():
+            evaluated += buffer.take_policy_window()
+
+    assert evaluated == "abcdefghijklmnopqrstuvwx"
+
+
+def test_bounded_stream_evaluates_windows():
+    """Bounded streams evaluate policies on windows, not the full text."""
+    context = Mock()
+    context.streaming_config = {
+        "mode": "bounded",
+        "window_chars": 10,
+        "policy_chunk_chars": 10,
+        "log_chunk_chars": 0
+    }
+    context.policy_engine.evaluate_sync.return_value = Mock(passed=True,
+                                                            violations=[])
+    chunks = [make_chat_chunk("word " * 3) for _ in range(4)]
+    func = Mock(return_value=iter(chunks))
+
+    list(
+        handle_stream(func,
+                      None,
+                      Mock(),
+                      5,
+                      TokenTracker(),
+                      context,
+                      prompt="hi",
+                      is_chat=True,
+                      model="unknown-model"))
+
+    completions = [
+        call.kwargs["completion"]
+        for call in context.policy_engine.evaluate_sync.call_args_list
+    ]
+    assert len(completions) == 5  # one window per chunk plus the final check
+    assert all(len(completion) <= 10 for completion in completions)
+
+
+@pytest.mark.asyncio
+async def test_async_stream_uses_async_policy_evaluation():
+    """Async streams evaluate policies without blocking the event loop."""
+    context = Mock()
+    context.streaming_config = {"mode": "full"}
+    context.policy_engine.evaluate_with_context = AsyncMock(
+        return_value=Mock(passed=True, violations=[]))
+    chunks = [make_chat_chunk("Hello"), make_chat_chunk(" world")]
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    func = AsyncMock(return_value=stream())
+    generator = await handle_async_stream(func,
+                                          None,
+                                          Mock(),
+                                          5,
+                                          TokenTracker(),
+                                          context,
+                                          prompt="hi",
+                                          is_chat=True,
+                                          model="unknown-model")
+    assert [chunk async for chunk in generator] == chunks
+
+    context.policy_engine.evaluate_sync.assert_not_called()
+    call = context.policy_engine.evaluate_with_context.call_args
+    assert call.kwargs["completion"] == "Hello world"
+
+
+def test_ollama_chunk_usage():
+    """Ollama eval counts are read from the final chunk."""
+    chunk = {"message": {"content": ""}, "done": True, "eval_count": 4}
+    assert stream_helpers._extract_usage_from_chunk(chunk) == (0, 4)
+    assert stream_helpers._extract_content_from_chunk(
+        {"response": "hi"}) == "hi"
+
+
+
+def test_ollama_stream_usage_is_tracked_under_ollama():
+    """Streamed Ollama usage is attributed to the ollama provider."""
+    context = SimpleNamespace(streaming_config={"mode": "full"},
+                              policy_engine=None)
+    tracker = TokenTracker()
+    chunks = [{
+        "message": {
+            "content": "Hello"
+        },
+        "done": False
+    }, {
+        "message": {
+            "content": ""
+        },
+        "done": True,
+        "eval_count": 2
+    }]
+    func = Mock(return_value=iter(chunks))
+
+    list(
+        handle_stream(func,
+                      None,
+                      Mock(),
+                      3,
+                      tracker,
+                      context,
+                      prompt="hi",
+                      is_chat=True,
+                      provider="ollama",
+                      model="llama3"))
+
+    by_provider = tracker.get_usage_by(("provider", ))
+    assert list(by_provider) == [("ollama", )]
+    assert by_provider[("ollama", )]["completion_tokens"] == 2
+    assert "provider" not in func.call_args.kwargs
+
+
+
+@pytest.mark.asyncio
+async def test_closing_unstarted_async_stream_closes_provider_stream():
+    """Closing a stream that was never iterated closes the provider's."""
+    provider_stream = Mock(spec=["close"], close=AsyncMock())
+
+    stream = await handle_async_stream(AsyncMock(return_value=provider_stream),
+                                       None,
+                                       Mock(),
+                                       3,
+                                       TokenTracker(),
+                                       None,
+                                       is_chat=True)
+    await stream.aclose()
+    provider_stream.close.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
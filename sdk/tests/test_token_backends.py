@@ -0,0 +1,103 @@
+import multiprocessing
+import pytest
+import time
+from datetime import timedelta
+
+from observicia.core.token_backends import MmapUsageBackend, RedisUsageBackend
+from observicia.core.token_tracker import TokenTracker
+
+
+def _record_usage(path):
+    tracker = TokenTracker(backend=MmapUsageBackend(path))
+    for _ in range(50):
+        tracker.update("openai", 1, 2)
+    tracker.close()
+
+
+def test_mmap_backend_shared_between_processes(tmp_path):
+    """Test workers on one host share totals through the counter file."""
+    path = str(tmp_path / "usage")
+    MmapUsageBackend(path).close()
+
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_record_usage, args=(path, ))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    tracker = TokenTracker(backend=MmapUsageBackend(path))
+    totals = tracker.get_totals("openai")
+    assert totals.prompt_tokens == 200
+    assert totals.completion_tokens == 400
+    assert tracker.providers() == ["openai"]
+    tracker.close()
+
+
+def test_mmap_backend_windows(tmp_path):
+    """Test windows use the minute and hour rings."""
+    backend = MmapUsageBackend(str(tmp_path / "usage"))
+    now = time.time()
+    backend.add("ollama", 1, 0, now)
+    backend.add("ollama", 10, 0, now - 7200)
+    backend.add("ollama", 100, 0, now - 2 * 86400)
+
+    assert backend.sum("ollama", now, timedelta(minutes=5)) == (1, 0)
+    assert backend.sum("ollama", now, timedelta(hours=3)) == (11, 0)
+    assert backend.sum("ollama", now, timedelta(days=7)) == (111, 0)
+    assert backend.sum("unknown", now, timedelta(days=7)) == (0, 0)
+    backend.close()
+
+
+def test_mmap_backend_rejects_other_layout(tmp_path):
+    """Test files created with another retention period are not reused."""
+    path = str(tmp_path / "usage")
+    MmapUsageBackend(path).close()
+    with pytest.raises(ValueError):
+        MmapUsageBackend(path, retention_period=timedelta(days=1))
+
+
+def test_redis_backend_batches_updates():
+    """Test usage is batched locally and flushed with HINCRBY."""
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisUsageBackend(client=client,
+                                flush_interval=60,
+                                flush_threshold=3)
+    tracker = TokenTracker(backend=backend)
+
+    tracker.update("openai", 1, 2)
+    tracker.update("openai", 1, 2)
+    assert not client.keys("observicia:usage:openai:*")
+    assert tracker.get_totals("openai").total_tokens == 6  # pending batch
+
+    tracker.update("openai", 1, 2)
+    assert client.keys("observicia:usage:openai:*")
+
+    # Another worker sharing the Redis database sees the flushed usage
+    other = RedisUsageBackend(client=client, flush_interval=60)
+    assert other.sum("openai", time.time(), timedelta(hours=1)) == (3, 6)
+    assert other.providers() == ["openai"]
+
+    tracker.close()
+    other.close()
+
+
+def test_redis_backend_flushes_on_close():
+    """Test closing the backend flushes the remaining batch."""
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisUsageBackend(client=client, flush_interval=60)
+    backend.add("ollama", 5, 5, time.time())
+    backend.close()
+
+    reader = RedisUsageBackend(client=client, flush_interval=60)
+    assert reader.sum("ollama", time.time(), timedelta(days=2)) == (5, 5)
+    reader.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -1,7 +1,9 @@
 import pytest
 import threading
+import time
 from datetime import datetime, timedelta
-from observicia.core.token_tracker import TokenTracker, TokenUsage
+from observicia.core.token_tracker import (OVERFLOW_VALUE, SpaceSaving,
+                                          TokenTracker, TokenUsage)
 
 
 @pytest.fixture
@@ -95,20 +97,155 @@ def test_concurrent_updates(token_tracker):
     assert totals.completion_tokens == 2000  # 10 threads * 100 updates * 2 tokens
 
 
+def test_usage_all_providers_merges_shards(token_tracker):
+    """Test reading all providers merges shards without deadlocking."""
+
+    def update_tokens():
+        token_tracker.update("openai", 1, 2)
+        token_tracker.update("ollama", 3, 4)
+
+    threads = [threading.Thread(target=update_tokens) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    usage = token_tracker.get_usage_all_providers()
+    assert set(usage) == {"openai", "ollama"}
+    assert usage["openai"]["total_tokens"] == 60
+    assert usage["ollama"]["total_tokens"] == 140
+
+
 def test_retention_cleanup(token_tracker):
     """Test cleanup of old usage data."""
-    old_usage = TokenUsage(prompt_tokens=10, completion_tokens=20)
-    old_usage.timestamp = datetime.utcnow() - timedelta(days=2)
+    token_tracker._record("test", 10, 20,
+                          time.time() - timedelta(days=2).total_seconds())
 
-    with token_tracker._lock:
-        token_tracker._usage_by_provider["test"].append(old_usage)
-
-    token_tracker.update("test", 5, 10)  # This should trigger cleanup
+    token_tracker.update("test", 5, 10)
 
     totals = token_tracker.get_totals("test")
     assert totals.prompt_tokens == 5  # Only recent usage remains
     assert totals.completion_tokens == 10
 
 
+def test_windowed_usage(token_tracker):
+    """Test usage queries over time windows use the bucketed rollups."""
+    now = time.time()
+    token_tracker._record("openai", 1, 1, now - 30)
+    token_tracker._record("openai", 10, 10, now - 1800)
+    token_tracker._record("openai", 100, 100, now - 7200)
+
+    assert token_tracker.get_usage(
+        "openai", timedelta(minutes=1))["prompt_tokens"] == 1
+    assert token_tracker.get_usage(
+        "openai", timedelta(hours=1))["prompt_tokens"] == 11
+    assert token_tracker.get_usage(
+        "openai", timedelta(hours=3))["prompt_tokens"] == 111
+    assert token_tracker.get_usage("openai")["total_tokens"] == 222
+
+
+def test_usage_by_dimensions(token_tracker):
+    """Test usage is broken down by model, user and transaction."""
+    token_tracker.update("openai", 10, 5, model="gpt-4", user_id="alice")
+    token_tracker.update("openai", 1, 1, model="gpt-4o", user_id="alice")
+    token_tracker.update("openai",
+                         20,
+                         10,
+                         model="gpt-4",
+                         user_id="bob",
+                         transaction_id="tx-1")
+
+    by_model = token_tracker.get_usage_by(("model", ))
+    assert by_model[("gpt-4", )]["total_tokens"] == 45
+    assert by_model[("gpt-4", )]["requests"] == 2
+    assert by_model[("gpt-4o", )]["total_tokens"] == 2
+
+    alice = token_tracker.get_usage_by(("provider", "model"), user_id="alice")
+    assert set(alice) == {("openai", "gpt-4"), ("openai", "gpt-4o")}
+
+    by_transaction = token_tracker.get_usage_by(("transaction_id", ))
+    assert by_transaction[("tx-1", )]["prompt_tokens"] == 20
+
+    with pytest.raises(ValueError):
+        token_tracker.get_usage_by(("tenant", ))
+
+
+def test_series_cardinality_limit():
+    """Test new series collapse into the overflow series past the limit."""
+    tracker = TokenTracker(shards=1, max_series=2)
+    for i in range(5):
+        tracker.update("openai", 1, 0, model="gpt-4", user_id=f"user-{i}")
+
+    by_user = tracker.get_usage_by(("user_id", ))
+    assert len(by_user) == 3
+    assert by_user[(OVERFLOW_VALUE, )]["prompt_tokens"] == 3
+
+    # Heavy hitters still see the real users
+    assert len(tracker.top_k("user_id", n=10)) == 5
+
+
+def test_idle_series_make_room():
+    """Test idle series fold into overflow so new ones keep their values."""
+    tracker = TokenTracker(shards=1,
+                           max_series=2,
+                           series_idle_timeout=timedelta(minutes=5))
+    now = time.time()
+    for i in range(2):
+        tracker._record("openai", 1, 0, now - 600,
+                        ("openai", "gpt-4", "alice", None, f"tx-{i}"))
+    tracker.update("openai", 2, 0, model="gpt-4", user_id="bob",
+                   transaction_id="tx-2")
+    tracker.update("openai", 3, 0, model="gpt-4", user_id="carol",
+                   transaction_id="tx-3")
+
+    by_user = tracker.get_usage_by(("user_id", ))
+    assert by_user[("bob", )]["prompt_tokens"] == 2
+    assert by_user[("carol", )]["prompt_tokens"] == 3
+    assert by_user[(OVERFLOW_VALUE, )]["prompt_tokens"] == 2
+    assert tracker.get_usage_by(("model", ))[("gpt-4", )]["requests"] == 4
+
+
+def test_top_k_users():
+    """Test top users by tokens use bounded Space-Saving summaries."""
+    tracker = TokenTracker(top_k_capacity=8)
+    for i in range(100):
+        tracker.update("openai", 1, 0, user_id=f"light-{i}")
+    for rank, user in enumerate(["carol", "bob", "alice"]):
+        for _ in range(20):
+            tracker.update("openai", 10 * (rank + 1), 0, user_id=user)
+
+    top = tracker.top_k("user_id", n=3, window=timedelta(hours=1))
+    assert [user for user, _ in top] == ["alice", "bob", "carol"]
+    assert top[0][1] >= 600
+
+    with pytest.raises(ValueError):
+        tracker.top_k("transaction_id")
+
+
+def test_top_k_window():
+    """Test top-K queries only count buckets within the window."""
+    tracker = TokenTracker()
+    now = time.time()
+    tracker._record("openai", 100, 0, now - 1800,
+                    ("openai", None, "old", None, None))
+    tracker._record("openai", 1, 0, now, ("openai", None, "new", None, None))
+
+    assert tracker.top_k("user_id", window=timedelta(minutes=5)) == [("new",
+                                                                      1)]
+    assert tracker.top_k("user_id")[0] == ("old", 100)
+
+
+def test_space_saving_bounds_counters():
+    """Test Space-Saving keeps at most capacity counters."""
+    summary = SpaceSaving(capacity=2)
+    summary.add("a", 5)
+    summary.add("b", 1)
+    summary.add("c", 2)
+
+    assert len(summary.counts) == 2
+    assert summary.counts["a"] == 5
+    assert summary.counts["c"] == 3  # inherits the evicted count
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
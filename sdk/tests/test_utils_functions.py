@@ -1,5 +1,6 @@
 import pytest
 from datetime import datetime
+from unittest.mock import Mock
 import json
 from opentelemetry.trace import SpanKind
 from observicia.utils.helpers import (
@@ -12,7 +13,14 @@ from observicia.utils.helpers import (
     truncate_string,
     MetricsHelper,
 )
-from observicia.utils.token_helpers import count_prompt_tokens, count_text_tokens
+from observicia.utils.token_helpers import (
+    EncoderRegistry,
+    MessageTokenCache,
+    count_prompt_tokens,
+    count_text_tokens,
+    count_text_tokens_batch,
+)
+from observicia.utils import token_helpers
 from observicia.utils.serialization_helpers import (
     serialize_chat_completion,
     serialize_completion,
@@ -155,6 +163,112 @@ def test_token_counting():
     assert text_tokens > 0
 
 
+class TestEncoderRegistry:
+    """Test the tiktoken encoder cache."""
+
+    def test_negative_caching(self):
+        """Unknown models are resolved once and then served from cache."""
+        registry = EncoderRegistry()
+        assert registry.get("unknown-model") is None
+        assert registry.get("unknown-model") is None
+
+        stats = registry.stats()
+        assert stats["misses"] == 1
+        assert stats["negative_hits"] == 1
+        assert stats["size"] == 1
+
+    def test_alias_and_lru_eviction(self, monkeypatch):
+        """Aliases resolve to encodings and the cache stays bounded."""
+        import tiktoken
+        sentinel = object()
+        monkeypatch.setattr(tiktoken, "get_encoding", lambda name: sentinel)
+
+        registry = EncoderRegistry(max_size=2,
+                                   aliases={"llama3": "cl100k_base"})
+        assert registry.get("llama3:8b") is sentinel
+        assert registry.get("llama3:8b") is sentinel
+        assert registry.stats()["hits"] == 1
+
+        registry.get("unknown-a")
+        registry.get("unknown-b")
+        assert registry.stats()["size"] == 2
+        registry.get("llama3:8b")
+        assert registry.stats()["misses"] == 4
+
+
+class StubEncoding:
+    """Whitespace tokenizer standing in for a tiktoken encoding."""
+
+    def __init__(self):
+        self.batch_calls = 0
+
+    def encode(self, text):
+        # Like tiktoken, refuse special tokens unless they are allowed
+        if "<|endoftext|>" in text:
+            raise ValueError("Encountered text corresponding to special token")
+        return text.split()
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+    def encode_ordinary_batch(self, texts, num_threads=8):
+        self.batch_calls += 1
+        return [text.split() for text in texts]
+
+
+def test_batch_token_counting(monkeypatch):
+    """Large inputs switch to the batched encoder."""
+    encoding = StubEncoding()
+    monkeypatch.setattr(token_helpers, "get_encoder", lambda model: encoding)
+    monkeypatch.setitem(token_helpers._batch_settings, "threshold", 3)
+
+    assert count_text_tokens_batch(["a b", "c"], "gpt-4") == [2, 1]
+    assert encoding.batch_calls == 0
+
+    assert count_text_tokens_batch(["a b", "c", "d e f"],
+                                   "gpt-4") == [2, 1, 3]
+    assert encoding.batch_calls == 1
+
+    messages = [{"role": "user", "content": "one two"}] * 3
+    assert count_prompt_tokens(messages, "gpt-4") == 6 + 4 * 3 + 2
+    assert encoding.batch_calls == 2
+
+
+def test_single_and_batch_counts_agree(monkeypatch):
+    """Single texts use the same encoder call as batched ones."""
+    encoding = StubEncoding()
+    encoding.encode_ordinary = Mock(side_effect=list)
+    monkeypatch.setattr(token_helpers, "get_encoder", lambda model: encoding)
+    text = "see <|endoftext|>"
+
+    # Not the whitespace fallback used when `encode` refuses special tokens
+    assert count_text_tokens(text, "gpt-4") == count_text_tokens_batch(
+        [text], "gpt-4")[0] == len(text)
+
+
+def test_message_token_cache():
+    """Only messages new to a scope are encoded."""
+    encoding = StubEncoding()
+    encoding.encode_ordinary = Mock(side_effect=lambda text: text.split())
+    cache = MessageTokenCache(max_entries_per_scope=8)
+
+    history = [{"role": "user", "content": "hello there"}]
+    assert cache.count("session-1", encoding, history, "gpt-4") == 2
+
+    history = history + [{"role": "assistant", "content": "hi"}]
+    assert cache.count("session-1", encoding, history, "gpt-4") == 3
+    assert encoding.encode_ordinary.call_count == 2
+    assert cache.stats()["hits"] == 1
+
+    cache.evict("session-1")
+    assert cache.stats()["scopes"] == 0
+
+
+def test_batch_token_counting_fallback():
+    """Unknown models fall back to word counts."""
+    assert count_text_tokens_batch(["a b", "c"], "unknown-model") == [2, 1]
+
+
 def test_response_serialization():
     """Test response serialization functions."""
 
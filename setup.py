@@ -16,6 +16,7 @@ setup(name="observicia",
       install_requires=[
           "numpy>=1.26.0",
           "requests>=2.32.3",
+          "httpx>=0.27.0",
           "tiktoken>=0.7.0",
           "opentelemetry-api>=1.22.0",
           "opentelemetry-sdk>=1.22.0",
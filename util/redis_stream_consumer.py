@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Read Observicia telemetry from a Redis Stream through a consumer group."""
+import argparse
+import os
+import socket
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+StreamEntry = Tuple[str, Dict[str, str]]
+
+
+class TelemetryStreamConsumer:
+    """
+    Consumer-group reader for the stream written by `RedisSpanExporter` in
+    stream mode.
+
+    Every consumer group receives each record once; consumers in the same
+    group share the records between them. Records are acknowledged after
+    the handler returns, so records of a consumer that dies are still
+    pending and are claimed by another consumer once idle for
+    `claim_idle_ms`.
+    """
+
+    def __init__(self,
+                 client: redis.Redis,
+                 stream_key: str = "observicia:telemetry:stream",
+                 group: str = "observicia",
+                 consumer: Optional[str] = None,
+                 count: int = 100,
+                 block_ms: int = 5000,
+                 claim_idle_ms: int = 60000):
+        """
+        Initialize TelemetryStreamConsumer.
+
+        Args:
+            client: Redis client created with decode_responses=True
+            stream_key: Key of the telemetry stream
+            group: Consumer group name
+            consumer: Consumer name, unique within the group; defaults to
+                the host name and process id
+            count: Maximum records read per call
+            block_ms: How long a read waits for new records
+            claim_idle_ms: Idle time after which pending records of other
+                consumers are claimed
+        """
+        self.client = client
+        self.stream_key = stream_key
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+
+    def ensure_group(self, start_id: str = "$") -> None:
+        """Create the consumer group, and the stream, if missing."""
+        try:
+            self.client.xgroup_create(self.stream_key,
+                                      self.group,
+                                      id=start_id,
+                                      mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(self) -> List[StreamEntry]:
+        """Read new records, waiting up to `block_ms` for them."""
+        response = self.client.xreadgroup(self.group,
+                                          self.consumer,
+                                          {self.stream_key: ">"},
+                                          count=self.count,
+                                          block=self.block_ms)
+        return [entry for _, entries in response or [] for entry in entries]
+
+    def claim_stale(self) -> List[StreamEntry]:
+        """Take over records left pending by consumers that stopped."""
+        _, entries, *_ = self.client.xautoclaim(self.stream_key,
+                                                self.group,
+                                                self.consumer,
+                                                self.claim_idle_ms,
+                                                count=self.count)
+        # Entries deleted by stream trimming come back without fields
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def ack(self, entry_ids: List[str]) -> int:
+        """Acknowledge processed records."""
+        if not entry_ids:
+            return 0
+        return self.client.xack(self.stream_key, self.group, *entry_ids)
+
+    def poll(self, handler: Callable[[str, Dict[str, str]], None]) -> int:
+        """
+        Handle stale and new records once, acknowledging each after its
+        handler returns.
+
+        Returns:
+            The number of records handled
+        """
+        entries = self.claim_stale() + self.read()
+        for entry_id, fields in entries:
+            handler(entry_id, fields)
+            self.ack([entry_id])
+        return len(entries)
+
+    def run(self, handler: Callable[[str, Dict[str, str]], None]) -> None:
+        """Handle records until interrupted."""
+        self.ensure_group()
+        while True:
+            self.poll(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Follow Observicia telemetry from a Redis Stream')
+    parser.add_argument('--host', default='localhost', help='Redis host')
+    parser.add_argument('--port', type=int, default=6379, help='Redis port')
+    parser.add_argument('--db', type=int, default=0, help='Redis database')
+    parser.add_argument('--password', help='Redis password')
+    parser.add_argument('--stream',
+                        default='observicia:telemetry:stream',
+                        help='Stream key')
+    parser.add_argument('--group',
+                        default='observicia',
+                        help='Consumer group name')
+    parser.add_argument('--consumer',
+                        help='Consumer name within the group '
+                        '(default: <hostname>-<pid>)')
+
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host,
+                         port=args.port,
+                         db=args.db,
+                         password=args.password,
+                         decode_responses=True)
+    consumer = TelemetryStreamConsumer(client,
+                                       stream_key=args.stream,
+                                       group=args.group,
+                                       consumer=args.consumer)
+
+    # Running token totals per model
+    totals = defaultdict(int)
+
+    def print_record(entry_id, fields):
+        model = fields.get('model', 'unknown')
+        totals[model] += int(fields.get('total_tokens', 0))
+        print(f"{entry_id} user={fields.get('user_id', '')} model={model} "
+              f"tokens={fields.get('total_tokens', 0)} "
+              f"duration={float(fields.get('duration_ms', 0)):.2f}ms "
+              f"model_total={totals[model]:,}")
+
+    print(f"Following {args.stream} as {consumer.group}/{consumer.consumer}")
+    try:
+        consumer.run(print_record)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()